@@ -14,7 +14,13 @@ from .extensions import (  # noqa
     Blueprint,
     Schema,
     SQLCursorPage,
+    aggregate_cache,
     authentication,
+    compression,
+    rollups,
+    stats_summaries,
+    virtual_timeseries,
+    watermarks,
 )
 from .resources import register_blueprints
 
@@ -37,6 +43,12 @@ def create_app():
     )
     api.init_app(app)
     authentication.auth.init_app(app)
+    compression.compress.init_app(app)
+    watermarks.watermarks.init_app(app)
+    aggregate_cache.aggregate_cache.init_app(app)
+    rollups.rollups.init_app(app)
+    stats_summaries.stats_summaries.init_app(app)
+    virtual_timeseries.virtual_timeseries.init_app(app)
     register_blueprints(api)
 
     BEMServerCore()
@@ -0,0 +1,35 @@
+"""Commands
+
+This module provides commands made available as CLI commands.
+"""
+
+import click
+
+from bemserver_core import BEMServerCore
+from bemserver_core.database import db
+
+from bemserver_api.extensions import rollups, stats_summaries
+
+
+def setup_db():
+    """Create API tables
+
+    Create tables owned by the API, if they don't exist, and their triggers on
+    bemserver-core tables, in a database set up by bemserver-core.
+
+    This function assumes DB URI is set.
+    """
+    with db.engine.begin() as connection:
+        rollups.metadata.create_all(connection)
+        stats_summaries.metadata.create_all(connection)
+
+
+@click.command()
+def setup_db_cmd():
+    """Create tables owned by the API, if they don't exist, and their triggers.
+
+    This command must be run by a user allowed to create tables, after
+    bemserver-core database setup or upgrade.
+    """
+    BEMServerCore()
+    setup_db()
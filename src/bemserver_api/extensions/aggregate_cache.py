@@ -0,0 +1,236 @@
+"""Aggregate result cache
+
+Caches aggregate query results, keyed on query parameters.
+
+An entry is invalidated when a write touches one of its (timeseries, data
+state) couples on a time interval overlapping the entry interval. Writes are
+known from the write watermarks, which must be enabled.
+
+Entries also expire after a given time, which bounds the staleness of entries
+whose invalidation was missed: writes made out of the API, or by another API
+process with the "memory" backend.
+
+The "memory" backend is bounded in size, least recently used entries being
+evicted first. It is only invalidated by the writes of the current process, so
+it is meant for a single API process. The redis backend is shared by all API
+processes. Its memory should be bounded in redis configuration (maxmemory with
+an LRU eviction policy).
+"""
+
+import collections
+import hashlib
+import threading
+import time
+
+from .watermarks import check_redis_backend, watermarks
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def _overlaps(start, end, write_start, write_end):
+    """Check an entry interval (end excluded) overlaps a write interval"""
+    return write_start < end and write_end >= start
+
+
+class MemoryAggregateCacheStore:
+    """In-process LRU aggregate cache store"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # key -> (value, couples, expiration time)
+        self._entries = collections.OrderedDict()
+        # couple -> {key: (start, end)}
+        self._index = collections.defaultdict(dict)
+        self._size = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, couples, start, end):
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, couples, time.monotonic() + self.ttl)
+            self._size += len(value)
+            for couple in couples:
+                self._index[couple][key] = (start, end)
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        value, couples, _ = entry
+        self._size -= len(value)
+        for couple in couples:
+            keys = self._index[couple]
+            keys.pop(key, None)
+            if not keys:
+                del self._index[couple]
+
+    def invalidate(self, writes):
+        with self._lock:
+            for couple, (write_start, write_end) in writes.items():
+                for key, (start, end) in list(self._index.get(couple, {}).items()):
+                    if _overlaps(start, end, write_start, write_end):
+                        self._remove(key)
+
+
+class RedisAggregateCacheStore:
+    """Redis aggregate cache store, shared by all API processes
+
+    Each couple has an index hash mapping entry keys to their interval.
+    """
+
+    PREFIX = "bemserver_api:aggregate_cache:"
+
+    def __init__(self, url, ttl):
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def _entry_key(self, key):
+        return f"{self.PREFIX}entry:{key}"
+
+    def _index_key(self, couple):
+        return f"{self.PREFIX}index:{couple[0]}:{couple[1]}"
+
+    def get(self, key):
+        return self._client.get(self._entry_key(key))
+
+    def set(self, key, value, couples, start, end):
+        pipe = self._client.pipeline(transaction=False)
+        pipe.set(self._entry_key(key), value, ex=self.ttl)
+        for couple in couples:
+            index_key = self._index_key(couple)
+            pipe.hset(index_key, key, f"{start!r},{end!r}")
+            pipe.expire(index_key, self.ttl)
+        pipe.execute()
+
+    def delete(self, key):
+        self._client.delete(self._entry_key(key))
+
+    def invalidate(self, writes):
+        for couple, (write_start, write_end) in writes.items():
+            index_key = self._index_key(couple)
+            keys = [
+                key.decode()
+                for key, interval in self._client.hgetall(index_key).items()
+                if _overlaps(*map(float, interval.split(b",")), write_start, write_end)
+            ]
+            if keys:
+                pipe = self._client.pipeline(transaction=False)
+                pipe.delete(*(self._entry_key(key) for key in keys))
+                pipe.hdel(index_key, *keys)
+                pipe.execute()
+
+
+class AggregateCache:
+    """Aggregate result cache management"""
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND"]
+        if not backend:
+            self.store = None
+            return
+        if not watermarks.enabled:
+            raise RuntimeError("Aggregate cache requires write watermarks")
+        if backend == "memory":
+            if app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] == "memory" and not (
+                app.testing or app.debug
+            ):
+                raise RuntimeError(
+                    '"memory" aggregate cache and write watermarks only know the '
+                    "writes of the current process. Use redis backends, or set "
+                    "TESTING or DEBUG for a single process setup."
+                )
+            self.store = MemoryAggregateCacheStore(
+                app.config["TIMESERIES_DATA_AGGREGATE_CACHE_MAX_SIZE"],
+                app.config["TIMESERIES_DATA_AGGREGATE_CACHE_TTL"],
+            )
+        else:
+            check_redis_backend("TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND", backend)
+            self.store = RedisAggregateCacheStore(
+                backend, app.config["TIMESERIES_DATA_AGGREGATE_CACHE_TTL"]
+            )
+        if self.invalidate not in watermarks.write_callbacks:
+            watermarks.write_callbacks.append(self.invalidate)
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def invalidate(self, writes):
+        if self.enabled:
+            self.store.invalidate(writes)
+
+    @staticmethod
+    def _encode(result):
+        if isinstance(result, str):
+            return b"s" + result.encode("utf-8")
+        return b"b" + result
+
+    @staticmethod
+    def _decode(value):
+        if value[:1] == b"s":
+            return value[1:].decode("utf-8")
+        return value[1:]
+
+    def get_or_compute(self, key_parts, timeseries, data_state, start, end, compute):
+        """Get result from cache or compute and cache it
+
+        :param tuple key_parts: Query parameters identifying the result
+        :param list timeseries: Timeseries used to compute the result
+        :param TimeseriesDataState data_state: Data state
+        :param float start: Start of the data interval, as POSIX timestamp
+        :param float end: End of the data interval (excluded)
+        :param callable compute: Function computing the result (str or bytes)
+        """
+        key = hashlib.sha1(repr(key_parts).encode()).hexdigest()
+
+        watermarks.check_cleanup(timeseries, data_state)
+        if (value := self.store.get(key)) is not None:
+            return self._decode(value)
+
+        started = time.time()
+        result = compute()
+        couples = [(ts.id, data_state.id) for ts in timeseries]
+        self.store.set(key, self._encode(result), couples, start, end)
+        # Drop entry if a write was committed while computing, as it may have
+        # been invalidated before being stored
+        if any(
+            watermark is not None and watermark >= started
+            for watermark in watermarks.get_many(couples)
+        ):
+            self.store.delete(key)
+        return result
+
+
+aggregate_cache = AggregateCache()
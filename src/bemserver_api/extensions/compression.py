@@ -0,0 +1,141 @@
+"""Response compression
+
+Compresses responses according to Accept-Encoding request header.
+
+Streamed responses are compressed chunk by chunk. Compressed data is flushed
+every COMPRESS_STREAM_FLUSH_SIZE bytes of input, so that the client receives
+data as it is produced without flushing small chunks, which would hurt the
+compression ratio.
+"""
+
+import zlib
+
+import flask
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class GzipCompressor:
+    """gzip compressor"""
+
+    def __init__(self, level):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdCompressor:
+    """zstd compressor"""
+
+    def __init__(self, level):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+
+COMPRESSORS = {
+    "zstd": ZstdCompressor,
+    "gzip": GzipCompressor,
+}
+
+
+class Compress:
+    """Response compression management"""
+
+    def __init__(self, app=None):
+        self.app = None
+        self.algorithms = None
+        self.mimetypes = None
+        self.min_size = None
+        self.flush_size = None
+        self.levels = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.algorithms = [
+            algo
+            for algo in app.config["COMPRESS_ALGORITHMS"]
+            if algo != "zstd" or zstandard is not None
+        ]
+        self.mimetypes = set(app.config["COMPRESS_MIMETYPES"])
+        self.min_size = app.config["COMPRESS_MIN_SIZE"]
+        self.flush_size = app.config["COMPRESS_STREAM_FLUSH_SIZE"]
+        self.levels = {
+            "gzip": app.config["COMPRESS_GZIP_LEVEL"],
+            "zstd": app.config["COMPRESS_ZSTD_LEVEL"],
+        }
+        app.after_request(self.after_request)
+
+    def _make_compressor(self, algorithm):
+        return COMPRESSORS[algorithm](self.levels[algorithm])
+
+    @staticmethod
+    def _compress_stream(compressor, chunks, flush_size):
+        # Size of data passed to the compressor since last flush
+        pending = 0
+        for chunk in chunks:
+            if chunk:
+                data = compressor.compress(chunk)
+                pending += len(chunk)
+                if pending >= flush_size:
+                    data += compressor.flush()
+                    pending = 0
+                if data:
+                    yield data
+        yield compressor.finish()
+
+    def after_request(self, response):
+        if (
+            response.status_code != 200
+            or response.mimetype not in self.mimetypes
+            or "Content-Encoding" in response.headers
+            or response.direct_passthrough
+        ):
+            return response
+
+        response.vary.add("Accept-Encoding")
+
+        # Server preference order is used to break ties
+        algorithm = flask.request.accept_encodings.best_match(self.algorithms)
+        if algorithm is None:
+            return response
+
+        compressor = self._make_compressor(algorithm)
+        if response.is_streamed:
+            # Ensure the wrapped iterable is still closed at the end of the response
+            if hasattr(response.response, "close"):
+                response.call_on_close(response.response.close)
+            response.response = self._compress_stream(
+                compressor, response.iter_encoded(), self.flush_size
+            )
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compressor.compress(data) + compressor.finish())
+        response.headers["Content-Encoding"] = algorithm
+
+        return response
+
+
+compress = Compress()
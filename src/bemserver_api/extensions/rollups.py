@@ -0,0 +1,327 @@
+"""Timeseries data rollups
+
+Hourly and daily partial aggregates (count, sum, min, max) of timeseries data,
+for each (timeseries, data state) couple, stored in tables owned by the API.
+Those tables are created by the bemserver_api_setup_db command. If they don't
+exist, no rollups are built and aggregates are computed from data.
+
+The rollups of a couple are built from its data the first time they are used.
+
+Data may be written by the API, the cleanup or any other bemserver-core client,
+so writes are caught in the database. Triggers on ts_data log the time interval
+of the rows changed by each statement, for couples whose rollups are built.
+Rollups of those intervals are computed again before being used.
+
+A couple being built or refreshed is locked. A statement writing data of this
+couple waits for the lock, so that its changes are either included in the
+rollups or logged. Rollups are not used while data of a couple is being written
+by another transaction: aggregates are then computed from data.
+
+Rollup periods are in UTC. Buckets can be computed from a rollup if all their
+boundaries are aligned on the rollup period.
+"""
+
+import datetime as dt
+import weakref
+
+import sqlalchemy as sqla
+from sqlalchemy.dialects import postgresql
+
+import pandas as pd
+
+from bemserver_core.database import db
+from bemserver_core.model import TimeseriesByDataState
+from bemserver_core.time_utils import make_pandas_freq
+
+# Rollup periods, by order of preference, with their duration in seconds
+ROLLUP_PERIODS = {"day": 86400, "hour": 3600}
+
+# Bucket width units that may be computed from rollups
+ROLLUP_BUCKET_WIDTH_UNITS = ("hour", "day", "week", "month", "year")
+
+# Advisory lock key used to serialize updates of the rollups of a couple
+ROLLUPS_LOCK_KEY = 1869573228
+
+metadata = sqla.MetaData()
+
+ts_data_rollups = sqla.Table(
+    "api_ts_data_rollups",
+    metadata,
+    sqla.Column(
+        "ts_by_data_state_id",
+        sqla.ForeignKey(TimeseriesByDataState.__table__.c.id, ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqla.Column("period", sqla.String(8), primary_key=True),
+    sqla.Column("timestamp", sqla.DateTime(timezone=True), primary_key=True),
+    sqla.Column("value_count", sqla.Integer, nullable=False),
+    sqla.Column("value_sum", sqla.Float),
+    sqla.Column("value_min", sqla.Float),
+    sqla.Column("value_max", sqla.Float),
+)
+
+# Couples whose rollups are built
+ts_data_rollups_states = sqla.Table(
+    "api_ts_data_rollups_states",
+    metadata,
+    sqla.Column(
+        "ts_by_data_state_id",
+        sqla.ForeignKey(TimeseriesByDataState.__table__.c.id, ondelete="CASCADE"),
+        primary_key=True,
+    ),
+)
+
+# Time intervals (bounds included) of data changed since rollups were refreshed
+ts_data_rollups_changes = sqla.Table(
+    "api_ts_data_rollups_changes",
+    metadata,
+    sqla.Column(
+        "ts_by_data_state_id",
+        sqla.ForeignKey(TimeseriesByDataState.__table__.c.id, ondelete="CASCADE"),
+        nullable=False,
+        index=True,
+    ),
+    sqla.Column("start_dt", sqla.DateTime(timezone=True), nullable=False),
+    sqla.Column("end_dt", sqla.DateTime(timezone=True), nullable=False),
+)
+
+# Function logging changed rows of ts_data, called by triggers
+LOG_CHANGES_FUNCTION = "api_ts_data_rollups_log_changes"
+
+# Triggers calling LOG_CHANGES_FUNCTION: event and transition tables
+LOG_CHANGES_TRIGGERS = {
+    f"{LOG_CHANGES_FUNCTION}_insert": ("INSERT", "NEW TABLE AS changed_rows"),
+    f"{LOG_CHANGES_FUNCTION}_update": (
+        "UPDATE",
+        "OLD TABLE AS old_rows NEW TABLE AS changed_rows",
+    ),
+    f"{LOG_CHANGES_FUNCTION}_delete": ("DELETE", "OLD TABLE AS changed_rows"),
+}
+
+
+def _log_changes(rows):
+    """Make statements logging changes of a transition table
+
+    Couples are locked first, to wait for rollups being built or refreshed.
+    """
+    return (
+        f"PERFORM pg_advisory_xact_lock_shared({ROLLUPS_LOCK_KEY}, couples.id) "
+        f"FROM (SELECT DISTINCT ts_by_data_state_id AS id FROM {rows}) AS couples; "
+        "INSERT INTO api_ts_data_rollups_changes "
+        "SELECT ts_by_data_state_id, min(timestamp), max(timestamp) "
+        f"FROM {rows} "
+        "JOIN api_ts_data_rollups_states USING (ts_by_data_state_id) "
+        "JOIN ts_by_data_states ON ts_by_data_states.id = ts_by_data_state_id "
+        "GROUP BY ts_by_data_state_id; "
+    )
+
+
+# Triggers are (re)created along with rollup tables and dropped before them
+sqla.event.listen(
+    metadata,
+    "after_create",
+    sqla.DDL(
+        f"CREATE OR REPLACE FUNCTION {LOG_CHANGES_FUNCTION}() RETURNS TRIGGER AS "
+        "$func$ BEGIN "
+        f"{_log_changes('changed_rows')}"
+        f"IF TG_OP = 'UPDATE' THEN {_log_changes('old_rows')}END IF; "
+        "RETURN NULL; "
+        "END; $func$ LANGUAGE plpgsql;"
+    ),
+)
+for _trigger, (_event, _tables) in LOG_CHANGES_TRIGGERS.items():
+    sqla.event.listen(
+        metadata,
+        "after_create",
+        sqla.DDL(
+            f"DROP TRIGGER IF EXISTS {_trigger} ON ts_data; "
+            f"CREATE TRIGGER {_trigger} AFTER {_event} ON ts_data "
+            f"REFERENCING {_tables} FOR EACH STATEMENT "
+            f"EXECUTE FUNCTION {LOG_CHANGES_FUNCTION}();"
+        ),
+    )
+    sqla.event.listen(
+        metadata,
+        "before_drop",
+        sqla.DDL(f"DROP TRIGGER IF EXISTS {_trigger} ON ts_data;"),
+    )
+sqla.event.listen(
+    metadata,
+    "before_drop",
+    sqla.DDL(f"DROP FUNCTION IF EXISTS {LOG_CHANGES_FUNCTION};"),
+)
+
+MIN_DT = dt.datetime.min.replace(tzinfo=dt.timezone.utc)
+MAX_DT = dt.datetime.max.replace(tzinfo=dt.timezone.utc)
+
+DELETE_ROLLUPS = sqla.text(
+    "DELETE FROM api_ts_data_rollups "
+    "WHERE ts_by_data_state_id = :tsbds_id AND period = :period "
+    "  AND timestamp >= :start_dt AND timestamp < :end_dt;"
+)
+INSERT_HOUR_ROLLUPS = sqla.text(
+    "INSERT INTO api_ts_data_rollups "
+    "SELECT ts_by_data_state_id, 'hour', date_trunc('hour', timestamp, 'UTC'),"
+    "  count(value), sum(value), min(value), max(value) "
+    "FROM ts_data "
+    "WHERE ts_by_data_state_id = :tsbds_id "
+    "  AND timestamp >= :start_dt AND timestamp < :end_dt "
+    "GROUP BY 1, 3;"
+)
+INSERT_DAY_ROLLUPS = sqla.text(
+    "INSERT INTO api_ts_data_rollups "
+    "SELECT ts_by_data_state_id, 'day', date_trunc('day', timestamp, 'UTC'),"
+    "  sum(value_count), sum(value_sum), min(value_min), max(value_max) "
+    "FROM api_ts_data_rollups "
+    "WHERE ts_by_data_state_id = :tsbds_id AND period = 'hour' "
+    "  AND timestamp >= :start_dt AND timestamp < :end_dt "
+    "GROUP BY 1, 3;"
+)
+CONSUME_CHANGES = sqla.text(
+    "DELETE FROM api_ts_data_rollups_changes "
+    "WHERE ts_by_data_state_id = :tsbds_id "
+    "RETURNING start_dt, end_dt;"
+)
+
+
+class Rollups:
+    """Timeseries data rollups management"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        # Engines on which rollup tables are known to exist
+        self._engines = weakref.WeakSet()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config["TIMESERIES_DATA_ROLLUPS"]
+
+    def _has_tables(self, connection):
+        """Check rollup tables exist
+
+        :param connection: Connection or session connection
+        """
+        if db.engine not in self._engines:
+            if not sqla.inspect(connection).has_table(ts_data_rollups_states.name):
+                return False
+            self._engines.add(db.engine)
+        return True
+
+    @staticmethod
+    def _merge_changes(changes):
+        """Merge changed time intervals into intervals of whole days
+
+        :param list changes: List of (start, end) datetime tuples, bounds included
+
+        Days are the longest rollup period, so rollups of all periods can be
+        computed on the returned intervals.
+
+        Returns a sorted list of disjoint (start, end) datetime tuples, end excluded.
+        """
+        duration = max(ROLLUP_PERIODS.values())
+        ret = []
+        for start_dt, end_dt in sorted(changes):
+            start = start_dt.timestamp() // duration * duration
+            end = (end_dt.timestamp() // duration + 1) * duration
+            start_dt = dt.datetime.fromtimestamp(start, tz=dt.timezone.utc)
+            end_dt = dt.datetime.fromtimestamp(end, tz=dt.timezone.utc)
+            if ret and start_dt <= ret[-1][1]:
+                ret[-1] = (ret[-1][0], max(ret[-1][1], end_dt))
+            else:
+                ret.append((start_dt, end_dt))
+        return ret
+
+    @staticmethod
+    def _refresh(connection, tsbds_id, start_dt, end_dt):
+        """Compute rollups of a couple again on an interval of whole days
+
+        :param connection: Connection, in a transaction locking the couple
+        """
+        for period, insert_query in (
+            ("hour", INSERT_HOUR_ROLLUPS),
+            ("day", INSERT_DAY_ROLLUPS),
+        ):
+            params = {
+                "tsbds_id": tsbds_id,
+                "period": period,
+                "start_dt": start_dt,
+                "end_dt": end_dt,
+            }
+            connection.execute(DELETE_ROLLUPS, params)
+            connection.execute(insert_query, params)
+
+    def prepare(self, timeseries, data_state):
+        """Build rollups of timeseries and include changes logged since last use
+
+        Rollups are updated in their own transaction.
+
+        Returns False if rollup tables don't exist or if data of a timeseries is
+        being written by another transaction.
+        """
+        query = (
+            sqla.select(
+                TimeseriesByDataState.id,
+                ts_data_rollups_states.c.ts_by_data_state_id.is_not(None),
+            )
+            .outerjoin(
+                ts_data_rollups_states,
+                ts_data_rollups_states.c.ts_by_data_state_id
+                == TimeseriesByDataState.id,
+            )
+            .where(
+                TimeseriesByDataState.timeseries_id.in_([ts.id for ts in timeseries]),
+                TimeseriesByDataState.data_state_id == data_state.id,
+            )
+        )
+        with db.engine.begin() as connection:
+            if not self._has_tables(connection):
+                return False
+            for tsbds_id, built in connection.execute(query).all():
+                # Don't wait for writing transactions, data is read instead
+                if not connection.execute(
+                    sqla.text("SELECT pg_try_advisory_xact_lock(:key, :tsbds_id);"),
+                    {"key": ROLLUPS_LOCK_KEY, "tsbds_id": tsbds_id},
+                ).scalar():
+                    return False
+                if built:
+                    changes = connection.execute(
+                        CONSUME_CHANGES, {"tsbds_id": tsbds_id}
+                    ).all()
+                    for start_dt, end_dt in self._merge_changes(changes):
+                        self._refresh(connection, tsbds_id, start_dt, end_dt)
+                else:
+                    self._refresh(connection, tsbds_id, MIN_DT, MAX_DT)
+                    # Rollups may have been built since couples were listed
+                    connection.execute(
+                        postgresql.insert(ts_data_rollups_states)
+                        .values(ts_by_data_state_id=tsbds_id)
+                        .on_conflict_do_nothing()
+                    )
+        return True
+
+    @staticmethod
+    def get_period(start_dt, end_dt, bucket_width_unit):
+        """Get rollup period buckets can be computed from
+
+        :param datetime start_dt: Start of the first bucket, in target timezone
+        :param datetime end_dt: End of the last bucket, in target timezone
+        :param str bucket_width_unit: Bucket width unit
+
+        Returns None if no rollup can be used.
+        """
+        if bucket_width_unit not in ROLLUP_BUCKET_WIDTH_UNITS:
+            return None
+        edges = (
+            pd.date_range(
+                start_dt, end_dt, freq=make_pandas_freq(bucket_width_unit, 1)
+            ).asi8
+            // 10**9
+        )
+        for period, duration in ROLLUP_PERIODS.items():
+            if not (edges % duration).any():
+                return period
+        return None
+
+
+rollups = Rollups()
@@ -0,0 +1,235 @@
+"""Timeseries data stats summaries
+
+Stats of each (timeseries, data state) couple (first and last timestamps,
+count, sum, sum of squared deviations from the mean, min, max), stored in a
+table owned by the API. Stats are read from there without scanning the data
+table. That table is created by the bemserver_api_setup_db command. If it
+doesn't exist, no summaries are built and stats are computed from data.
+
+The summary of a couple is built from its data the first time it is used.
+
+Data may be written by the API, the cleanup or any other bemserver-core client,
+so writes are caught in the database. On insert, a trigger on ts_data merges
+the stats of the inserted rows into the summary, in the writing transaction.
+Stats can't be updated on update or deletion, so the summary is marked stale
+and built again next time it is used.
+
+A couple being built is locked. A statement writing data of this couple waits
+for the lock, so that its changes are either included in the summary or merged
+into it. Summaries are not built while data of a couple is being written by
+another transaction: stats are then computed from data.
+"""
+
+import weakref
+
+import sqlalchemy as sqla
+
+from bemserver_core.database import db
+from bemserver_core.model import TimeseriesByDataState
+
+# Advisory lock key used to serialize updates of the summary of a couple
+STATS_SUMMARIES_LOCK_KEY = 1937006963
+
+metadata = sqla.MetaData()
+
+ts_data_stats = sqla.Table(
+    "api_ts_data_stats",
+    metadata,
+    sqla.Column(
+        "ts_by_data_state_id",
+        sqla.ForeignKey(TimeseriesByDataState.__table__.c.id, ondelete="CASCADE"),
+        primary_key=True,
+    ),
+    sqla.Column("first_timestamp", sqla.DateTime(timezone=True)),
+    sqla.Column("last_timestamp", sqla.DateTime(timezone=True)),
+    sqla.Column("value_count", sqla.BigInteger, nullable=False),
+    sqla.Column("value_sum", sqla.Float),
+    # Sum of squared deviations from the mean
+    sqla.Column("value_m2", sqla.Float, nullable=False),
+    sqla.Column("value_min", sqla.Float),
+    sqla.Column("value_max", sqla.Float),
+    sqla.Column("stale", sqla.Boolean, nullable=False),
+)
+
+# Stats of data rows
+STATS_COLUMNS = (
+    "min(timestamp) AS first_timestamp, max(timestamp) AS last_timestamp,"
+    "  count(value) AS value_count, sum(value) AS value_sum,"
+    "  coalesce(var_pop(value) * count(value), 0) AS value_m2,"
+    "  min(value) AS value_min, max(value) AS value_max "
+)
+BUILD_STATS = sqla.text(
+    "INSERT INTO api_ts_data_stats "
+    f"SELECT :tsbds_id, {STATS_COLUMNS}, false "
+    "FROM ts_data "
+    "WHERE ts_by_data_state_id = :tsbds_id "
+    "ON CONFLICT (ts_by_data_state_id) DO UPDATE SET "
+    "  first_timestamp = excluded.first_timestamp,"
+    "  last_timestamp = excluded.last_timestamp,"
+    "  value_count = excluded.value_count,"
+    "  value_sum = excluded.value_sum,"
+    "  value_m2 = excluded.value_m2,"
+    "  value_min = excluded.value_min,"
+    "  value_max = excluded.value_max,"
+    "  stale = false;"
+)
+
+# Function updating summaries from changed rows of ts_data, called by triggers
+UPDATE_FUNCTION = "api_ts_data_stats_update"
+
+# Triggers calling UPDATE_FUNCTION: event and transition tables
+UPDATE_TRIGGERS = {
+    f"{UPDATE_FUNCTION}_insert": ("INSERT", "NEW TABLE AS changed_rows"),
+    f"{UPDATE_FUNCTION}_update": (
+        "UPDATE",
+        "OLD TABLE AS old_rows NEW TABLE AS changed_rows",
+    ),
+    f"{UPDATE_FUNCTION}_delete": ("DELETE", "OLD TABLE AS changed_rows"),
+}
+
+
+def _lock(rows):
+    """Make a statement waiting for summaries of changed rows being built"""
+    return (
+        f"PERFORM pg_advisory_xact_lock_shared({STATS_SUMMARIES_LOCK_KEY}, c.id) "
+        f"FROM (SELECT DISTINCT ts_by_data_state_id AS id FROM {rows}) AS c; "
+    )
+
+
+def _mark_stale(rows):
+    """Make a statement marking summaries of changed rows stale"""
+    return (
+        "UPDATE api_ts_data_stats SET stale = true "
+        f"WHERE ts_by_data_state_id IN (SELECT ts_by_data_state_id FROM {rows}) "
+        "  AND NOT stale; "
+    )
+
+
+# Merge sums of squared deviations with Chan et al. parallel algorithm
+MERGE_STATS = (
+    "UPDATE api_ts_data_stats AS t SET "
+    "  first_timestamp = least(t.first_timestamp, s.first_timestamp),"
+    "  last_timestamp = greatest(t.last_timestamp, s.last_timestamp),"
+    "  value_count = t.value_count + s.value_count,"
+    "  value_sum = CASE WHEN t.value_count = 0 THEN s.value_sum"
+    "    WHEN s.value_count = 0 THEN t.value_sum"
+    "    ELSE t.value_sum + s.value_sum END,"
+    "  value_m2 = CASE WHEN t.value_count = 0 THEN s.value_m2"
+    "    WHEN s.value_count = 0 THEN t.value_m2"
+    "    ELSE t.value_m2 + s.value_m2"
+    "      + (s.value_sum / s.value_count - t.value_sum / t.value_count) ^ 2"
+    "      * t.value_count * s.value_count / (t.value_count + s.value_count) END,"
+    "  value_min = least(t.value_min, s.value_min),"
+    "  value_max = greatest(t.value_max, s.value_max) "
+    f"FROM (SELECT ts_by_data_state_id, {STATS_COLUMNS}"
+    "  FROM changed_rows GROUP BY ts_by_data_state_id"
+    ") AS s "
+    "WHERE t.ts_by_data_state_id = s.ts_by_data_state_id AND NOT t.stale; "
+)
+
+# Triggers are (re)created along with stats table and dropped before it
+sqla.event.listen(
+    metadata,
+    "after_create",
+    sqla.DDL(
+        f"CREATE OR REPLACE FUNCTION {UPDATE_FUNCTION}() RETURNS TRIGGER AS "
+        "$func$ BEGIN "
+        f"{_lock('changed_rows')}"
+        "IF TG_OP = 'INSERT' THEN "
+        f"{MERGE_STATS}"
+        "ELSE "
+        f"{_mark_stale('changed_rows')}"
+        "END IF; "
+        f"IF TG_OP = 'UPDATE' THEN {_lock('old_rows')}{_mark_stale('old_rows')}"
+        "END IF; "
+        "RETURN NULL; "
+        "END; $func$ LANGUAGE plpgsql;"
+    ),
+)
+for _trigger, (_event, _tables) in UPDATE_TRIGGERS.items():
+    sqla.event.listen(
+        metadata,
+        "after_create",
+        sqla.DDL(
+            f"DROP TRIGGER IF EXISTS {_trigger} ON ts_data; "
+            f"CREATE TRIGGER {_trigger} AFTER {_event} ON ts_data "
+            f"REFERENCING {_tables} FOR EACH STATEMENT "
+            f"EXECUTE FUNCTION {UPDATE_FUNCTION}();"
+        ),
+    )
+    sqla.event.listen(
+        metadata,
+        "before_drop",
+        sqla.DDL(f"DROP TRIGGER IF EXISTS {_trigger} ON ts_data;"),
+    )
+sqla.event.listen(
+    metadata,
+    "before_drop",
+    sqla.DDL(f"DROP FUNCTION IF EXISTS {UPDATE_FUNCTION};"),
+)
+
+
+class StatsSummaries:
+    """Timeseries data stats summaries management"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        # Engines on which stats table is known to exist
+        self._engines = weakref.WeakSet()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config["TIMESERIES_DATA_STATS_SUMMARIES"]
+
+    def _has_tables(self, connection):
+        """Check stats table exists
+
+        :param connection: Connection or session connection
+        """
+        if db.engine not in self._engines:
+            if not sqla.inspect(connection).has_table(ts_data_stats.name):
+                return False
+            self._engines.add(db.engine)
+        return True
+
+    def prepare(self, timeseries, data_state):
+        """Build missing or stale summaries of timeseries
+
+        Summaries are built in their own transaction.
+
+        Returns False if stats table doesn't exist or if data of a timeseries
+        to build is being written by another transaction.
+        """
+        query = (
+            sqla.select(
+                TimeseriesByDataState.id,
+                ts_data_stats.c.ts_by_data_state_id.is_not(None),
+                ts_data_stats.c.stale,
+            )
+            .outerjoin(
+                ts_data_stats,
+                ts_data_stats.c.ts_by_data_state_id == TimeseriesByDataState.id,
+            )
+            .where(
+                TimeseriesByDataState.timeseries_id.in_([ts.id for ts in timeseries]),
+                TimeseriesByDataState.data_state_id == data_state.id,
+            )
+        )
+        with db.engine.begin() as connection:
+            if not self._has_tables(connection):
+                return False
+            for tsbds_id, built, stale in connection.execute(query).all():
+                if built and not stale:
+                    continue
+                # Don't wait for writing transactions, data is read instead
+                if not connection.execute(
+                    sqla.text("SELECT pg_try_advisory_xact_lock(:key, :tsbds_id);"),
+                    {"key": STATS_SUMMARIES_LOCK_KEY, "tsbds_id": tsbds_id},
+                ).scalar():
+                    return False
+                connection.execute(BUILD_STATS, {"tsbds_id": tsbds_id})
+        return True
+
+
+stats_summaries = StatsSummaries()
@@ -0,0 +1,95 @@
+"""Virtual timeseries
+
+A virtual timeseries is a timeseries with no data of its own, computed from
+other timeseries with a formula. The formula is stored as the value of a
+timeseries property whose name is set in configuration.
+
+Formulas may not use virtual timeseries.
+"""
+
+import sqlalchemy as sqla
+
+from bemserver_core.database import db
+from bemserver_core.exceptions import TimeseriesNotFoundError
+from bemserver_core.model import (
+    Timeseries,
+    TimeseriesProperty,
+    TimeseriesPropertyData,
+)
+
+from bemserver_api.process.formulas import Formula, FormulaError
+
+
+class VirtualTimeseries:
+    """Virtual timeseries management"""
+
+    def __init__(self, app=None):
+        self.property_name = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.property_name = app.config["TIMESERIES_DATA_FORMULA_PROPERTY"] or None
+
+    @property
+    def enabled(self):
+        return self.property_name is not None
+
+    def get_formulas(self, timeseries):
+        """Get formulas of virtual timeseries
+
+        :param list timeseries: List of timeseries
+
+        Returns a mapping of virtual timeseries IDs to formulas.
+        Raises FormulaError if a formula is invalid.
+        """
+        if not self.enabled:
+            return {}
+        return {
+            ts_id: Formula(value)
+            for ts_id, value in db.session.execute(
+                sqla.select(
+                    TimeseriesPropertyData.timeseries_id,
+                    TimeseriesPropertyData.value,
+                )
+                .join(
+                    TimeseriesProperty,
+                    TimeseriesProperty.id == TimeseriesPropertyData.property_id,
+                )
+                .where(
+                    TimeseriesProperty.name == self.property_name,
+                    TimeseriesPropertyData.timeseries_id.in_(
+                        [ts.id for ts in timeseries]
+                    ),
+                )
+            )
+        }
+
+    def get_sources(self, timeseries, formulas):
+        """Get timeseries whose data is needed to get timeseries data
+
+        :param list timeseries: List of timeseries
+        :param dict formulas: Formulas of virtual timeseries
+
+        Returns regular timeseries and timeseries used in formulas.
+        Raises FormulaError if a formula uses an unknown or virtual timeseries.
+        """
+        sources = {ts.id: ts for ts in timeseries if ts.id not in formulas}
+        input_ids = [
+            ts_id
+            for formula in formulas.values()
+            for ts_id in formula.timeseries_ids
+            if ts_id not in sources
+        ]
+        if input_ids:
+            try:
+                inputs = Timeseries.get_many_by_id(list(dict.fromkeys(input_ids)))
+            except TimeseriesNotFoundError as exc:
+                raise FormulaError(str(exc)) from exc
+            if self.get_formulas(inputs):
+                raise FormulaError("Formulas may not use virtual timeseries")
+            sources.update((ts.id, ts) for ts in inputs)
+        return list(sources.values())
+
+
+virtual_timeseries = VirtualTimeseries()
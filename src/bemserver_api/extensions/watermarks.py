@@ -0,0 +1,297 @@
+"""Timeseries data write watermarks
+
+Keeps track of the last write time of each (timeseries, data state) couple.
+Watermarks are used to answer conditional requests on timeseries data without
+querying the data table.
+
+Writes are recorded when the session is committed. Inserts are caught from the
+session, deletions must be declared with ``watermarks.touch``.
+
+Cleanup is run by the scheduled tasks workers, out of the API process. Its
+progress is read from the cleanup last timestamps: when it changed since last
+check, the watermark of the clean data is bumped.
+
+With the "memory" backend, only the writes made through the current process are
+known. A redis backend must be used when running several API processes.
+
+Writes made out of the API and of the cleanup (other scheduled tasks, direct
+ingestion in the database) are not known. Conditional requests would then be
+answered with 304 on modified data, so they are only enabled by a dedicated
+setting, for setups where all data is written through the API.
+"""
+
+import itertools
+import math
+import threading
+import time
+
+import sqlalchemy as sqla
+
+from bemserver_core.database import db
+from bemserver_core.model import TimeseriesByDataState, TimeseriesData
+from bemserver_core.scheduled_tasks.cleanup import ST_CleanupByTimeseries
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+REDIS_URL_SCHEMES = ("redis://", "rediss://", "unix://")
+
+
+def check_redis_backend(setting, url):
+    """Check a redis backend setting
+
+    :param str setting: Setting name, for error messages
+    :param str url: Redis URL
+
+    Raises RuntimeError if the URL is not a redis URL or redis is missing.
+    """
+    if not url.startswith(REDIS_URL_SCHEMES):
+        raise RuntimeError(
+            f'{setting} must be "memory", a redis URL or empty, got "{url}"'
+        )
+    if redis is None:
+        raise RuntimeError(
+            f'{setting}: redis backend requires redis (available as "redis" extra)'
+        )
+
+
+CLEAN_DATA_STATE_NAME = "Clean"
+
+# Session info keys
+TSBDS_WRITES_KEY = "bemserver_api_tsbds_writes"
+TS_DATA_WRITES_KEY = "bemserver_api_ts_data_writes"
+
+
+class MemoryWatermarkStore:
+    """In-process watermark store"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._watermarks = {}
+
+    def get_many(self, keys):
+        with self._lock:
+            return [self._watermarks.get(key) for key in keys]
+
+    def set_many(self, keys, value):
+        with self._lock:
+            for key in keys:
+                self._watermarks[key] = value
+
+    def setdefault_many(self, keys, value):
+        with self._lock:
+            return [self._watermarks.setdefault(key, value) for key in keys]
+
+
+class RedisWatermarkStore:
+    """Redis watermark store, shared by all API processes"""
+
+    HASH_NAME = "bemserver_api:timeseries_data_watermarks"
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        if not keys:
+            return []
+        return [
+            None if val is None else float(val)
+            for val in self._client.hmget(self.HASH_NAME, keys)
+        ]
+
+    def set_many(self, keys, value):
+        if keys:
+            self._client.hset(self.HASH_NAME, mapping={key: value for key in keys})
+
+    def setdefault_many(self, keys, value):
+        if not keys:
+            return []
+        pipe = self._client.pipeline()
+        for key in keys:
+            pipe.hsetnx(self.HASH_NAME, key, value)
+        pipe.hmget(self.HASH_NAME, keys)
+        return [float(val) for val in pipe.execute()[-1]]
+
+
+def _merge_write(writes, key, start, end):
+    """Add a write time interval to writes, merging with known interval"""
+    if key in writes:
+        start = min(start, writes[key][0])
+        end = max(end, writes[key][1])
+    writes[key] = (start, end)
+
+
+class Watermarks:
+    """Timeseries data write watermarks management
+
+    Writes are passed to the write callbacks as a mapping of (timeseries ID,
+    data state ID) couples to (start, end) time intervals, as POSIX timestamps,
+    end included.
+    """
+
+    def __init__(self, app=None):
+        self.store = None
+        self.conditional_requests = False
+        self.write_callbacks = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"]
+        if not backend:
+            self.store = None
+        elif backend == "memory":
+            self.store = MemoryWatermarkStore()
+        else:
+            check_redis_backend("TIMESERIES_DATA_WATERMARKS_BACKEND", backend)
+            self.store = RedisWatermarkStore(backend)
+        self.conditional_requests = app.config["TIMESERIES_DATA_CONDITIONAL_REQUESTS"]
+        if self.conditional_requests and not self.enabled:
+            raise RuntimeError("Conditional requests require write watermarks")
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    @staticmethod
+    def _key(timeseries_id, data_state_id):
+        return f"{timeseries_id}:{data_state_id}"
+
+    @staticmethod
+    def touch(timeseries, data_state, start_dt=None, end_dt=None):
+        """Declare a write on timeseries data, recorded on commit
+
+        Missing bounds mean the interval is unbounded.
+        """
+        writes = db.session.info.setdefault(TS_DATA_WRITES_KEY, {})
+        start = start_dt.timestamp() if start_dt is not None else -math.inf
+        end = end_dt.timestamp() if end_dt is not None else math.inf
+        for ts in timeseries:
+            _merge_write(writes, (ts.id, data_state.id), start, end)
+
+    def get_many(self, couples):
+        """Get watermarks of (timeseries ID, data state ID) couples
+
+        Unknown watermarks are None.
+        """
+        return self.store.get_many([self._key(*couple) for couple in couples])
+
+    def _record_writes(self, writes):
+        if self.enabled:
+            self.store.set_many(
+                [self._key(ts_id, ds_id) for ts_id, ds_id in writes], time.time()
+            )
+        for callback in self.write_callbacks:
+            callback(writes)
+
+    def check_cleanup(self, timeseries, data_state):
+        """Record cleanup writes if cleanup ran since last check
+
+        Cleanup writes clean data after the last timestamp of previous run, up
+        to its new last timestamp.
+        """
+        if data_state.name != CLEAN_DATA_STATE_NAME:
+            return
+        last_timestamps = {
+            ts_id: last_ts.timestamp()
+            for ts_id, last_ts in db.session.execute(
+                sqla.select(
+                    ST_CleanupByTimeseries.timeseries_id,
+                    ST_CleanupByTimeseries.last_timestamp,
+                ).where(
+                    ST_CleanupByTimeseries.timeseries_id.in_(
+                        [ts.id for ts in timeseries]
+                    ),
+                    ST_CleanupByTimeseries.last_timestamp.is_not(None),
+                )
+            )
+        }
+        keys = [f"cleanup:{ts_id}" for ts_id in last_timestamps]
+        writes = {}
+        for key, (ts_id, last_ts), checked in zip(
+            keys, last_timestamps.items(), self.store.get_many(keys)
+        ):
+            if checked != last_ts:
+                self.store.set_many([key], last_ts)
+                # Unknown previous cleanup states mean unknown write start
+                start = checked if checked is not None else -math.inf
+                _merge_write(writes, (ts_id, data_state.id), start, last_ts)
+        if writes:
+            self._record_writes(writes)
+
+    def get_last_modified(self, timeseries, data_state):
+        """Get last write time of timeseries data, as a POSIX timestamp
+
+        Couples with no known write are considered written now.
+        """
+        self.check_cleanup(timeseries, data_state)
+        return max(
+            self.store.setdefault_many(
+                [self._key(ts.id, data_state.id) for ts in timeseries], time.time()
+            ),
+            default=0.0,
+        )
+
+
+watermarks = Watermarks()
+
+
+@sqla.event.listens_for(db.session, "do_orm_execute")
+def _catch_data_inserts(orm_execute_state):
+    """Catch inserts in timeseries data table"""
+    if (
+        orm_execute_state.is_insert
+        and orm_execute_state.bind_mapper is TimeseriesData.__mapper__
+    ):
+        params = orm_execute_state.parameters
+        if isinstance(params, dict):
+            params = [params]
+        writes = orm_execute_state.session.info.setdefault(TSBDS_WRITES_KEY, {})
+        for row in params or []:
+            timestamp = row["timestamp"].timestamp()
+            _merge_write(
+                writes, row["timeseries_by_data_state_id"], timestamp, timestamp
+            )
+
+
+@sqla.event.listens_for(db.session, "before_flush")
+def _catch_data_flushes(session, flush_context, instances):
+    """Catch timeseries data objects added to or deleted from session"""
+    for obj in itertools.chain(session.new, session.deleted):
+        if isinstance(obj, TimeseriesData):
+            timestamp = obj.timestamp.timestamp()
+            _merge_write(
+                session.info.setdefault(TSBDS_WRITES_KEY, {}),
+                obj.timeseries_by_data_state_id,
+                timestamp,
+                timestamp,
+            )
+
+
+@sqla.event.listens_for(db.session, "before_commit")
+def _resolve_data_inserts(session):
+    """Get (timeseries, data state) couples from inserted rows"""
+    if tsbds_writes := session.info.pop(TSBDS_WRITES_KEY, None):
+        writes = session.info.setdefault(TS_DATA_WRITES_KEY, {})
+        for tsbds_id, ts_id, ds_id in session.execute(
+            sqla.select(
+                TimeseriesByDataState.id,
+                TimeseriesByDataState.timeseries_id,
+                TimeseriesByDataState.data_state_id,
+            ).where(TimeseriesByDataState.id.in_(tsbds_writes))
+        ):
+            _merge_write(writes, (ts_id, ds_id), *tsbds_writes[tsbds_id])
+
+
+@sqla.event.listens_for(db.session, "after_commit")
+def _record_data_writes(session):
+    if writes := session.info.pop(TS_DATA_WRITES_KEY, None):
+        watermarks._record_writes(writes)
+
+
+@sqla.event.listens_for(db.session, "after_soft_rollback")
+def _forget_data_writes(session, previous_transaction):
+    session.info.pop(TSBDS_WRITES_KEY, None)
+    session.info.pop(TS_DATA_WRITES_KEY, None)
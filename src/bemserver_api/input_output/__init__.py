@@ -0,0 +1,30 @@
+"""I/O"""
+
+from .timeseries_data_analysis_io import (  # noqa
+    tsdasofio,
+    tsdgapsio,
+    tsdvaluefilterio,
+)
+from .timeseries_data_buckets_io import (  # noqa
+    AGGREGATION_FUNCTIONS,
+    PERCENTILE_AGGREGATION_RE,
+    REDUCE_FUNCTIONS,
+    SAMPLE_AGGREGATIONS,
+    tsdbucketsio,
+    tsdformulaio,
+)
+from .timeseries_data_stats_io import (  # noqa
+    PROFILE_AGGREGATIONS,
+    PROFILE_PERIODS,
+    tsdhistogramio,
+    tsdlatestio,
+    tsdprofileio,
+    tsdstatsio,
+)
+from .timeseries_data_stream_io import (  # noqa
+    ARROW_STREAM_MIME_TYPE,
+    tsdarrowio,
+    tsdcompactjsonio,
+    tsdfio,
+    tsdstreamio,
+)
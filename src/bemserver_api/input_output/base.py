@@ -0,0 +1,78 @@
+"""Base I/O classes"""
+
+from bemserver_core.authorization import auth, get_current_user
+
+# Last sample before the interval and first sample after it: condition and order
+SAMPLE_BOUNDS = {
+    "prev": ("timestamp < :start_dt", "timestamp DESC"),
+    "next": ("timestamp >= :end_dt", "timestamp"),
+}
+
+
+class BaseTimeseriesDataIO:
+    """Base class for timeseries data IO classes
+
+    Queries made by the helpers below select data of timeseries in
+    :timeseries_ids for data state :data_state_id.
+    """
+
+    @staticmethod
+    def _check_read_permissions(timeseries):
+        """Check current user can read data of all timeseries"""
+        for ts in timeseries:
+            auth.authorize(get_current_user(), "read_data", ts)
+
+    @staticmethod
+    def _data_query(
+        columns, *, from_clause="ts_data", labels=True, interval=True, skip_nan=False
+    ):
+        """Make a query selecting data rows of timeseries in a data state
+
+        :param str columns: Selected columns
+        :param str from_clause: Table holding data rows by ts_by_data_state_id,
+            aliased as ts_data, possibly followed by other tables to join
+        :param bool labels: Whether to join timeseries table, to select labels
+        :param bool interval: Whether to only select rows in
+            [:start_dt, :end_dt)
+        :param bool skip_nan: Whether to ignore NaN values
+
+        Returns a query string to which conditions may be appended.
+        """
+        query = (
+            f"SELECT {columns} "
+            f"FROM {from_clause}, {'timeseries, ' if labels else ''}ts_by_data_states "
+            "WHERE ts_data.ts_by_data_state_id = ts_by_data_states.id "
+            "  AND ts_by_data_states.data_state_id = :data_state_id "
+        )
+        if labels:
+            query += "  AND ts_by_data_states.timeseries_id = timeseries.id "
+        query += "  AND timeseries_id = ANY(:timeseries_ids) "
+        if interval:
+            query += "  AND timestamp >= :start_dt AND timestamp < :end_dt "
+        if skip_nan:
+            query += "  AND value != 'NaN' "
+        return query
+
+    @staticmethod
+    def _sample_query(bound):
+        """Make a query selecting a sample next to the interval
+
+        :param str bound: "prev" to select the last non-NaN sample before
+            :start_dt, "next" to select the first one from :end_dt
+
+        Samples are found by an index scan for each timeseries. Selected columns
+        are timeseries_id, timestamp and value.
+        """
+        condition, order = SAMPLE_BOUNDS[bound]
+        return (
+            f"SELECT ts_by_data_states.timeseries_id, {bound}.timestamp, "
+            f"{bound}.value "
+            "FROM ts_by_data_states CROSS JOIN LATERAL ("
+            "  SELECT timestamp, value FROM ts_data "
+            "  WHERE ts_data.ts_by_data_state_id = ts_by_data_states.id "
+            f"    AND {condition} AND value != 'NaN' "
+            f"  ORDER BY {order} LIMIT 1"
+            f") AS {bound} "
+            "WHERE ts_by_data_states.data_state_id = :data_state_id "
+            "  AND timeseries_id = ANY(:timeseries_ids) "
+        )
@@ -0,0 +1,417 @@
+"""Timeseries data analysis I/O"""
+
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sqla
+
+import numpy as np
+import pandas as pd
+
+from bemserver_core.common import ureg
+from bemserver_core.database import db
+from bemserver_core.model import Timeseries
+
+from .base import BaseTimeseriesDataIO
+
+
+def _make_data_df(data, timeseries, labels, *, convert_to=None, timezone="UTC"):
+    """Make a timeseries dataframe from (timestamp, label, value) rows
+
+    The dataframe has the same layout as the one returned by
+    ``TimeseriesDataIO.get_timeseries_data``.
+    """
+    data_df = pd.DataFrame(data, columns=("timestamp", "label", "value")).set_index(
+        "timestamp"
+    )
+    data_df.index = pd.DatetimeIndex(data_df.index, tz="UTC").tz_convert(
+        ZoneInfo(timezone)
+    )
+    data_df = (
+        data_df.pivot(columns="label", values="value")
+        .reindex(columns=labels)
+        .astype(float)
+        .sort_index()
+    )
+    data_df.index.name = "Datetime"
+    data_df.columns.name = None
+
+    if convert_to:
+        ureg.convert_df(
+            data_df,
+            {label: ts.unit_symbol for ts, label in zip(timeseries, labels)},
+            convert_to,
+        )
+
+    return data_df
+
+
+class TimeseriesDataAsOfIO(BaseTimeseriesDataIO):
+    """Get timeseries data along with the samples around a time interval
+
+    Samples surrounding the interval are needed to compute values at the
+    interval bounds (e.g. previous value). They are found by a backward (or
+    forward) index scan for each timeseries, whatever their age.
+    """
+
+    @classmethod
+    def get_timeseries_data(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data with last sample before and next sample after
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for parameters.
+
+        For each timeseries, the last non-NaN sample before start_dt and the
+        first non-NaN sample at or after end_dt are returned along with the
+        samples in the interval, all in a single query.
+
+        Returns a dataframe.
+        """
+        cls._check_read_permissions(timeseries)
+
+        labels = [getattr(ts, col_label) for ts in timeseries]
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+        }
+        query = (
+            f"SELECT samples.timestamp, timeseries.{col_label}, samples.value "
+            "FROM timeseries, ("
+            + cls._data_query(
+                "ts_by_data_states.timeseries_id, timestamp, value", labels=False
+            )
+            + "UNION ALL "
+            + cls._sample_query("prev")
+            + "UNION ALL "
+            + cls._sample_query("next")
+            + ") AS samples "
+            "WHERE timeseries.id = samples.timeseries_id;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        return _make_data_df(
+            data, timeseries, labels, convert_to=convert_to, timezone=timezone
+        )
+
+
+class TimeseriesDataValueFilterIO(BaseTimeseriesDataIO):
+    """Get timeseries data matching a value range
+
+    The value range is evaluated in the database, so that only matching rows
+    or intervals are returned.
+
+    Value bounds are included. NaN values never match.
+    """
+
+    @classmethod
+    def get_timeseries_data(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        min_value=None,
+        max_value=None,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data matching a value range
+
+        :param float min_value: Minimum value, after unit conversion
+        :param float max_value: Maximum value, after unit conversion
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Bounds are converted to the unit of each timeseries so that the range
+        is evaluated on stored values.
+
+        Returns a dataframe.
+        """
+        cls._check_read_permissions(timeseries)
+
+        convert_to = convert_to or {}
+        labels = [getattr(ts, col_label) for ts in timeseries]
+        bounds = []
+        for ts, label in zip(timeseries, labels):
+            lower = -np.inf if min_value is None else min_value
+            upper = np.inf if max_value is None else max_value
+            if (unit := convert_to.get(label)) is not None:
+                lower, upper = sorted(
+                    ureg.convert(np.array([lower, upper]), unit, ts.unit_symbol)
+                )
+            bounds.append((float(lower), float(upper)))
+
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "min_values": [lower for lower, _ in bounds],
+            "max_values": [upper for _, upper in bounds],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+        }
+        query = (
+            cls._data_query(
+                f"timestamp, timeseries.{col_label}, value",
+                from_clause=(
+                    "ts_data, "
+                    "unnest(CAST(:timeseries_ids AS integer[]),"
+                    "  CAST(:min_values AS float8[]), CAST(:max_values AS float8[]))"
+                    "  AS bounds(id, min_value, max_value)"
+                ),
+                skip_nan=True,
+            )
+            + "  AND timeseries.id = bounds.id "
+            "  AND value >= bounds.min_value AND value <= bounds.max_value;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        return _make_data_df(
+            data, timeseries, labels, convert_to=convert_to, timezone=timezone
+        )
+
+    @classmethod
+    def get_timeseries_intervals(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        min_value=None,
+        max_value=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Get time intervals during which timeseries values match a value range
+
+        :param datetime start_dt: Time interval lower bound (tz-aware)
+        :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param float min_value: Minimum value
+        :param float max_value: Maximum value
+        :param str timezone: IANA timezone to use for interval bounds
+        :param string col_label: Timeseries attribute to use for labels.
+            Should be "id" or "name". Default: "id".
+
+        Each value is valid until the next sample. The last sample before the
+        interval gives the state at the beginning of the interval. The last
+        value is valid until the end of the interval, but not in the future.
+
+        Consecutive matching samples are merged into intervals with window
+        functions (gaps and islands), so only intervals are returned.
+
+        Returns a mapping of timeseries labels to sorted lists of
+        (start, end) datetime tuples.
+        """
+        cls._check_read_permissions(timeseries)
+
+        # Last value is valid until the end of the interval, but not in the future
+        stop_dt = max(min(end_dt, dt.datetime.now(tz=dt.timezone.utc)), start_dt)
+
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+            "stop_dt": stop_dt,
+            "min_value": -np.inf if min_value is None else min_value,
+            "max_value": np.inf if max_value is None else max_value,
+        }
+        matching = "value >= :min_value AND value <= :max_value"
+        query = (
+            "WITH samples AS ("
+            + cls._data_query(
+                "ts_by_data_states.timeseries_id, timestamp, value",
+                labels=False,
+                skip_nan=True,
+            )
+            + "UNION ALL "
+            + cls._sample_query("prev")
+            + "), changes AS ("
+            "  SELECT timeseries_id, timestamp,"
+            "    lead(timestamp) OVER w AS next_timestamp,"
+            f"    {matching} AS matching,"
+            f"    lag({matching}) OVER w AS prev_matching "
+            "  FROM samples "
+            "  WINDOW w AS (PARTITION BY timeseries_id ORDER BY timestamp)"
+            "), islands AS ("
+            "  SELECT timeseries_id, timestamp, next_timestamp, matching,"
+            "    count(*) FILTER (WHERE matching IS DISTINCT FROM prev_matching)"
+            "      OVER (PARTITION BY timeseries_id ORDER BY timestamp) AS island "
+            "  FROM changes"
+            ") "
+            "SELECT timeseries_id, start_dt, end_dt FROM ("
+            "  SELECT timeseries_id,"
+            "    greatest(min(timestamp), :start_dt) AS start_dt,"
+            "    least(max(coalesce(next_timestamp, :stop_dt)), :stop_dt) AS end_dt "
+            "  FROM islands WHERE matching "
+            "  GROUP BY timeseries_id, island"
+            ") AS intervals "
+            "WHERE end_dt > start_dt "
+            "ORDER BY timeseries_id, start_dt;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        tz = ZoneInfo(timezone)
+        labels = {ts.id: getattr(ts, col_label) for ts in timeseries}
+        ret = {label: [] for label in labels.values()}
+        for ts_id, interval_start_dt, interval_end_dt in data:
+            ret[labels[ts_id]].append(
+                (interval_start_dt.astimezone(tz), interval_end_dt.astimezone(tz))
+            )
+        return ret
+
+
+class TimeseriesDataGapsIO(BaseTimeseriesDataIO):
+    """Get gaps in timeseries data
+
+    A gap is a time interval longer than the expected sample interval without
+    any value. Gaps are computed in the database, so that only gaps are
+    returned, whatever the amount of data.
+    """
+
+    @classmethod
+    def get_timeseries_gaps(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        min_duration=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Get gaps in timeseries data
+
+        :param datetime start_dt: Time interval lower bound (tz-aware)
+        :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param float min_duration: Minimum gap duration (seconds)
+        :param str timezone: IANA timezone to use for gap bounds
+        :param string col_label: Timeseries attribute to use for labels.
+            Should be "id" or "name". Default: "id".
+
+        The expected interval of a timeseries is read from the "Interval"
+        property. If undefined, it is inferred as the median interval between
+        samples. A gap is an interval between consecutive samples longer than
+        the expected interval and than min_duration. If the interval is
+        undefined and can't be inferred (less than two samples), any interval
+        between samples longer than min_duration is a gap.
+
+        Interval bounds are considered as samples, so that missing data at the
+        beginning or at the end of the interval is reported, but not in the
+        future. If there is no data, the whole interval is a gap if it is longer
+        than min_duration.
+
+        Returns a mapping of timeseries labels to dicts with
+        - "interval": expected interval (seconds) or None if it can't be
+          inferred
+        - "undefined_interval": whether the interval property is undefined
+        - "gaps": sorted list of (start, end) datetime tuples
+        """
+        cls._check_read_permissions(timeseries)
+
+        timeseries_ids = [ts.id for ts in timeseries]
+        ts_intervals = Timeseries.get_property_for_many_timeseries(
+            timeseries_ids, "Interval"
+        )
+        intervals = [
+            None if ts_intervals[ts_id] is None else float(ts_intervals[ts_id])
+            for ts_id in timeseries_ids
+        ]
+
+        # Missing data is not reported in the future
+        stop_dt = max(min(end_dt, dt.datetime.now(tz=dt.timezone.utc)), start_dt)
+
+        params = {
+            "timeseries_ids": timeseries_ids,
+            "intervals": intervals,
+            "min_duration": min_duration or 0,
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+            "stop_dt": stop_dt,
+        }
+        query = (
+            "WITH samples AS ("
+            + cls._data_query(
+                "ts_by_data_states.timeseries_id, timestamp", labels=False
+            )
+            + "), expected AS ("
+            "  SELECT timeseries_id, coalesce(defined.interval, ("
+            "    SELECT percentile_cont(0.5) WITHIN GROUP (ORDER BY delta) FROM ("
+            "      SELECT extract(epoch FROM timestamp - lag(timestamp) OVER ("
+            "        ORDER BY timestamp)) AS delta "
+            "      FROM samples WHERE samples.timeseries_id = defined.timeseries_id"
+            "    ) AS deltas"
+            "  )) AS interval,"
+            "  EXISTS ("
+            "    SELECT FROM samples"
+            "    WHERE samples.timeseries_id = defined.timeseries_id"
+            "  ) AS has_data "
+            "  FROM unnest("
+            "    CAST(:timeseries_ids AS integer[]), CAST(:intervals AS float8[])"
+            "  ) AS defined(timeseries_id, interval)"
+            "), bounded AS ("
+            "  SELECT timeseries_id, timestamp FROM samples "
+            "  UNION ALL SELECT timeseries_id, :start_dt FROM expected "
+            "  UNION ALL SELECT timeseries_id, :stop_dt FROM expected"
+            "), gaps AS ("
+            "  SELECT timeseries_id, timestamp,"
+            "    lag(timestamp) OVER ("
+            "      PARTITION BY timeseries_id ORDER BY timestamp"
+            "    ) AS prev_timestamp "
+            "  FROM bounded"
+            ") "
+            "SELECT expected.timeseries_id, expected.interval,"
+            "  gaps.prev_timestamp, gaps.timestamp "
+            "FROM expected LEFT JOIN gaps "
+            "  ON gaps.timeseries_id = expected.timeseries_id "
+            "  AND extract(epoch FROM gaps.timestamp - gaps.prev_timestamp) > "
+            "    greatest("
+            "      CASE WHEN expected.has_data THEN expected.interval END,"
+            "      CAST(:min_duration AS float8)"
+            "    ) "
+            "ORDER BY expected.timeseries_id, gaps.prev_timestamp;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        tz = ZoneInfo(timezone)
+        labels = {ts.id: getattr(ts, col_label) for ts in timeseries}
+        ret = {
+            label: {
+                "interval": None,
+                "undefined_interval": interval is None,
+                "gaps": [],
+            }
+            for label, interval in zip(labels.values(), intervals)
+        }
+        for ts_id, interval, gap_start_dt, gap_end_dt in data:
+            ts_ret = ret[labels[ts_id]]
+            ts_ret["interval"] = interval
+            if gap_start_dt is not None:
+                ts_ret["gaps"].append(
+                    (gap_start_dt.astimezone(tz), gap_end_dt.astimezone(tz))
+                )
+        return ret
+
+
+tsdasofio = TimeseriesDataAsOfIO()
+tsdvaluefilterio = TimeseriesDataValueFilterIO()
+tsdgapsio = TimeseriesDataGapsIO()
@@ -0,0 +1,666 @@
+"""Timeseries data buckets I/O"""
+
+import datetime as dt
+import re
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sqla
+
+import numpy as np
+import pandas as pd
+
+from bemserver_core.common import ureg
+from bemserver_core.database import db
+from bemserver_core.input_output import tsdio
+from bemserver_core.time_utils import ceil, floor, make_pandas_freq
+
+from bemserver_api.extensions.rollups import rollups
+from bemserver_api.extensions.virtual_timeseries import virtual_timeseries
+
+from .base import BaseTimeseriesDataIO
+
+# Partial aggregates computed in SQL for each date_trunc bucket and function to
+# use to re-aggregate them in pandas for N x unit buckets
+PARTIAL_AGGREGATES = {
+    "count": ("count(value)", "sum"),
+    "sum": ("sum(value)", "sum"),
+    "min": ("min(value)", "min"),
+    "max": ("max(value)", "max"),
+}
+
+# Partial aggregates computed in SQL from rollups
+ROLLUP_PARTIAL_AGGREGATES = {
+    "count": "sum(value_count)",
+    "sum": "sum(value_sum)",
+    "min": "min(value_min)",
+    "max": "max(value_max)",
+}
+
+# Aggregation functions computed from partial aggregates: partial aggregates
+# needed and function computing the aggregation from partial aggregates
+BUCKET_AGGREGATIONS = {
+    "avg": (("sum", "count"), lambda p: p["sum"] / p["count"]),
+    "sum": (("sum",), lambda p: p["sum"]),
+    "min": (("min",), lambda p: p["min"]),
+    "max": (("max",), lambda p: p["max"]),
+    "count": (("count",), lambda p: p["count"]),
+}
+
+# Aggregation functions computed from samples: TimeseriesDataBucketsIO method
+SAMPLE_AGGREGATIONS = {
+    "time_weighted_avg": "_time_weighted_avg",
+    "delta": "_delta",
+}
+
+AGGREGATION_FUNCTIONS = (*BUCKET_AGGREGATIONS, *SAMPLE_AGGREGATIONS)
+
+# Percentile aggregations, computed with an ordered-set aggregate:
+# "p<percentile>", percentile being in [0, 100] (e.g. "p5", "p50", "p99.9")
+PERCENTILE_AGGREGATION_RE = re.compile(r"p(100|\d{1,2}(\.\d+)?)")
+
+# Functions reducing aggregated timeseries into a single one: DataFrame method
+# and arguments, an empty reduction being NaN
+REDUCE_FUNCTIONS = {
+    "sum": ("sum", {"min_count": 1}),
+    "avg": ("mean", {}),
+    "min": ("min", {}),
+    "max": ("max", {}),
+}
+
+
+def get_percentile(aggregation):
+    """Get percentile of a percentile aggregation, as a fraction
+
+    Returns None if aggregation is not a percentile aggregation.
+    """
+    if (match := PERCENTILE_AGGREGATION_RE.fullmatch(aggregation)) is None:
+        return None
+    return float(match.group(1)) / 100
+
+
+class TimeseriesDataBucketsIO(BaseTimeseriesDataIO):
+    """Bucket timeseries data with several aggregation functions at once
+
+    Aggregation functions in BUCKET_AGGREGATIONS are computed from partial
+    aggregates returned by a single grouped query, so data is scanned only once
+    whatever the number of aggregation functions.
+
+    Aggregation functions in SAMPLE_AGGREGATIONS depend on consecutive
+    samples. They are computed with numpy from the samples in the interval and
+    the last sample before it, fetched in a single query.
+
+    If rollups are enabled and buckets are aligned on a rollup period, partial
+    aggregates are computed from rollups rather than from data.
+
+    Percentile aggregations can't be computed from partial aggregates. All
+    percentiles are computed in a single grouped query with an ordered-set
+    aggregate, grouping by N x unit buckets directly.
+
+    If several aggregation functions are requested, columns are labelled
+    "<timeseries>:<aggregation>".
+    """
+
+    @staticmethod
+    def make_label(label, aggregation):
+        return f"{label}:{aggregation}"
+
+    @staticmethod
+    def _time_weighted_avg(times, values, edges, stop):
+        """Time-weighted average of a step function in each bucket
+
+        :param ndarray times: Sample timestamps in seconds, sorted
+        :param ndarray values: Sample values
+        :param ndarray edges: Bucket edges in seconds
+        :param float stop: Time at which the last value stops being valid
+
+        Each value is valid until the next sample. Time not covered by any
+        value (before the first sample or after stop) is not accounted for.
+        """
+        ends = np.minimum(np.append(times[1:], stop), stop)
+        durations = np.maximum(ends - times, 0)
+        cum_integral = np.concatenate(([0.0], np.cumsum(values * durations)))
+        cum_duration = np.concatenate(([0.0], np.cumsum(durations)))
+
+        # Integral and covered duration from first sample to each edge
+        idx = np.searchsorted(times, edges, side="right") - 1
+        before_first = idx < 0
+        idx = np.maximum(idx, 0)
+        elapsed = np.clip(edges - times[idx], 0, durations[idx])
+        integral = np.where(
+            before_first, 0.0, cum_integral[idx] + values[idx] * elapsed
+        )
+        covered = np.where(before_first, 0.0, cum_duration[idx] + elapsed)
+
+        covered = np.diff(covered)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(covered > 0, np.diff(integral) / covered, np.nan)
+
+    @staticmethod
+    def _delta(times, values, edges, stop):
+        """Increase of a cumulative counter in each bucket
+
+        :param ndarray times: Sample timestamps in seconds, sorted
+        :param ndarray values: Sample values
+        :param ndarray edges: Bucket edges in seconds
+        :param float stop: Unused
+
+        The increase between two consecutive samples is assigned to the bucket
+        of the second sample. A decrease is considered a counter reset (or
+        rollover), in which case the increase is the new value.
+
+        Buckets with no increase to account for are NaN.
+        """
+        diffs = np.diff(values)
+        increases = np.where(diffs >= 0, diffs, values[1:])
+        buckets = np.searchsorted(edges, times[1:], side="right") - 1
+        in_range = (buckets >= 0) & (buckets < len(edges) - 1)
+        buckets = buckets[in_range]
+        sums = np.bincount(
+            buckets, weights=increases[in_range], minlength=len(edges) - 1
+        )
+        counts = np.bincount(buckets, minlength=len(edges) - 1)
+        return np.where(counts > 0, sums, np.nan)
+
+    @classmethod
+    def _get_partial_aggregates_data(
+        cls,
+        params,
+        aggregations,
+        bucket_width_value,
+        pd_freq,
+        complete_idx,
+        labels,
+        col_label,
+        rollup_period=None,
+    ):
+        """Compute aggregations from partial aggregates in a grouped query
+
+        If rollup_period is passed, partial aggregates are computed from the
+        rollups of this period rather than from data.
+
+        Returns a mapping of aggregation -> dataframe.
+        """
+        partials = list(
+            dict.fromkeys(
+                partial
+                for aggregation in aggregations
+                for partial in BUCKET_AGGREGATIONS[aggregation][0]
+            )
+        )
+        if rollup_period is None:
+            partial_exprs = ", ".join(PARTIAL_AGGREGATES[p][0] for p in partials)
+            from_clause = "ts_data"
+            rollup_filter = ""
+        else:
+            partial_exprs = ", ".join(ROLLUP_PARTIAL_AGGREGATES[p] for p in partials)
+            from_clause = "api_ts_data_rollups AS ts_data"
+            rollup_filter = "  AND ts_data.period = :rollup_period "
+            params = {**params, "rollup_period": rollup_period}
+        query = (
+            cls._data_query(
+                "date_trunc(:bucket_width_unit, timestamp, :timezone) AS bucket,"
+                f"  timeseries.id, timeseries.name, {partial_exprs}",
+                from_clause=from_clause,
+            )
+            + rollup_filter
+            + "GROUP BY bucket, timeseries.id "
+            "ORDER BY bucket;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        data_df = pd.DataFrame(
+            data, columns=("timestamp", "id", "name", *partials)
+        ).set_index("timestamp")
+        data_df.index = pd.DatetimeIndex(data_df.index, tz="UTC").tz_convert(
+            complete_idx.tz
+        )
+
+        partial_dfs = {}
+        for partial in partials:
+            partial_df = data_df.pivot(columns=col_label, values=partial).astype(float)
+            # Variable size intervals are aggregated to 1 x unit due to date_trunc
+            # Further aggregation is achieved here in pandas
+            if bucket_width_value != 1:
+                partial_df = partial_df.resample(
+                    pd_freq, closed="left", label="left"
+                ).agg(PARTIAL_AGGREGATES[partial][1], min_count=1)
+            partial_dfs[partial] = partial_df.reindex(
+                index=complete_idx, columns=labels
+            )
+        if "count" in partial_dfs:
+            partial_dfs["count"] = partial_dfs["count"].fillna(0).astype(int)
+
+        return {
+            aggregation: BUCKET_AGGREGATIONS[aggregation][1](partial_dfs)
+            for aggregation in aggregations
+        }
+
+    @classmethod
+    def _get_percentiles_data(
+        cls,
+        params,
+        aggregations,
+        bucket_width_value,
+        complete_idx,
+        labels,
+        col_label,
+    ):
+        """Compute percentile aggregations in a grouped query
+
+        NaN values are ignored.
+
+        Returns a mapping of aggregation -> dataframe.
+        """
+        params = {
+            **params,
+            "percentiles": [get_percentile(agg) for agg in aggregations],
+        }
+        if bucket_width_value == 1:
+            bucket_expr = "date_trunc(:bucket_width_unit, timestamp, :timezone)"
+        else:
+            # Fixed size buckets, aligned on interval start
+            bucket_expr = (
+                "date_bin(CAST(:bucket_width AS interval), timestamp, :start_dt)"
+            )
+            params["bucket_width"] = (
+                f"{bucket_width_value} {params['bucket_width_unit']}s"
+            )
+        query = (
+            cls._data_query(
+                f"{bucket_expr} AS bucket,"
+                "  timeseries.id, timeseries.name,"
+                "  percentile_cont(CAST(:percentiles AS float8[]))"
+                "    WITHIN GROUP (ORDER BY value)",
+                skip_nan=True,
+            )
+            + "GROUP BY bucket, timeseries.id "
+            "ORDER BY bucket;"
+        )
+        data = db.session.execute(sqla.text(query), params).all()
+
+        data_df = pd.DataFrame(
+            [
+                (bucket, ts_id, ts_name, *values)
+                for bucket, ts_id, ts_name, values in data
+            ],
+            columns=("timestamp", "id", "name", *aggregations),
+        ).set_index("timestamp")
+        data_df.index = pd.DatetimeIndex(data_df.index, tz="UTC").tz_convert(
+            complete_idx.tz
+        )
+
+        return {
+            aggregation: data_df.pivot(columns=col_label, values=aggregation)
+            .astype(float)
+            .reindex(index=complete_idx, columns=labels)
+            for aggregation in aggregations
+        }
+
+    @classmethod
+    def _get_samples_data(
+        cls, params, aggregations, complete_idx, end_dt, timeseries, labels
+    ):
+        """Compute aggregations from samples
+
+        Samples in the interval are fetched along with the last sample before
+        the interval, found by a backward index scan for each timeseries.
+
+        Returns a mapping of aggregation -> dataframe.
+        """
+        query = (
+            cls._data_query(
+                "ts_by_data_states.timeseries_id, timestamp, value",
+                labels=False,
+                skip_nan=True,
+            )
+            + "UNION ALL "
+            + cls._sample_query("prev")
+            + "ORDER BY timeseries_id, timestamp;"
+        )
+        data = db.session.execute(sqla.text(query), params).all()
+
+        data_df = pd.DataFrame(data, columns=("id", "timestamp", "value"))
+        ts_ids = data_df["id"].to_numpy()
+        times = (
+            pd.DatetimeIndex(data_df["timestamp"], tz="UTC").asi8 / 1e9
+            if len(data_df)
+            else np.empty(0)
+        )
+        values = data_df["value"].to_numpy(dtype=float)
+
+        # Bucket edges, in seconds
+        edges = np.append(complete_idx.asi8, pd.Timestamp(end_dt).value) / 1e9
+        # Last value is valid until the end of the interval, but not in the future
+        stop = min(end_dt, dt.datetime.now(tz=dt.timezone.utc)).timestamp()
+
+        ret = {
+            aggregation: pd.DataFrame(np.nan, index=complete_idx, columns=labels)
+            for aggregation in aggregations
+        }
+        for ts, label in zip(timeseries, labels):
+            # Rows are sorted by timeseries
+            start, end = np.searchsorted(ts_ids, [ts.id, ts.id + 1])
+            if start == end:
+                continue
+            for aggregation in aggregations:
+                func = getattr(cls, SAMPLE_AGGREGATIONS[aggregation])
+                ret[aggregation][label] = func(
+                    times[start:end], values[start:end], edges, stop
+                )
+        return ret
+
+    @classmethod
+    def get_timeseries_buckets_data(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        bucket_width_value,
+        bucket_width_unit,
+        aggregations=("avg",),
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+        reduce=None,
+    ):
+        """Bucket timeseries data and export
+
+        :param list aggregations: Aggregation functions.
+            Each one of AGGREGATION_FUNCTIONS or a percentile aggregation
+            matching PERCENTILE_AGGREGATION_RE.
+        :param str reduce: Function reducing timeseries into a single one,
+            bucket by bucket, after unit conversion. One of REDUCE_FUNCTIONS.
+            The reduced timeseries is labelled with the function name.
+
+        See ``TimeseriesDataIO.get_timeseries_buckets_data`` for other
+        parameters.
+
+        Unit conversions don't apply to count.
+
+        Returns a dataframe.
+        """
+        cls._check_read_permissions(timeseries)
+
+        # Ensure start/end dates are in target timezone
+        tz_info = ZoneInfo(timezone)
+        start_dt = start_dt.astimezone(tz_info)
+        end_dt = end_dt.astimezone(tz_info)
+
+        # Floor/ceil start/end dates to return complete buckets
+        start_dt = floor(start_dt, bucket_width_unit, bucket_width_value)
+        end_dt = ceil(end_dt, bucket_width_unit, bucket_width_value)
+
+        pd_freq = make_pandas_freq(bucket_width_unit, bucket_width_value)
+
+        # Create expected complete index
+        complete_idx = pd.date_range(
+            start_dt,
+            end_dt,
+            freq=pd_freq,
+            tz=tz_info,
+            name="timestamp",
+            inclusive="left",
+        )
+
+        labels = [getattr(ts, col_label) for ts in timeseries]
+        params = {
+            "timezone": timezone,
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+            "bucket_width_unit": bucket_width_unit,
+        }
+
+        agg_dfs = {}
+        if bucket_aggs := [a for a in aggregations if a in BUCKET_AGGREGATIONS]:
+            rollup_period = None
+            if rollups.enabled:
+                rollup_period = rollups.get_period(start_dt, end_dt, bucket_width_unit)
+                if rollup_period is not None and not rollups.prepare(
+                    timeseries, data_state
+                ):
+                    rollup_period = None
+            agg_dfs.update(
+                cls._get_partial_aggregates_data(
+                    params,
+                    bucket_aggs,
+                    bucket_width_value,
+                    pd_freq,
+                    complete_idx,
+                    labels,
+                    col_label,
+                    rollup_period,
+                )
+            )
+        if sample_aggs := [a for a in aggregations if a in SAMPLE_AGGREGATIONS]:
+            agg_dfs.update(
+                cls._get_samples_data(
+                    params, sample_aggs, complete_idx, end_dt, timeseries, labels
+                )
+            )
+        if percentile_aggs := [
+            a for a in aggregations if get_percentile(a) is not None
+        ]:
+            agg_dfs.update(
+                cls._get_percentiles_data(
+                    params,
+                    percentile_aggs,
+                    bucket_width_value,
+                    complete_idx,
+                    labels,
+                    col_label,
+                )
+            )
+
+        ret_df = pd.DataFrame(
+            {
+                cls.make_column_label(label, aggregation, aggregations): agg_dfs[
+                    aggregation
+                ][label]
+                for label in labels
+                for aggregation in aggregations
+            },
+            index=complete_idx,
+        )
+
+        if convert_to:
+            cls.convert(ret_df, timeseries, aggregations, convert_to, col_label)
+
+        if reduce is not None:
+            ret_df = cls.reduce(ret_df, labels, aggregations, reduce)
+
+        return ret_df
+
+    @classmethod
+    def make_column_label(cls, label, aggregation, aggregations):
+        """Make column label, only including aggregation if there are several"""
+        if len(aggregations) == 1:
+            return label
+        return cls.make_label(label, aggregation)
+
+    @classmethod
+    def convert(cls, data_df, timeseries, aggregations, convert_to, col_label):
+        """Convert bucketed data in place
+
+        Unit conversions don't apply to count.
+        """
+        ureg.convert_df(
+            data_df,
+            {
+                cls.make_column_label(
+                    getattr(ts, col_label), aggregation, aggregations
+                ): ts.unit_symbol
+                for ts in timeseries
+                for aggregation in aggregations
+                if aggregation != "count"
+            },
+            {
+                cls.make_column_label(label, aggregation, aggregations): unit
+                for label, unit in convert_to.items()
+                for aggregation in aggregations
+                if aggregation != "count"
+            },
+        )
+
+    @classmethod
+    def reduce(cls, data_df, labels, aggregations, reduce):
+        """Reduce bucketed data of timeseries into a single timeseries"""
+        method, reduce_kwargs = REDUCE_FUNCTIONS[reduce]
+        return pd.DataFrame(
+            {
+                cls.make_column_label(reduce, aggregation, aggregations): getattr(
+                    data_df[
+                        [
+                            cls.make_column_label(label, aggregation, aggregations)
+                            for label in labels
+                        ]
+                    ],
+                    method,
+                )(axis=1, **reduce_kwargs)
+                for aggregation in aggregations
+            },
+            index=data_df.index,
+        )
+
+
+class TimeseriesDataFormulaIO(BaseTimeseriesDataIO):
+    """Get data of virtual timeseries computed from formulas
+
+    Data of regular timeseries and of timeseries used in formulas is queried
+    in a single query, labelled by ID. Formulas are then evaluated on aligned
+    values: raw values at same timestamps, or aggregated values of a bucket.
+    Virtual timeseries values are expressed in their own unit.
+    """
+
+    @staticmethod
+    def _evaluate(data_df, timeseries, formulas, col_label, aggregations):
+        """Get regular and virtual timeseries columns from source data
+
+        :param DataFrame data_df: Source data, labelled by ID
+        :param list aggregations: Aggregations, or [None] for raw data
+        """
+
+        def make_label(label, aggregation):
+            if aggregation is None:
+                return label
+            return tsdbucketsio.make_column_label(label, aggregation, aggregations)
+
+        columns = {}
+        for ts in timeseries:
+            for aggregation in aggregations:
+                if (formula := formulas.get(ts.id)) is not None:
+                    values = formula.evaluate(
+                        {
+                            ts_id: data_df[make_label(ts_id, aggregation)].to_numpy(
+                                dtype=float
+                            )
+                            for ts_id in formula.timeseries_ids
+                        },
+                        len(data_df),
+                    )
+                else:
+                    values = data_df[make_label(ts.id, aggregation)]
+                columns[make_label(getattr(ts, col_label), aggregation)] = values
+        return pd.DataFrame(columns, index=data_df.index)
+
+    @classmethod
+    def get_timeseries_data(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        formulas,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Get timeseries data, including virtual timeseries
+
+        :param dict formulas: Formulas of virtual timeseries
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a dataframe.
+        """
+        # Check permissions on virtual timeseries, source timeseries being
+        # checked when querying data
+        cls._check_read_permissions(timeseries)
+
+        data_df = tsdio.get_timeseries_data(
+            start_dt,
+            end_dt,
+            virtual_timeseries.get_sources(timeseries, formulas),
+            data_state,
+            timezone=timezone,
+            col_label="id",
+        )
+        ret_df = cls._evaluate(data_df, timeseries, formulas, col_label, [None])
+        if convert_to:
+            ureg.convert_df(
+                ret_df,
+                {getattr(ts, col_label): ts.unit_symbol for ts in timeseries},
+                convert_to,
+            )
+        return ret_df
+
+    @classmethod
+    def get_timeseries_buckets_data(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        bucket_width_value,
+        bucket_width_unit,
+        aggregations,
+        formulas,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+        reduce=None,
+    ):
+        """Bucket timeseries data, including virtual timeseries
+
+        :param dict formulas: Formulas of virtual timeseries
+
+        See ``TimeseriesDataBucketsIO.get_timeseries_buckets_data`` for other
+        parameters. Formulas are applied to aggregated values.
+
+        Returns a dataframe.
+        """
+        cls._check_read_permissions(timeseries)
+
+        data_df = tsdbucketsio.get_timeseries_buckets_data(
+            start_dt,
+            end_dt,
+            virtual_timeseries.get_sources(timeseries, formulas),
+            data_state,
+            bucket_width_value,
+            bucket_width_unit,
+            aggregations,
+            timezone=timezone,
+            col_label="id",
+        )
+        ret_df = cls._evaluate(data_df, timeseries, formulas, col_label, aggregations)
+        if convert_to:
+            tsdbucketsio.convert(
+                ret_df, timeseries, aggregations, convert_to, col_label
+            )
+        if reduce is not None:
+            ret_df = tsdbucketsio.reduce(
+                ret_df,
+                [getattr(ts, col_label) for ts in timeseries],
+                aggregations,
+                reduce,
+            )
+        return ret_df
+
+
+tsdbucketsio = TimeseriesDataBucketsIO()
+tsdformulaio = TimeseriesDataFormulaIO()
@@ -0,0 +1,367 @@
+"""Timeseries data stats I/O"""
+
+import json
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sqla
+
+import numpy as np
+import pandas as pd
+
+from bemserver_core.database import db
+from bemserver_core.input_output import tsdio
+
+from bemserver_api.extensions.stats_summaries import stats_summaries
+
+from .base import BaseTimeseriesDataIO
+
+# Load profile periods: field extracted from local time and number of periods
+PROFILE_PERIODS = {
+    "weekday": ("isodow", 7),
+    "month": ("month", 12),
+}
+
+# Load profile aggregation functions: SQL aggregate expression
+PROFILE_AGGREGATIONS = {
+    "avg": "avg(value)",
+    "sum": "sum(value)",
+    "min": "min(value)",
+    "max": "max(value)",
+    "count": "count(value)",
+}
+
+
+class TimeseriesDataStatsIO(BaseTimeseriesDataIO):
+    """Get timeseries stats from stats summaries
+
+    Returns the same dataframe as bemserver-core stats, without scanning data
+    unless stats table doesn't exist.
+    """
+
+    @classmethod
+    def get_timeseries_stats(
+        cls,
+        timeseries,
+        data_state,
+        *,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Get timeseries stats
+
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param str timezone: IANA timezone to use for first/last timestamp
+        :param string col_label: Timeseries attribute to use for column header.
+            Should be "id" or "name". Default: "id".
+
+        Returns a dataframe.
+        """
+        cls._check_read_permissions(timeseries)
+
+        if not stats_summaries.prepare(timeseries, data_state):
+            return tsdio.get_timeseries_stats(
+                timeseries, data_state, timezone=timezone, col_label=col_label
+            )
+
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+        }
+        query = cls._data_query(
+            f"timeseries.{col_label}, "
+            "first_timestamp, last_timestamp, value_count, value_min, value_max, "
+            "value_sum / nullif(value_count, 0), "
+            "CASE WHEN value_count > 1 "
+            "  THEN sqrt(greatest(value_m2, 0) / (value_count - 1)) END",
+            from_clause="api_ts_data_stats AS ts_data",
+            interval=False,
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        data_df = (
+            pd.DataFrame(
+                data,
+                columns=(
+                    col_label,
+                    "first_timestamp",
+                    "last_timestamp",
+                    "count",
+                    "min",
+                    "max",
+                    "avg",
+                    "stddev",
+                ),
+            )
+            .set_index(col_label)
+            .reindex(getattr(ts, col_label) for ts in timeseries)
+        )
+        data_df["count"] = data_df["count"].fillna(0)
+        data_df = data_df.astype(
+            {
+                "first_timestamp": "datetime64[ns, UTC]",
+                "last_timestamp": "datetime64[ns, UTC]",
+                "count": int,
+                "min": float,
+                "max": float,
+                "avg": float,
+                "stddev": float,
+            }
+        )
+
+        for col in ("first_timestamp", "last_timestamp"):
+            data_df[col] = data_df[col].dt.tz_convert(timezone)
+
+        return data_df
+
+
+class TimeseriesDataLatestIO(BaseTimeseriesDataIO):
+    """Get latest values of timeseries
+
+    Values are read from the end of the (timeseries by data state, timestamp)
+    index, so query time doesn't depend on the length of the history.
+    """
+
+    @classmethod
+    def export_json(
+        cls,
+        timeseries,
+        data_state,
+        count=1,
+        *,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export last values of timeseries as JSON
+
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param int count: Number of values to export for each timeseries
+        :param str timezone: IANA timezone to use for timestamps
+        :param string col_label: Timeseries attribute to use for labels.
+            Should be "id" or "name". Default: "id".
+
+        Returns a JSON string mapping timeseries labels to {timestamp: value}
+        mappings, timestamps being sorted.
+        """
+        cls._check_read_permissions(timeseries)
+
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "count": count,
+        }
+        query = (
+            f"SELECT timeseries.{col_label}, data.timestamp, data.value "
+            "FROM timeseries, ts_by_data_states "
+            "CROSS JOIN LATERAL ("
+            "  SELECT timestamp, value FROM ts_data "
+            "  WHERE ts_data.ts_by_data_state_id = ts_by_data_states.id "
+            "  ORDER BY timestamp DESC LIMIT :count"
+            ") AS data "
+            "WHERE ts_by_data_states.data_state_id = :data_state_id "
+            "  AND ts_by_data_states.timeseries_id = timeseries.id "
+            "  AND timeseries_id = ANY(:timeseries_ids) "
+            "ORDER BY data.timestamp"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        tz = ZoneInfo(timezone)
+        ret = {getattr(ts, col_label): {} for ts in timeseries}
+        for label, timestamp, value in data:
+            ret[label][timestamp.astimezone(tz).isoformat()] = (
+                None if value is None or np.isnan(value) else value
+            )
+        return json.dumps(ret)
+
+
+class TimeseriesDataHistogramIO(BaseTimeseriesDataIO):
+    """Get histograms of timeseries values
+
+    Values are counted by bin in a grouped query using width_bucket, so only
+    counts are returned.
+
+    Bins are half-open intervals [lower edge, upper edge), except the last one
+    which includes its upper edge, as in numpy.
+    """
+
+    @classmethod
+    def get_timeseries_histograms(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        bins=10,
+        bin_edges=None,
+        col_label="id",
+    ):
+        """Get timeseries histograms
+
+        :param datetime start_dt: Time interval lower bound (tz-aware)
+        :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param int bins: Number of equal-width bins between minimum and maximum
+            values of each timeseries in the interval. Ignored if bin_edges
+            is passed.
+        :param list bin_edges: Sorted bin edges, common to all timeseries.
+            Values out of edges are not counted.
+        :param string col_label: Timeseries attribute to use for labels.
+            Should be "id" or "name". Default: "id".
+
+        NaN values are ignored.
+
+        Returns a mapping of timeseries labels to {"edges", "counts"} mappings.
+        Edges are empty for timeseries with no value if bin_edges is not
+        passed.
+        """
+        cls._check_read_permissions(timeseries)
+
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+        }
+        data_query = cls._data_query(
+            f"timeseries.{col_label} AS label, value", skip_nan=True
+        )
+
+        if bin_edges is not None:
+            nb_bins = len(bin_edges) - 1
+            params.update(
+                {
+                    "bin_edges": bin_edges,
+                    "nb_bins": nb_bins,
+                    "lower": bin_edges[0],
+                    "upper": bin_edges[-1],
+                }
+            )
+            query = (
+                "SELECT label, NULL, NULL,"
+                "  least(width_bucket(value, CAST(:bin_edges AS float8[])), :nb_bins)"
+                "  AS bin, count(*) "
+                f"FROM ({data_query}) AS data "
+                "WHERE value >= :lower AND value <= :upper "
+                "GROUP BY label, bin;"
+            )
+        else:
+            nb_bins = bins
+            params["nb_bins"] = nb_bins
+            # Bounds are computed over the partition of each timeseries, so
+            # that data is scanned once. If all values are equal, they are
+            # counted in the middle bin of a unit range around the value.
+            query = (
+                "SELECT label, lower, upper,"
+                "  CASE WHEN lower = upper THEN :nb_bins / 2 + 1"
+                "    ELSE least(width_bucket(value, lower, upper, :nb_bins), :nb_bins)"
+                "  END AS bin, count(*) "
+                "FROM ("
+                "  SELECT label, value,"
+                "    min(value) OVER (PARTITION BY label) AS lower,"
+                "    max(value) OVER (PARTITION BY label) AS upper"
+                f"  FROM ({data_query}) AS data"
+                ") AS data "
+                "GROUP BY label, lower, upper, bin;"
+            )
+        data = db.session.execute(sqla.text(query), params)
+
+        ret = {
+            getattr(ts, col_label): {
+                "edges": [] if bin_edges is None else list(bin_edges),
+                "counts": [] if bin_edges is None else [0] * nb_bins,
+            }
+            for ts in timeseries
+        }
+        for label, lower, upper, bin_idx, count in data:
+            hist = ret[label]
+            if not hist["counts"]:
+                if lower == upper:
+                    lower, upper = lower - 0.5, upper + 0.5
+                hist["edges"] = np.linspace(lower, upper, nb_bins + 1).tolist()
+                hist["counts"] = [0] * nb_bins
+            hist["counts"][bin_idx - 1] = count
+        return ret
+
+
+class TimeseriesDataProfileIO(BaseTimeseriesDataIO):
+    """Get load profiles of timeseries
+
+    Values are grouped by hour of day and by period (day of week or month) of
+    their local time, in a single grouped query. Grouping is done on wall
+    clock time, so DST changes are accounted for: the hour skipped in spring
+    has no value and the hour repeated in autumn gets the values of both.
+    """
+
+    @classmethod
+    def get_timeseries_profiles(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        period="weekday",
+        aggregation="avg",
+        *,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Get timeseries load profiles
+
+        :param datetime start_dt: Time interval lower bound (tz-aware)
+        :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+        :param list timeseries: List of timeseries
+        :param TimeseriesDataState data_state: Timeseries data state
+        :param str period: Period, one of PROFILE_PERIODS
+        :param str aggregation: Aggregation function, one of
+            PROFILE_AGGREGATIONS
+        :param str timezone: IANA timezone of local time
+        :param string col_label: Timeseries attribute to use for labels.
+            Should be "id" or "name". Default: "id".
+
+        NaN values are ignored.
+
+        Returns a mapping of timeseries labels to matrices, as lists of rows.
+        Rows are periods (Monday to Sunday or January to December) and columns
+        are hours of day (0 to 23). Empty cells are None, or 0 for count.
+        """
+        cls._check_read_permissions(timeseries)
+
+        field, nb_periods = PROFILE_PERIODS[period]
+        params = {
+            "timeseries_ids": [ts.id for ts in timeseries],
+            "data_state_id": data_state.id,
+            "start_dt": start_dt,
+            "end_dt": end_dt,
+            "timezone": timezone,
+        }
+        query = (
+            cls._data_query(
+                f"timeseries.{col_label},"
+                f"  extract({field} FROM timestamp AT TIME ZONE :timezone) AS period,"
+                "  extract(hour FROM timestamp AT TIME ZONE :timezone) AS hour,"
+                f"  {PROFILE_AGGREGATIONS[aggregation]}",
+                skip_nan=True,
+            )
+            + "GROUP BY timeseries.id, period, hour;"
+        )
+        data = db.session.execute(sqla.text(query), params)
+
+        empty = 0 if aggregation == "count" else None
+        ret = {
+            getattr(ts, col_label): [[empty] * 24 for _ in range(nb_periods)]
+            for ts in timeseries
+        }
+        for label, period_idx, hour, value in data:
+            ret[label][int(period_idx) - 1][int(hour)] = (
+                int(value) if aggregation == "count" else float(value)
+            )
+        return ret
+
+
+tsdstatsio = TimeseriesDataStatsIO()
+tsdlatestio = TimeseriesDataLatestIO()
+tsdhistogramio = TimeseriesDataHistogramIO()
+tsdprofileio = TimeseriesDataProfileIO()
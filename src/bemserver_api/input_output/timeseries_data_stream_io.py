@@ -0,0 +1,763 @@
+"""Timeseries data export formats I/O"""
+
+import csv
+import io
+import json
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sqla
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+from bemserver_core.common import ureg
+from bemserver_core.database import db
+from bemserver_core.input_output import tsdio, tsdjsonio
+from bemserver_core.model import Timeseries, TimeseriesByDataState, TimeseriesData
+
+from .base import BaseTimeseriesDataIO
+
+LONG_FORMAT_CSV_HEADER = ("Datetime", "Timeseries", "Value")
+
+ARROW_STREAM_MIME_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def iter_time_windows(start_dt, end_dt, window):
+    """Split a time interval into consecutive windows
+
+    :param datetime start_dt: Time interval lower bound (tz-aware)
+    :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+    :param timedelta window: Maximum window duration
+
+    Yields (start, end) tuples covering [start_dt, end_dt).
+    """
+    while start_dt < end_dt:
+        window_end_dt = min(start_dt + window, end_dt)
+        yield start_dt, window_end_dt
+        start_dt = window_end_dt
+
+
+def isoformat(index):
+    """Format a tz-aware DatetimeIndex as datetime.isoformat would
+
+    Returns a list of strings.
+    """
+    ret = pd.Series(index.strftime("%Y-%m-%dT%H:%M:%S.%f%z"))
+    # Microseconds are only written if not zero
+    ret = ret.str.replace(".000000", "", regex=False)
+    # UTC offset is written as +HH:MM
+    return (ret.str[:-2] + ":" + ret.str[-2:]).tolist()
+
+
+class TimeseriesDataStreamIO(BaseTimeseriesDataIO):
+    """Export timeseries data as a stream of text chunks
+
+    Only a bounded amount of data is held in memory at a time, whatever the
+    size of the interval. How data is chunked depends on the layout.
+
+    Wide CSV rows hold the values of all timeseries at a timestamp, so the time
+    interval is walked in windows, each read by a query.
+
+    JSON documents and long format rows are grouped by timeseries, so data of
+    all timeseries is read by a single query from a server-side cursor, in
+    batches of rows.
+
+    Permissions and unit conversions are checked when the stream is created
+    rather than when it is consumed, so that errors can still be returned to
+    the client before the first chunk is sent.
+    """
+
+    @staticmethod
+    def _check_convert_to(timeseries, col_label, convert_to):
+        """Check units in convert_to are compatible with timeseries units
+
+        Raises BEMServerCoreDimensionalityError otherwise.
+        """
+        for ts in timeseries:
+            if (unit := convert_to.get(getattr(ts, col_label))) is not None:
+                ureg.convert(1, ts.unit_symbol, unit)
+
+    @classmethod
+    def stream_csv(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        window,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as CSV chunks
+
+        :param timedelta window: Maximum duration of data queried at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of CSV strings. The concatenation of the chunks is
+        the same as the output of ``TimeseriesDataCSVIO.export_csv``.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        return cls._iter_csv(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            window,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+
+    @staticmethod
+    def _iter_csv(
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        window,
+        *,
+        convert_to,
+        timezone,
+        col_label,
+    ):
+        header = True
+        for w_start_dt, w_end_dt in iter_time_windows(start_dt, end_dt, window):
+            data_df = tsdio.get_timeseries_data(
+                w_start_dt,
+                w_end_dt,
+                timeseries,
+                data_state,
+                convert_to=convert_to,
+                timezone=timezone,
+                col_label=col_label,
+            )
+            if data_df.empty and not header:
+                continue
+            data_df.index.name = "Datetime"
+            # Specify ISO 8601 manually
+            # https://github.com/pandas-dev/pandas/issues/27328
+            yield data_df.to_csv(header=header, date_format="%Y-%m-%dT%H:%M:%S%z")
+            header = False
+        # Empty time interval: still write header
+        if header:
+            data_df = pd.DataFrame(
+                columns=[getattr(ts, col_label) for ts in timeseries]
+            )
+            data_df.index.name = "Datetime"
+            yield data_df.to_csv()
+
+    @classmethod
+    def stream_json(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        batch_size,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as JSON chunks
+
+        :param int batch_size: Number of rows fetched from database at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of JSON fragments. The concatenation of the chunks
+        is the same JSON document as the output of
+        ``TimeseriesDataJSONIO.export_json``.
+
+        Since the JSON document is keyed by timeseries, data of all timeseries
+        is read in a single query from a server-side cursor, sorted by
+        timeseries then timestamp, and each batch is written timeseries by
+        timeseries.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        return cls._iter_json(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            batch_size,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+
+    @classmethod
+    def _iter_json(cls, *args, **kwargs):
+        yield "{"
+        # Label of the timeseries being written
+        current = None
+        for timestamps, labels, values in cls._iter_long_batches(*args, **kwargs):
+            timestamps = isoformat(pd.DatetimeIndex(timestamps))
+            labels = np.array(labels, dtype=object)
+            # Split batch into runs of rows of a same timeseries
+            bounds = [0, *(np.flatnonzero(labels[1:] != labels[:-1]) + 1), len(labels)]
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                if labels[start] != current:
+                    # Timeseries with no data are skipped, so the key is only
+                    # written when the first row of a timeseries is found
+                    label = json.dumps(str(labels[start]))
+                    yield f"{'' if current is None else '}, '}{label}: {{"
+                    current = labels[start]
+                else:
+                    yield ", "
+                # Strip curly braces from the mapping to get its content
+                yield json.dumps(dict(zip(timestamps[start:end], values[start:end])))[
+                    1:-1
+                ]
+        if current is not None:
+            yield "}"
+        yield "}"
+
+    @staticmethod
+    def _iter_long_batches(
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        batch_size,
+        *,
+        convert_to,
+        timezone,
+        col_label,
+    ):
+        """Yield (timestamps, labels, values) batches read from a server-side cursor
+
+        Rows are sorted by timeseries by data state then timestamp, which is the
+        order of the data table primary key index, so the database can read
+        rows in index order rather than sort them. For a single data state,
+        rows are grouped by timeseries and sorted by timestamp.
+        """
+        tz_info = ZoneInfo(timezone)
+        src_units = {getattr(ts, col_label): ts.unit_symbol for ts in timeseries}
+        convert_to = convert_to or {}
+
+        stmt = (
+            sqla.select(
+                TimeseriesData.timestamp,
+                getattr(Timeseries, col_label),
+                TimeseriesData.value,
+            )
+            .filter(
+                TimeseriesData.timeseries_by_data_state_id == TimeseriesByDataState.id
+            )
+            .filter(TimeseriesByDataState.data_state_id == data_state.id)
+            .filter(TimeseriesByDataState.timeseries_id == Timeseries.id)
+            .filter(Timeseries.id.in_(ts.id for ts in timeseries))
+            .filter(start_dt <= TimeseriesData.timestamp)
+            .filter(TimeseriesData.timestamp < end_dt)
+            # NaN values are skipped like in wide format JSON export
+            # (in PostgreSQL, NaN is equal to NaN)
+            .filter(TimeseriesData.value != float("nan"))
+            .order_by(
+                TimeseriesData.timeseries_by_data_state_id, TimeseriesData.timestamp
+            )
+        )
+        # yield_per uses a server-side cursor
+        result = db.session.execute(stmt, execution_options={"yield_per": batch_size})
+        for rows in result.partitions():
+            timestamps, labels, values = zip(*rows)
+            values = np.array(values, dtype=float)
+            if convert_to:
+                labels_a = np.array(labels, dtype=object)
+                for label, unit in convert_to.items():
+                    if (mask := labels_a == label).any():
+                        values[mask] = ureg.convert(
+                            values[mask], src_units[label], unit
+                        )
+            yield (
+                [ts.astimezone(tz_info) for ts in timestamps],
+                labels,
+                values.tolist(),
+            )
+
+    @classmethod
+    def stream_long_csv(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        batch_size,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as long format CSV chunks
+
+        :param int batch_size: Number of rows fetched from database at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of CSV strings. Each line is a
+        (timestamp, timeseries, value) row. Rows are sorted by timeseries, then
+        timestamp.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        return cls._iter_long_csv(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            batch_size,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+
+    @classmethod
+    def _iter_long_csv(cls, *args, **kwargs):
+        yield ",".join(LONG_FORMAT_CSV_HEADER) + "\n"
+        for timestamps, labels, values in cls._iter_long_batches(*args, **kwargs):
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator="\n")
+            writer.writerows(
+                zip(
+                    (ts.strftime("%Y-%m-%dT%H:%M:%S%z") for ts in timestamps),
+                    labels,
+                    values,
+                )
+            )
+            yield buffer.getvalue()
+
+    @classmethod
+    def stream_long_json(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        batch_size,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as long format JSON chunks
+
+        :param int batch_size: Number of rows fetched from database at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of JSON fragments. The document is a list of
+        [timestamp, timeseries, value] rows. Rows are sorted by timeseries, then
+        timestamp.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        return cls._iter_long_json(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            batch_size,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+
+    @classmethod
+    def _iter_long_json(cls, *args, **kwargs):
+        yield "["
+        first_batch = True
+        for timestamps, labels, values in cls._iter_long_batches(*args, **kwargs):
+            if not first_batch:
+                yield ", "
+            first_batch = False
+            rows = [
+                [ts.isoformat(), label, value]
+                for ts, label, value in zip(timestamps, labels, values)
+            ]
+            # Strip square brackets from the list to get its content
+            yield json.dumps(rows)[1:-1]
+        yield "]"
+
+
+class TimeseriesDataArrowIO(TimeseriesDataStreamIO):
+    """Export timeseries data as Apache Arrow IPC stream
+
+    Timestamps are exported as int64 nanosecond timestamps in the requested
+    timezone and values as float64 (or int64 for count aggregation).
+
+    Requires pyarrow.
+    """
+
+    @staticmethod
+    def is_available():
+        return pa is not None
+
+    @staticmethod
+    def _make_schema(labels, timezone, dtype=float):
+        value_type = pa.int64() if dtype is int else pa.float64()
+        return pa.schema(
+            [
+                pa.field("Datetime", pa.timestamp("ns", tz=timezone)),
+                *(pa.field(str(label), value_type) for label in labels),
+            ]
+        )
+
+    @staticmethod
+    def _df_to_record_batch(data_df, schema):
+        # Numeric columns are passed to Arrow without copy, NaN become nulls
+        return pa.RecordBatch.from_arrays(
+            [
+                pa.array(data_df.index),
+                *(
+                    pa.array(data_df[col].to_numpy(), from_pandas=True)
+                    for col in data_df.columns
+                ),
+            ],
+            schema=schema,
+        )
+
+    @staticmethod
+    def _drain(sink):
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    @classmethod
+    def _write(cls, schema, batches):
+        """Write record batches as IPC stream, yielding bytes as they come"""
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+                yield cls._drain(sink)
+        yield cls._drain(sink)
+
+    @classmethod
+    def export_arrow(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as Arrow IPC stream
+
+        See ``TimeseriesDataIO.get_timeseries_data``.
+
+        Returns bytes.
+        """
+        data_df = tsdio.get_timeseries_data(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+        schema = cls._make_schema(data_df.columns, timezone)
+        return b"".join(cls._write(schema, [cls._df_to_record_batch(data_df, schema)]))
+
+    @classmethod
+    def export_arrow_bucket(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        bucket_width_value,
+        bucket_width_unit,
+        aggregation="avg",
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Bucket timeseries data and export as Arrow IPC stream
+
+        See ``TimeseriesDataIO.get_timeseries_buckets_data``.
+
+        Returns bytes.
+        """
+        data_df = tsdio.get_timeseries_buckets_data(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            bucket_width_value,
+            bucket_width_unit,
+            aggregation,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+        schema = cls._make_schema(
+            data_df.columns, timezone, int if aggregation == "count" else float
+        )
+        return b"".join(cls._write(schema, [cls._df_to_record_batch(data_df, schema)]))
+
+    @classmethod
+    def stream_arrow(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        window,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as Arrow IPC stream chunks
+
+        :param timedelta window: Maximum duration of data queried at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of bytes. Each time window is a record batch.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        schema = cls._make_schema(
+            [getattr(ts, col_label) for ts in timeseries], timezone
+        )
+        batches = (
+            cls._df_to_record_batch(
+                tsdio.get_timeseries_data(
+                    w_start_dt,
+                    w_end_dt,
+                    timeseries,
+                    data_state,
+                    convert_to=convert_to,
+                    timezone=timezone,
+                    col_label=col_label,
+                ),
+                schema,
+            )
+            for w_start_dt, w_end_dt in iter_time_windows(start_dt, end_dt, window)
+        )
+        return cls._write(schema, batches)
+
+    @classmethod
+    def stream_long_arrow(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        batch_size,
+        *,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as long format Arrow IPC stream chunks
+
+        :param int batch_size: Number of rows fetched from database at once
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+
+        Returns a generator of bytes. Each database fetch is a record batch of
+        (Datetime, Timeseries, Value) rows.
+        """
+        cls._check_read_permissions(timeseries)
+        cls._check_convert_to(timeseries, col_label, convert_to or {})
+        label_type = pa.int64() if col_label == "id" else pa.string()
+        schema = pa.schema(
+            [
+                pa.field(LONG_FORMAT_CSV_HEADER[0], pa.timestamp("ns", tz=timezone)),
+                pa.field(LONG_FORMAT_CSV_HEADER[1], label_type),
+                pa.field(LONG_FORMAT_CSV_HEADER[2], pa.float64()),
+            ]
+        )
+        batches = (
+            pa.RecordBatch.from_arrays(
+                [
+                    pa.array(timestamps, type=schema.field(0).type),
+                    pa.array(labels, type=label_type),
+                    pa.array(values, type=pa.float64()),
+                ],
+                schema=schema,
+            )
+            for timestamps, labels, values in cls._iter_long_batches(
+                start_dt,
+                end_dt,
+                timeseries,
+                data_state,
+                batch_size,
+                convert_to=convert_to,
+                timezone=timezone,
+                col_label=col_label,
+            )
+        )
+        return cls._write(schema, batches)
+
+
+class TimeseriesDataCompactJSONIO:
+    """Export timeseries data as compact columnar JSON
+
+    The document contains a single timestamp list shared by all timeseries and
+    a value list for each timeseries:
+
+    {"timestamps": [t1, t2, ...], "values": {"1": [v1, v2, ...], ...}}
+
+    Timestamps are either ISO 8601 strings or epoch milliseconds.
+    """
+
+    @staticmethod
+    def _df_to_json(data_df, epoch_timestamps=False):
+        if epoch_timestamps:
+            # asi8 is nanoseconds since epoch (UTC)
+            timestamps = (data_df.index.asi8 // 1_000_000).tolist()
+        else:
+            timestamps = [x.isoformat() for x in data_df.index]
+        data_df = data_df.astype(object).where(data_df.notnull(), None)
+        return json.dumps(
+            {
+                "timestamps": timestamps,
+                "values": {str(col): data_df[col].tolist() for col in data_df.columns},
+            }
+        )
+
+    @classmethod
+    def export_json(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        *,
+        epoch_timestamps=False,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Export timeseries data as compact JSON string
+
+        :param bool epoch_timestamps: Export timestamps as epoch milliseconds
+
+        See ``TimeseriesDataIO.get_timeseries_data`` for other parameters.
+        """
+        data_df = tsdio.get_timeseries_data(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+        return cls._df_to_json(data_df, epoch_timestamps=epoch_timestamps)
+
+    @classmethod
+    def export_json_bucket(
+        cls,
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        bucket_width_value,
+        bucket_width_unit,
+        aggregation="avg",
+        *,
+        epoch_timestamps=False,
+        convert_to=None,
+        timezone="UTC",
+        col_label="id",
+    ):
+        """Bucket timeseries data and export as compact JSON string
+
+        :param bool epoch_timestamps: Export timestamps as epoch milliseconds
+
+        See ``TimeseriesDataIO.get_timeseries_buckets_data`` for other
+        parameters.
+        """
+        data_df = tsdio.get_timeseries_buckets_data(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            bucket_width_value,
+            bucket_width_unit,
+            aggregation,
+            convert_to=convert_to,
+            timezone=timezone,
+            col_label=col_label,
+        )
+        return cls._df_to_json(data_df, epoch_timestamps=epoch_timestamps)
+
+
+class TimeseriesDataFrameIO:
+    """Export timeseries dataframes computed in the API
+
+    Formats are the same as the ones produced by the export functions of
+    bemserver-core and of this module.
+    """
+
+    @staticmethod
+    def export_csv(data_df):
+        """Export dataframe as CSV string"""
+        data_df.index.name = "Datetime"
+        # Specify ISO 8601 manually
+        # https://github.com/pandas-dev/pandas/issues/27328
+        return data_df.to_csv(date_format="%Y-%m-%dT%H:%M:%S%z")
+
+    @staticmethod
+    def export_json(data_df, *, dropna=False):
+        """Export dataframe as JSON string
+
+        :param bool dropna: Drop NaN values rather than exporting them as null
+        """
+        return tsdjsonio._df_to_json(data_df, dropna=dropna)
+
+    @staticmethod
+    def export_compact_json(data_df, *, epoch_timestamps=False):
+        """Export dataframe as compact JSON string
+
+        :param bool epoch_timestamps: Export timestamps as epoch milliseconds
+        """
+        return TimeseriesDataCompactJSONIO._df_to_json(
+            data_df, epoch_timestamps=epoch_timestamps
+        )
+
+    @staticmethod
+    def export_arrow(data_df, *, timezone="UTC"):
+        """Export dataframe as Arrow IPC stream
+
+        Values are exported as int64 if all columns are integers, float64
+        otherwise.
+
+        Returns bytes.
+        """
+        dtype = (
+            int
+            if len(data_df.columns)
+            and all(pd.api.types.is_integer_dtype(dt) for dt in data_df.dtypes)
+            else float
+        )
+        schema = tsdarrowio._make_schema(data_df.columns, timezone, dtype)
+        return b"".join(
+            tsdarrowio._write(schema, [tsdarrowio._df_to_record_batch(data_df, schema)])
+        )
+
+
+tsdstreamio = TimeseriesDataStreamIO()
+tsdarrowio = TimeseriesDataArrowIO()
+tsdcompactjsonio = TimeseriesDataCompactJSONIO()
+tsdfio = TimeseriesDataFrameIO()
@@ -0,0 +1,7 @@
+"""Process"""
+
+from .correlation import CORRELATION_METHODS, correlate_df  # noqa
+from .downsampling import DOWNSAMPLING_METHODS, downsample  # noqa
+from .intervals import bucket_durations  # noqa
+from .resampling import FILL_METHODS, make_grid, resample  # noqa
+from .rolling import ROLLING_FUNCTIONS, rolling  # noqa
@@ -0,0 +1,66 @@
+"""Correlation
+
+Pairwise correlation and covariance of timeseries aligned on a time index.
+
+Each pair of timeseries is computed over the rows where both have a value
+(pairwise complete observations), as pandas does, but with a few matrix
+products rather than a loop over pairs.
+"""
+
+import numpy as np
+import pandas as pd
+
+CORRELATION_METHODS = ("pearson", "covariance")
+
+
+def correlate(values, method="pearson", min_periods=2):
+    """Compute pairwise correlation or covariance matrix
+
+    :param ndarray values: Values (float), one column per timeseries, NaN
+        being missing values
+    :param str method: One of CORRELATION_METHODS
+    :param int min_periods: Minimum number of common values for a pair
+
+    Returns an N x N float array, NaN where there are not enough common values
+    or where a timeseries is constant over the common values (correlation).
+    """
+    present = ~np.isnan(values)
+    # Center on column means to limit cancellation in sums of products
+    means = np.where(present, values, 0.0).sum(axis=0) / np.maximum(
+        present.sum(axis=0), 1
+    )
+    centered = np.where(present, values - means, 0.0)
+    mask = present.astype(float)
+
+    counts = mask.T @ mask
+    # sums[i, j]: sum of values of i where j also has a value
+    sums = centered.T @ mask
+    sums_sq = (centered**2).T @ mask
+    sums_prod = centered.T @ centered
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = (sums_prod - sums * sums.T / counts) / (counts - 1)
+        if method == "covariance":
+            ret = cov
+        else:
+            var = (sums_sq - sums**2 / counts) / (counts - 1)
+            ret = np.clip(cov / np.sqrt(var * var.T), -1.0, 1.0)
+            ret[~((var > 0) & (var.T > 0))] = np.nan
+    ret[counts < max(min_periods, 2)] = np.nan
+    return ret
+
+
+def correlate_df(data_df, method="pearson", min_periods=2):
+    """Compute pairwise correlation or covariance of dataframe columns
+
+    :param DataFrame data_df: Timeseries data, one column per timeseries
+
+    See ``correlate`` for other parameters.
+
+    Returns an N x N dataframe indexed by columns.
+    """
+    return pd.DataFrame(
+        correlate(data_df.to_numpy(dtype=float), method, min_periods),
+        index=data_df.columns,
+        columns=data_df.columns,
+    )
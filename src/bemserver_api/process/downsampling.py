@@ -0,0 +1,106 @@
+"""Visual downsampling
+
+Reduce the number of points of a timeseries while preserving its visual shape.
+
+- lttb: Largest-Triangle-Three-Buckets. Keeps first and last points and, in each
+  bucket in between, the point forming the largest triangle with the point kept
+  in the previous bucket and the average of the next bucket.
+- minmax: min/max envelope. Keeps the minimum and the maximum of each bucket.
+
+Buckets contain the same number of points.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def lttb(x, y, max_points):
+    """Largest-Triangle-Three-Buckets downsampling
+
+    :param ndarray x: Abscissa (float), sorted
+    :param ndarray y: Values (float), without NaN
+    :param int max_points: Maximum number of points (>= 3)
+
+    Returns the sorted indices of the points to keep.
+    """
+    size = len(y)
+    if size <= max_points:
+        return np.arange(size)
+
+    # Bucket bounds for the points between first and last points
+    bounds = np.linspace(1, size - 1, max_points - 1).astype(np.int64)
+    counts = np.diff(bounds)
+    avg_x = np.add.reduceat(x[:-1], bounds[:-1]) / counts
+    avg_y = np.add.reduceat(y[:-1], bounds[:-1]) / counts
+    # Last bucket is followed by last point
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = prev = 0
+    indices[-1] = size - 1
+    for idx, (start, end) in enumerate(zip(bounds[:-1], bounds[1:]), start=1):
+        # Triangle area, up to a factor 2
+        areas = np.abs(
+            (x[prev] - avg_x[idx - 1]) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y[idx - 1] - y[prev])
+        )
+        indices[idx] = prev = start + np.argmax(areas)
+    return indices
+
+
+def minmax(x, y, max_points):
+    """Min/max envelope downsampling
+
+    :param ndarray x: Abscissa (float), sorted
+    :param ndarray y: Values (float), without NaN
+    :param int max_points: Maximum number of points (>= 2)
+
+    Returns the sorted indices of the points to keep.
+    """
+    size = len(y)
+    if size <= max_points:
+        return np.arange(size)
+
+    nb_buckets = max_points // 2
+    bounds = np.linspace(0, size, nb_buckets + 1).astype(np.int64)
+    bucket_ids = np.repeat(np.arange(nb_buckets), np.diff(bounds))
+
+    indices = []
+    for func in (np.minimum, np.maximum):
+        extrema = func.reduceat(y, bounds[:-1])
+        # First occurrence of the extremum in each bucket
+        candidates = np.flatnonzero(y == extrema[bucket_ids])
+        _, first = np.unique(bucket_ids[candidates], return_index=True)
+        indices.append(candidates[first])
+    return np.union1d(*indices)
+
+
+DOWNSAMPLING_METHODS = {
+    "lttb": lttb,
+    "minmax": minmax,
+}
+
+
+def downsample(data_df, max_points, method="lttb"):
+    """Downsample each timeseries of a dataframe
+
+    :param DataFrame data_df: Timeseries data, one column per timeseries
+    :param int max_points: Maximum number of points per timeseries
+    :param str method: Downsampling method, one of DOWNSAMPLING_METHODS
+
+    NaN values are ignored. Timeseries may end up with points at different
+    timestamps, in which case the returned dataframe contains NaN values.
+    """
+    func = DOWNSAMPLING_METHODS[method]
+    columns = {}
+    for col in data_df.columns:
+        ser = data_df[col].dropna()
+        if len(ser) > max_points:
+            x = (ser.index.asi8 - ser.index.asi8[0]).astype(float)
+            ser = ser.iloc[func(x, ser.to_numpy(dtype=float), max_points)]
+        columns[col] = ser
+    ret = pd.DataFrame(columns, columns=data_df.columns)
+    ret.index = ret.index.astype(data_df.index.dtype)
+    ret.index.name = data_df.index.name
+    return ret
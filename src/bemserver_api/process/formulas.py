@@ -0,0 +1,129 @@
+"""Timeseries formulas
+
+A formula computes a virtual timeseries from other timeseries, referenced by ID
+as ``ts_<id>``. E.g. ``ts_1 / ts_2`` or ``sqrt(ts_1 ** 2 + ts_2 ** 2)``.
+
+Formulas are parsed with ``ast``. Only numbers, arithmetic operators and
+FORMULA_FUNCTIONS are allowed. They are evaluated on numpy arrays, non-finite
+results (e.g. division by zero) being NaN.
+
+Since parsing, checking and evaluation are recursive, formula length and
+nesting depth are limited.
+"""
+
+import ast
+import re
+
+import numpy as np
+
+# Functions allowed in formulas and their number of arguments
+FORMULA_FUNCTIONS = {
+    "abs": (np.abs, 1),
+    "sqrt": (np.sqrt, 1),
+    "exp": (np.exp, 1),
+    "log": (np.log, 1),
+    "log10": (np.log10, 1),
+    "min": (np.minimum, 2),
+    "max": (np.maximum, 2),
+}
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+UNARY_OPERATORS = {
+    ast.UAdd: np.positive,
+    ast.USub: np.negative,
+}
+
+TIMESERIES_NAME_RE = re.compile(r"ts_(\d+)")
+
+MAX_FORMULA_LENGTH = 1000
+MAX_FORMULA_DEPTH = 100
+
+
+class FormulaError(ValueError):
+    """Invalid formula"""
+
+
+class Formula:
+    """Timeseries formula
+
+    :param str source: Formula
+
+    Raises FormulaError if the formula is invalid.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        if len(source) > MAX_FORMULA_LENGTH:
+            raise FormulaError(f"Formula longer than {MAX_FORMULA_LENGTH} characters")
+        try:
+            self._tree = ast.parse(source, mode="eval").body
+        except SyntaxError as exc:
+            raise FormulaError(f'Invalid formula "{source}": {exc.msg}') from exc
+        except (RecursionError, MemoryError) as exc:
+            raise FormulaError(f'Formula "{source}" is too complex') from exc
+        timeseries_ids = {}
+        self._check(self._tree, timeseries_ids)
+        # Unique IDs in order of appearance
+        self.timeseries_ids = list(timeseries_ids)
+
+    def _check(self, node, timeseries_ids, depth=0):
+        if depth > MAX_FORMULA_DEPTH:
+            raise FormulaError(f"Formula nested deeper than {MAX_FORMULA_DEPTH} levels")
+        if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+            self._check(node.left, timeseries_ids, depth + 1)
+            self._check(node.right, timeseries_ids, depth + 1)
+        elif isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+            self._check(node.operand, timeseries_ids, depth + 1)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.keywords:
+                raise FormulaError(f'Invalid function call in "{self.source}"')
+            if node.func.id not in FORMULA_FUNCTIONS:
+                raise FormulaError(f'Unknown function "{node.func.id}"')
+            if len(node.args) != FORMULA_FUNCTIONS[node.func.id][1]:
+                raise FormulaError(f'Wrong number of arguments for "{node.func.id}"')
+            for arg in node.args:
+                self._check(arg, timeseries_ids, depth + 1)
+        elif isinstance(node, ast.Name):
+            if (match := TIMESERIES_NAME_RE.fullmatch(node.id)) is None:
+                raise FormulaError(f'Unknown name "{node.id}"')
+            timeseries_ids[int(match.group(1))] = None
+        elif not (
+            isinstance(node, ast.Constant)
+            and isinstance(node.value, (int, float))
+            and not isinstance(node.value, bool)
+        ):
+            raise FormulaError(f'Invalid expression in "{self.source}"')
+
+    def _evaluate(self, node, inputs):
+        if isinstance(node, ast.BinOp):
+            return BINARY_OPERATORS[type(node.op)](
+                self._evaluate(node.left, inputs), self._evaluate(node.right, inputs)
+            )
+        if isinstance(node, ast.UnaryOp):
+            return UNARY_OPERATORS[type(node.op)](self._evaluate(node.operand, inputs))
+        if isinstance(node, ast.Call):
+            return FORMULA_FUNCTIONS[node.func.id][0](
+                *(self._evaluate(arg, inputs) for arg in node.args)
+            )
+        if isinstance(node, ast.Name):
+            return inputs[int(TIMESERIES_NAME_RE.fullmatch(node.id).group(1))]
+        return float(node.value)
+
+    def evaluate(self, inputs, size):
+        """Evaluate formula
+
+        :param dict inputs: Mapping of timeseries IDs to value arrays (float)
+        :param int size: Size of the arrays
+
+        Returns a float array.
+        """
+        with np.errstate(all="ignore"):
+            ret = np.broadcast_to(self._evaluate(self._tree, inputs), size)
+        return np.where(np.isfinite(ret), ret, np.nan)
@@ -0,0 +1,34 @@
+"""Time intervals
+
+Summarize sorted, non-overlapping time intervals on a bucket grid.
+"""
+
+import numpy as np
+
+
+def bucket_durations(starts, ends, edges):
+    """Compute the duration covered by intervals in each bucket
+
+    :param ndarray starts: Interval starts (float), sorted
+    :param ndarray ends: Interval ends (float)
+    :param ndarray edges: Bucket edges (float), sorted
+
+    Intervals must not overlap. Durations are in the unit of the inputs.
+
+    Returns a float array of size len(edges) - 1.
+    """
+    if not len(starts):
+        return np.zeros(max(len(edges) - 1, 0))
+    durations = ends - starts
+    cum_durations = np.concatenate(([0.0], np.cumsum(durations)))
+
+    # Duration covered from first interval start to each edge
+    idx = np.searchsorted(starts, edges, side="right") - 1
+    before_first = idx < 0
+    idx = np.maximum(idx, 0)
+    covered = np.where(
+        before_first,
+        0.0,
+        cum_durations[idx] + np.clip(edges - starts[idx], 0, durations[idx]),
+    )
+    return np.diff(covered)
@@ -0,0 +1,103 @@
+"""Resampling
+
+Align timeseries on a regular time grid.
+
+- ffill: previous value (as-of lookup).
+- linear: linear interpolation between previous and next values.
+- none: only values exactly on grid points.
+
+Values on grid points are always kept. If a maximum gap is passed, grid points
+are only filled from a previous value at most max gap before (ffill) or from
+values at most max gap apart (linear).
+"""
+
+import numpy as np
+import pandas as pd
+
+FILL_METHODS = ("ffill", "linear", "none")
+
+
+def resample_values(x, y, grid, method, max_gap=None):
+    """Compute values on grid points
+
+    :param ndarray x: Timestamps (int), sorted
+    :param ndarray y: Values (float), without NaN
+    :param ndarray grid: Grid timestamps (int), sorted
+    :param str method: Fill method, one of FILL_METHODS
+    :param int max_gap: Maximum gap, in timestamp unit
+
+    Returns a float array of grid size, NaN where no value can be computed.
+    """
+    ret = np.full(len(grid), np.nan)
+    size = len(x)
+    if not size:
+        return ret
+
+    # Last value at or before each grid point
+    prev = np.searchsorted(x, grid, side="right") - 1
+    has_prev = prev >= 0
+    prev = np.clip(prev, 0, None)
+    exact = has_prev & (x[prev] == grid)
+    ret[exact] = y[prev[exact]]
+    to_fill = has_prev & ~exact
+
+    if method == "ffill":
+        if max_gap is not None:
+            to_fill &= grid - x[prev] <= max_gap
+        ret[to_fill] = y[prev[to_fill]]
+    elif method == "linear":
+        to_fill &= prev + 1 < size
+        nxt = np.clip(prev + 1, None, size - 1)
+        if max_gap is not None:
+            to_fill &= x[nxt] - x[prev] <= max_gap
+        x_0, x_1 = x[prev[to_fill]], x[nxt[to_fill]]
+        y_0, y_1 = y[prev[to_fill]], y[nxt[to_fill]]
+        ret[to_fill] = y_0 + (y_1 - y_0) * (grid[to_fill] - x_0) / (x_1 - x_0)
+    return ret
+
+
+def make_grid(start_dt, end_dt, freq, timezone):
+    """Make a regular time grid
+
+    :param datetime start_dt: Time interval lower bound (tz-aware)
+    :param datetime end_dt: Time interval exclusive upper bound (tz-aware)
+    :param str freq: Grid step, as a fixed size pandas frequency
+    :param str timezone: IANA timezone of the grid
+
+    Grid points are aligned on the step, like fixed size buckets.
+    """
+    return pd.date_range(
+        pd.Timestamp(start_dt).ceil(freq),
+        end_dt,
+        freq=freq,
+        inclusive="left",
+        name="Datetime",
+    ).tz_convert(timezone)
+
+
+def resample(data_df, grid, fill, max_gap=None):
+    """Resample each timeseries of a dataframe on a time grid
+
+    :param DataFrame data_df: Timeseries data, one column per timeseries
+    :param DatetimeIndex grid: Time grid
+    :param dict fill: Mapping of columns to fill methods
+    :param timedelta max_gap: Maximum gap
+
+    Data should include values around the grid for edge points to be filled.
+    NaN values are ignored.
+    """
+    grid_ns = grid.as_unit("ns").asi8
+    max_gap_ns = None if max_gap is None else pd.Timedelta(max_gap).value
+    columns = {}
+    for col in data_df.columns:
+        ser = data_df[col].dropna()
+        columns[col] = resample_values(
+            ser.index.as_unit("ns").asi8,
+            ser.to_numpy(dtype=float),
+            grid_ns,
+            fill[col],
+            max_gap_ns,
+        )
+    ret = pd.DataFrame(columns, index=grid, columns=data_df.columns)
+    ret.index.name = data_df.index.name
+    return ret
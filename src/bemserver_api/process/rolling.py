@@ -0,0 +1,77 @@
+"""Rolling window functions
+
+Compute a function over a sliding time window ending at each output time. The
+window at time t is (t - window, t]. NaN values are ignored.
+
+Output times are either data timestamps or points of a time grid. In both
+cases, data should include values from one window before the first output time
+(warm-up).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Rolling functions: pandas Rolling method
+ROLLING_FUNCTIONS = {
+    "avg": "mean",
+    "sum": "sum",
+    "min": "min",
+    "max": "max",
+    "count": "count",
+}
+
+
+def rolling_values(ser, window, function, grid=None):
+    """Compute a rolling window function on a timeseries
+
+    :param Series ser: Timeseries data, without NaN, sorted
+    :param timedelta window: Window length
+    :param str function: Rolling function, one of ROLLING_FUNCTIONS
+    :param DatetimeIndex grid: Output times. If None, output at data timestamps.
+
+    Returns a float array of data or grid size.
+    """
+    method = ROLLING_FUNCTIONS[function]
+    if grid is None:
+        return getattr(ser.rolling(window), method)().to_numpy(dtype=float)
+    # Grid points are inserted as NaN after data values at the same time, so
+    # that windows ending at a grid point include data at that time
+    times = np.concatenate(
+        (pd.DatetimeIndex(ser.index).as_unit("ns").asi8, grid.as_unit("ns").asi8)
+    )
+    order = np.argsort(times, kind="stable")
+    values = np.concatenate((ser.to_numpy(dtype=float), np.full(len(grid), np.nan)))
+    ret = getattr(
+        pd.Series(values[order], index=pd.DatetimeIndex(times[order])).rolling(window),
+        method,
+    )()
+    return ret.to_numpy(dtype=float)[order >= len(ser)]
+
+
+def rolling(data_df, window, function, start_dt, grid=None):
+    """Compute a rolling window function on each timeseries of a dataframe
+
+    :param DataFrame data_df: Timeseries data, one column per timeseries,
+        including warm-up data
+    :param timedelta window: Window length
+    :param str function: Rolling function, one of ROLLING_FUNCTIONS
+    :param datetime start_dt: First output time, for output at data timestamps
+    :param DatetimeIndex grid: Output times. If None, output at data timestamps
+        from start_dt, NaN where a timeseries has no value.
+    """
+    columns = {}
+    for col in data_df.columns:
+        ser = data_df[col].dropna()
+        values = rolling_values(ser, window, function, grid)
+        columns[col] = (
+            values
+            if grid is not None
+            else pd.Series(values, index=ser.index).reindex(data_df.index)
+        )
+    if grid is not None:
+        ret = pd.DataFrame(columns, index=grid, columns=data_df.columns)
+    else:
+        ret = pd.DataFrame(columns, index=data_df.index, columns=data_df.columns)
+        ret = ret[ret.index >= start_dt]
+    ret.index.name = data_df.index.name
+    return ret
@@ -3,7 +3,10 @@
 from bemserver_api import Blueprint
 
 from .completeness.routes import blp as completeness_blp
+from .correlation.routes import blp as correlation_blp
 from .energy_consumption.routes import blp as energy_consumption_blp
+from .gaps.routes import blp as gaps_blp
+from .threshold.routes import blp as threshold_blp
 
 blp = Blueprint(
     "Analysis", __name__, url_prefix="/analysis", description="Data analysis operations"
@@ -11,7 +14,10 @@ blp = Blueprint(
 
 
 blp.register_blueprint(completeness_blp)
+blp.register_blueprint(correlation_blp)
 blp.register_blueprint(energy_consumption_blp)
+blp.register_blueprint(gaps_blp)
+blp.register_blueprint(threshold_blp)
 
 
 def register_blueprints(api):
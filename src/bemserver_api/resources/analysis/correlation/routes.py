@@ -0,0 +1,59 @@
+"""Correlation resources"""
+
+from flask_smorest import abort
+
+from bemserver_core.exceptions import TimeseriesNotFoundError
+from bemserver_core.model import Timeseries, TimeseriesDataState
+
+from bemserver_api import Blueprint
+from bemserver_api.input_output import tsdbucketsio
+from bemserver_api.process import correlate_df
+
+from .schemas import CorrelationQueryArgsSchema, CorrelationSchema
+
+blp = Blueprint(
+    "Correlation",
+    __name__,
+    url_prefix="/correlation",
+    description="Correlation operations",
+)
+
+
+@blp.route("")
+@blp.login_required
+@blp.etag
+@blp.arguments(CorrelationQueryArgsSchema, location="query")
+@blp.response(200, CorrelationSchema)
+def get_correlation(args):
+    """Get timeseries data correlation matrix
+
+    Timeseries are aggregated on buckets, then the correlation (or covariance)
+    of each pair of timeseries is computed over the buckets where both have
+    a value.
+    """
+    try:
+        timeseries = Timeseries.get_many_by_id(args["timeseries"])
+    except TimeseriesNotFoundError as exc:
+        abort(422, message=str(exc))
+    if (data_state := TimeseriesDataState.get_by_id(args["data_state"])) is None:
+        abort(422, errors={"query": {"data_state": "Unknown data state ID"}})
+
+    data_df = tsdbucketsio.get_timeseries_buckets_data(
+        args["start_time"],
+        args["end_time"],
+        timeseries,
+        data_state,
+        args["bucket_width_value"],
+        args["bucket_width_unit"],
+        [args["aggregation"]],
+        timezone=args["timezone"],
+    )
+    corr_df = correlate_df(data_df, args["method"], args["min_periods"])
+
+    return {
+        "timeseries": [ts.id for ts in timeseries],
+        "matrix": corr_df.astype(object)
+        .where(corr_df.notnull(), None)
+        .to_numpy()
+        .tolist(),
+    }
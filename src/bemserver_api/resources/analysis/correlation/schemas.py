@@ -0,0 +1,88 @@
+"""Correlation API schemas"""
+
+import marshmallow as ma
+
+from bemserver_api import Schema
+from bemserver_api.extensions import ma_fields
+from bemserver_api.process import CORRELATION_METHODS
+from bemserver_api.resources.timeseries_data.schemas import (
+    TimeseriesBucketWidthSchema,
+    validate_aggregation,
+)
+
+
+class CorrelationSchema(Schema):
+    timeseries = ma.fields.List(
+        ma.fields.Integer(),
+        metadata={
+            "description": "Timeseries IDs, in matrix row and column order",
+        },
+    )
+    matrix = ma.fields.List(
+        ma.fields.List(ma.fields.Float(allow_none=True)),
+        metadata={
+            "description": (
+                "Correlation or covariance matrix. Null if there are not enough "
+                "common buckets or if a timeseries is constant (correlation)."
+            ),
+        },
+    )
+
+
+class CorrelationQueryArgsSchema(TimeseriesBucketWidthSchema):
+    start_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "Initial datetime",
+        },
+    )
+    end_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "End datetime (excluded from the interval)",
+        },
+    )
+    timeseries = ma.fields.List(
+        ma.fields.Int(),
+        required=True,
+        validate=ma.validate.Length(min=1),
+        metadata={
+            "description": "List of timeseries ID",
+        },
+    )
+    data_state = ma.fields.Int(
+        required=True,
+        metadata={
+            "description": "Data state ID",
+        },
+    )
+    timezone = ma_fields.Timezone(
+        load_default="UTC",
+        metadata={
+            "description": "Timezone to use for the aggregation",
+        },
+    )
+    aggregation = ma.fields.String(
+        load_default="avg",
+        validate=validate_aggregation,
+        metadata={
+            "description": "Aggregation function used to align timeseries on buckets",
+        },
+    )
+    method = ma.fields.String(
+        load_default="pearson",
+        validate=ma.validate.OneOf(CORRELATION_METHODS),
+        metadata={
+            "description": (
+                "pearson: Pearson correlation coefficient. "
+                "covariance: sample covariance."
+            ),
+        },
+    )
+    min_periods = ma.fields.Int(
+        load_default=2,
+        validate=ma.validate.Range(min=2),
+        metadata={
+            "description": "Minimum number of common buckets for a pair of timeseries",
+        },
+    )
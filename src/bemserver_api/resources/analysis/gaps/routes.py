@@ -0,0 +1,71 @@
+"""Gaps resources"""
+
+from flask_smorest import abort
+
+from bemserver_core.exceptions import TimeseriesNotFoundError
+from bemserver_core.model import Timeseries, TimeseriesDataState
+
+from bemserver_api import Blueprint
+from bemserver_api.input_output import tsdgapsio
+
+from .schemas import GapsQueryArgsSchema, GapsSchema
+
+blp = Blueprint(
+    "Gaps",
+    __name__,
+    url_prefix="/gaps",
+    description="Data gaps operations",
+)
+
+
+@blp.route("")
+@blp.login_required
+@blp.etag
+@blp.arguments(GapsQueryArgsSchema, location="query")
+@blp.response(200, GapsSchema)
+def get_gaps(args):
+    """Get timeseries data gaps
+
+    Returns, for each timeseries, the intervals between consecutive samples
+    that are longer than the sample interval.
+
+    If the theoretical time interval for a timeseries is not defined in database,
+    it is inferred from the median interval between samples. If it can't be
+    inferred, any interval between samples is a gap.
+
+    If a timeseries has no data, the whole time interval is a gap.
+
+    Gaps shorter than min_duration are ignored.
+    """
+    try:
+        timeseries = Timeseries.get_many_by_id(args["timeseries"])
+    except TimeseriesNotFoundError as exc:
+        abort(422, message=str(exc))
+    if (data_state := TimeseriesDataState.get_by_id(args["data_state"])) is None:
+        abort(422, errors={"query": {"data_state": "Unknown data state ID"}})
+
+    gaps = tsdgapsio.get_timeseries_gaps(
+        args["start_time"],
+        args["end_time"],
+        timeseries,
+        data_state,
+        min_duration=args.get("min_duration"),
+        timezone=args["timezone"],
+    )
+
+    ret = {}
+    for ts in timeseries:
+        ts_gaps = gaps[ts.id]
+        durations = [(end - start).total_seconds() for start, end in ts_gaps["gaps"]]
+        ret[str(ts.id)] = {
+            "name": ts.name,
+            "interval": ts_gaps["interval"],
+            "undefined_interval": ts_gaps["undefined_interval"],
+            "gaps": [
+                {"start_time": start, "end_time": end, "duration": duration}
+                for (start, end), duration in zip(ts_gaps["gaps"], durations)
+            ],
+            "total_duration": sum(durations),
+        }
+
+    return {"timeseries": ret}
@@ -0,0 +1,105 @@
+"""Gaps API schemas"""
+
+import marshmallow as ma
+
+from bemserver_api import Schema
+from bemserver_api.extensions import ma_fields
+
+
+class GapSchema(Schema):
+    start_time = ma_fields.AwareDateTime(
+        metadata={
+            "description": "Gap start datetime (previous sample or interval start)",
+        },
+    )
+    end_time = ma_fields.AwareDateTime(
+        metadata={
+            "description": "Gap end datetime (next sample or interval end)",
+        },
+    )
+    duration = ma.fields.Float(
+        metadata={
+            "description": "Gap duration (seconds)",
+        },
+    )
+
+
+class TimeseriesGapsSchema(Schema):
+    name = ma.fields.String(
+        metadata={
+            "description": "Timeseries name",
+        },
+    )
+    interval = ma.fields.Float(
+        allow_none=True,
+        metadata={
+            "description": "Interval between samples (seconds), defined or inferred",
+        },
+    )
+    undefined_interval = ma.fields.Boolean(
+        metadata={
+            "description": "Whether the interval was not defined",
+        },
+    )
+    gaps = ma.fields.List(
+        ma.fields.Nested(GapSchema),
+        metadata={
+            "description": "Gaps, sorted by start time",
+        },
+    )
+    total_duration = ma.fields.Float(
+        metadata={
+            "description": "Total duration of gaps (seconds)",
+        },
+    )
+
+
+class GapsSchema(Schema):
+    timeseries = ma.fields.Dict(
+        keys=ma.fields.String(metadata={"description": "Timeseries ID"}),
+        values=ma.fields.Nested(TimeseriesGapsSchema),
+    )
+
+
+class GapsQueryArgsSchema(Schema):
+    start_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "Initial datetime",
+        },
+    )
+    end_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "End datetime (excluded from the interval)",
+        },
+    )
+    timeseries = ma.fields.List(
+        ma.fields.Int(),
+        required=True,
+        validate=ma.validate.Length(min=1),
+        metadata={
+            "description": "List of timeseries ID",
+        },
+    )
+    data_state = ma.fields.Int(
+        required=True,
+        metadata={
+            "description": "Data state ID",
+        },
+    )
+    timezone = ma_fields.Timezone(
+        load_default="UTC",
+        metadata={
+            "description": "Timezone to use for gap bounds",
+        },
+    )
+    min_duration = ma.fields.Float(
+        validate=ma.validate.Range(min=0),
+        metadata={
+            "description": (
+                "Minimum gap duration (seconds). "
+                "Gaps must also be longer than the timeseries interval."
+            ),
+        },
+    )
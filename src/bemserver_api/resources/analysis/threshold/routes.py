@@ -0,0 +1,93 @@
+"""Threshold resources"""
+
+from zoneinfo import ZoneInfo
+
+from flask_smorest import abort
+
+import numpy as np
+import pandas as pd
+
+from bemserver_core.exceptions import TimeseriesNotFoundError
+from bemserver_core.model import Timeseries, TimeseriesDataState
+from bemserver_core.time_utils import ceil, floor, make_pandas_freq
+
+from bemserver_api import Blueprint
+from bemserver_api.input_output import tsdvaluefilterio
+from bemserver_api.process import bucket_durations
+
+from .schemas import ThresholdQueryArgsSchema, ThresholdSchema
+
+blp = Blueprint(
+    "Threshold",
+    __name__,
+    url_prefix="/threshold",
+    description="Threshold operations",
+)
+
+
+@blp.route("")
+@blp.login_required
+@blp.etag
+@blp.arguments(ThresholdQueryArgsSchema, location="query")
+@blp.response(200, ThresholdSchema)
+def get_threshold(args):
+    """Get time spent by timeseries values in a range
+
+    Returns, for each timeseries, the contiguous intervals during which values
+    are in the range and the duration of these intervals in each bucket.
+
+    Each value is valid until the next sample. The time interval is extended
+    to complete buckets.
+    """
+    try:
+        timeseries = Timeseries.get_many_by_id(args["timeseries"])
+    except TimeseriesNotFoundError as exc:
+        abort(422, message=str(exc))
+    if (data_state := TimeseriesDataState.get_by_id(args["data_state"])) is None:
+        abort(422, errors={"query": {"data_state": "Unknown data state ID"}})
+
+    tz_info = ZoneInfo(args["timezone"])
+    bucket_width_value = args["bucket_width_value"]
+    bucket_width_unit = args["bucket_width_unit"]
+    start_dt = floor(
+        args["start_time"].astimezone(tz_info), bucket_width_unit, bucket_width_value
+    )
+    end_dt = ceil(
+        args["end_time"].astimezone(tz_info), bucket_width_unit, bucket_width_value
+    )
+    timestamps = pd.date_range(
+        start_dt,
+        end_dt,
+        freq=make_pandas_freq(bucket_width_unit, bucket_width_value),
+        tz=tz_info,
+        inclusive="left",
+    )
+    # Bucket edges, in seconds
+    edges = np.append(timestamps.asi8, pd.Timestamp(end_dt).value) / 1e9
+
+    intervals = tsdvaluefilterio.get_timeseries_intervals(
+        start_dt,
+        end_dt,
+        timeseries,
+        data_state,
+        min_value=args.get("min_value"),
+        max_value=args.get("max_value"),
+        timezone=args["timezone"],
+    )
+
+    ret = {}
+    for ts_id, ts_intervals in intervals.items():
+        durations = bucket_durations(
+            np.array([start.timestamp() for start, _ in ts_intervals]),
+            np.array([end.timestamp() for _, end in ts_intervals]),
+            edges,
+        )
+        ret[str(ts_id)] = {
+            "intervals": [
+                {"start_time": start, "end_time": end} for start, end in ts_intervals
+            ],
+            "durations": durations.tolist(),
+            "total_duration": float(durations.sum()),
+        }
+
+    return {"timestamps": timestamps.to_list(), "timeseries": ret}
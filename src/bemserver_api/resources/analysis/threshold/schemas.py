@@ -0,0 +1,110 @@
+"""Threshold API schemas"""
+
+import marshmallow as ma
+
+from bemserver_api import Schema
+from bemserver_api.extensions import ma_fields
+from bemserver_api.resources.timeseries_data.schemas import TimeseriesBucketWidthSchema
+
+
+class IntervalSchema(Schema):
+    start_time = ma_fields.AwareDateTime(
+        metadata={
+            "description": "Interval start datetime",
+        },
+    )
+    end_time = ma_fields.AwareDateTime(
+        metadata={
+            "description": "Interval end datetime",
+        },
+    )
+
+
+class TimeseriesThresholdSchema(Schema):
+    intervals = ma.fields.List(
+        ma.fields.Nested(IntervalSchema),
+        metadata={
+            "description": "Contiguous intervals during which values are in range",
+        },
+    )
+    durations = ma.fields.List(
+        ma.fields.Float(),
+        metadata={
+            "description": "Duration (seconds) of values in range for each bucket",
+        },
+    )
+    total_duration = ma.fields.Float(
+        metadata={
+            "description": "Total duration (seconds) of values in range",
+        },
+    )
+
+
+class ThresholdSchema(Schema):
+    timestamps = ma.fields.List(
+        ma_fields.AwareDateTime,
+        metadata={
+            "description": "Time index (value is bucket start time)",
+        },
+    )
+    timeseries = ma.fields.Dict(
+        keys=ma.fields.String(metadata={"description": "Timeseries ID"}),
+        values=ma.fields.Nested(TimeseriesThresholdSchema),
+    )
+
+
+class ThresholdQueryArgsSchema(TimeseriesBucketWidthSchema):
+    start_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "Initial datetime",
+        },
+    )
+    end_time = ma_fields.AwareDateTime(
+        required=True,
+        metadata={
+            "description": "End datetime (excluded from the interval)",
+        },
+    )
+    timeseries = ma.fields.List(
+        ma.fields.Int(),
+        required=True,
+        validate=ma.validate.Length(min=1),
+        metadata={
+            "description": "List of timeseries ID",
+        },
+    )
+    data_state = ma.fields.Int(
+        required=True,
+        metadata={
+            "description": "Data state ID",
+        },
+    )
+    timezone = ma_fields.Timezone(
+        load_default="UTC",
+        metadata={
+            "description": "Timezone to use for the buckets",
+        },
+    )
+    min_value = ma.fields.Float(
+        allow_nan=False,
+        metadata={
+            "description": "Range lower bound (included)",
+        },
+    )
+    max_value = ma.fields.Float(
+        allow_nan=False,
+        metadata={
+            "description": "Range upper bound (included)",
+        },
+    )
+
+    @ma.validates_schema
+    def validate_range(self, data, **kwargs):
+        if "min_value" not in data and "max_value" not in data:
+            raise ma.ValidationError("min_value or max_value must be provided.")
+        if data.get("min_value", -float("inf")) > data.get("max_value", float("inf")):
+            raise ma.ValidationError(
+                "min_value must be lower than or equal to max_value.",
+                field_name="min_value",
+            )
@@ -1,11 +1,27 @@
 """Timeseries data resources"""
 
+import datetime as dt
+import functools
+import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
+from zoneinfo import ZoneInfo
+
+import sqlalchemy as sqla
 
 import flask
 
 from flask_smorest import abort
 
+import pandas as pd
+
+from bemserver_core.authorization import (
+    CurrentUser,
+    OpenBar,
+    auth,
+    get_current_user,
+)
 from bemserver_core.database import db
 from bemserver_core.exceptions import (
     BEMServerCoreDimensionalityError,
@@ -13,20 +29,65 @@ from bemserver_core.exceptions import (
     TimeseriesNotFoundError,
 )
 from bemserver_core.input_output import tsdcsvio, tsdio, tsdjsonio
-from bemserver_core.model import Campaign, Timeseries, TimeseriesDataState
+from bemserver_core.input_output.timeseries_data_io import (
+    AGGREGATION_FUNCTIONS as CORE_AGGREGATION_FUNCTIONS,
+)
+from bemserver_core.model import (
+    Campaign,
+    Timeseries,
+    TimeseriesDataState,
+    TimeseriesPropertyData,
+    User,
+)
+from bemserver_core.time_utils import ceil, floor, make_pandas_freq
 
 from bemserver_api import Blueprint
+from bemserver_api.extensions.aggregate_cache import aggregate_cache
+from bemserver_api.extensions.rollups import rollups
+from bemserver_api.extensions.stats_summaries import stats_summaries
+from bemserver_api.extensions.virtual_timeseries import virtual_timeseries
+from bemserver_api.extensions.watermarks import watermarks
+from bemserver_api.input_output import (
+    ARROW_STREAM_MIME_TYPE,
+    SAMPLE_AGGREGATIONS,
+    tsdarrowio,
+    tsdasofio,
+    tsdbucketsio,
+    tsdcompactjsonio,
+    tsdfio,
+    tsdformulaio,
+    tsdhistogramio,
+    tsdlatestio,
+    tsdprofileio,
+    tsdstatsio,
+    tsdstreamio,
+    tsdvaluefilterio,
+)
+from bemserver_api.process import downsample, make_grid, resample, rolling
+from bemserver_api.process.formulas import FormulaError
 
 from .schemas import (
+    TIMESERIES_SELECTOR_FIELDS,
     TimeseriesDataDeleteByIDQueryArgsSchema,
     TimeseriesDataDeleteByNameQueryArgsSchema,
     TimeseriesDataGetByIDAggregateQueryArgsSchema,
     TimeseriesDataGetByIDQueryArgsSchema,
     TimeseriesDataGetByNameAggregateQueryArgsSchema,
     TimeseriesDataGetByNameQueryArgsSchema,
+    TimeseriesDataGetHistogramByIDQueryArgsSchema,
+    TimeseriesDataGetHistogramByNameQueryArgsSchema,
+    TimeseriesDataGetLatestByIDQueryArgsSchema,
+    TimeseriesDataGetLatestByNameQueryArgsSchema,
+    TimeseriesDataGetProfileByIDQueryArgsSchema,
+    TimeseriesDataGetProfileByNameQueryArgsSchema,
     TimeseriesDataGetStatsByIDBaseQueryArgsSchema,
     TimeseriesDataGetStatsByNameBaseQueryArgsSchema,
+    TimeseriesDataHistogramsByIDSchema,
+    TimeseriesDataHistogramsByNameSchema,
     TimeseriesDataPostQueryArgsSchema,
+    TimeseriesDataProfilesByIDSchema,
+    TimeseriesDataProfilesByNameSchema,
+    TimeseriesDataQueriesSchema,
     TimeseriesDataStatsByIDSchema,
     TimeseriesDataStatsByNameSchema,
 )
@@ -87,6 +148,95 @@ STATS_BY_NAME_EXAMPLE = dedent(
 )
 
 
+LATEST_BY_ID_EXAMPLE = dedent(
+    """\
+    {
+        "1": {
+            "2020-01-01T20:00:00+00:00": 0.3,
+        },
+        "2": {
+            "2020-01-01T20:00:00+00:00": 1.3,
+        },
+    }"""
+)
+
+LATEST_BY_NAME_EXAMPLE = dedent(
+    """\
+    {
+        "Timeseries 1": {
+            "2020-01-01T20:00:00+00:00": 0.3,
+        },
+        "Timeseries 2": {
+            "2020-01-01T20:00:00+00:00": 1.3,
+        },
+    }"""
+)
+
+
+HISTOGRAMS_BY_ID_EXAMPLE = dedent(
+    """\
+    {
+        "histograms":
+        {
+            "1": {
+                "edges": [0.0, 10.0, 20.0, 30.0],
+                "counts": [12, 42, 3],
+            },
+            "2": {
+                "edges": [15.0, 20.0, 25.0, 30.0],
+                "counts": [6, 9, 1],
+            },
+        },
+    }"""
+)
+
+HISTOGRAMS_BY_NAME_EXAMPLE = dedent(
+    """\
+    {
+        "histograms":
+        {
+            "Timeseries 1": {
+                "edges": [0.0, 10.0, 20.0, 30.0],
+                "counts": [12, 42, 3],
+            },
+            "Timeseries 2": {
+                "edges": [15.0, 20.0, 25.0, 30.0],
+                "counts": [6, 9, 1],
+            },
+        },
+    }"""
+)
+
+
+PROFILES_BY_ID_EXAMPLE = dedent(
+    """\
+    {
+        "profiles":
+        {
+            "1": [
+                [12.0, 11.5, 11.0, ..., 14.0],
+                ...
+                [10.0, 9.5, 9.0, ..., 12.0],
+            ],
+        },
+    }"""
+)
+
+PROFILES_BY_NAME_EXAMPLE = dedent(
+    """\
+    {
+        "profiles":
+        {
+            "Timeseries 1": [
+                [12.0, 11.5, 11.0, ..., 14.0],
+                ...
+                [10.0, 9.5, 9.0, ..., 12.0],
+            ],
+        },
+    }"""
+)
+
+
 PAYLOAD_BY_ID_JSON_EXAMPLE = dedent(
     """\
     {
@@ -146,6 +296,24 @@ PAYLOAD_BY_NAME_CSV_EXAMPLE = dedent(
 )
 
 
+QUERY_EXAMPLE = dedent(
+    """\
+    [
+        {
+            "1": {
+                "2020-01-01T00:00:00+00:00": 0.1,
+                "2020-01-01T10:00:00+00:00": 0.2,
+            },
+        },
+        {
+            "Timeseries 1": {
+                "2020-01-01T00:00:00+00:00": 0.15,
+            },
+        },
+    ]"""
+)
+
+
 def _get_data_state(data_state_id):
     return TimeseriesDataState.get_by_id(data_state_id) or abort(
         422, errors={"query": {"data_state": "Unknown data state ID"}}
@@ -166,6 +334,620 @@ def _get_many_timeseries_by_name(campaign, timeseries_ids):
         abort(422, message=str(exc))
 
 
+def _select_timeseries(args):
+    """Get timeseries from ID list or from selector parameters
+
+    Timeseries matching the selector are resolved in a single query joining
+    structural elements and property data.
+
+    Core data functions take timeseries objects, so the selector is resolved
+    by its own query before the data query rather than inside it. Both queries
+    don't share a snapshot: a timeseries or property value changed in between
+    is seen by the selector but not by the data query, or conversely.
+    """
+    if "timeseries" in args:
+        return _get_many_timeseries_by_id(args["timeseries"])
+    query = Timeseries.get(
+        **{field: args[field] for field in TIMESERIES_SELECTOR_FIELDS if field in args}
+    )
+    for prop_id, prop_value in zip(
+        args.get("property_id", []), args.get("property_value", [])
+    ):
+        tspd = sqla.orm.aliased(TimeseriesPropertyData)
+        query = query.join(
+            tspd,
+            sqla.and_(
+                tspd.timeseries_id == Timeseries.id,
+                tspd.property_id == prop_id,
+                tspd.value == prop_value,
+            ),
+        )
+    return query.order_by(Timeseries.id).all()
+
+
+def _get_formulas(timeseries):
+    """Get formulas of virtual timeseries"""
+    try:
+        return virtual_timeseries.get_formulas(timeseries)
+    except FormulaError as exc:
+        abort(422, message=str(exc))
+
+
+def _get_sources(timeseries, formulas):
+    """Get timeseries whose data is used, including formula inputs"""
+    try:
+        return virtual_timeseries.get_sources(timeseries, formulas)
+    except FormulaError as exc:
+        abort(422, message=str(exc))
+
+
+def _get_timeseries_data(
+    start_dt,
+    end_dt,
+    timeseries,
+    data_state,
+    formulas,
+    *,
+    min_value=None,
+    max_value=None,
+    **kwargs,
+):
+    """Get timeseries data, including virtual timeseries
+
+    If min_value or max_value is passed, only values in this range are
+    returned. The range is evaluated in the database, except for virtual
+    timeseries whose values are only known once computed.
+    """
+    value_range = min_value is not None or max_value is not None
+    if formulas:
+        data_df = tsdformulaio.get_timeseries_data(
+            start_dt, end_dt, timeseries, data_state, formulas, **kwargs
+        )
+        if value_range:
+            data_df = data_df.where(
+                data_df.ge(-math.inf if min_value is None else min_value)
+                & data_df.le(math.inf if max_value is None else max_value)
+            ).dropna(how="all")
+        return data_df
+    if value_range:
+        return tsdvaluefilterio.get_timeseries_data(
+            start_dt,
+            end_dt,
+            timeseries,
+            data_state,
+            min_value=min_value,
+            max_value=max_value,
+            **kwargs,
+        )
+    return tsdio.get_timeseries_data(start_dt, end_dt, timeseries, data_state, **kwargs)
+
+
+def _stream_response(chunks, mime_type):
+    """Build a streamed response from a generator of chunks
+
+    The generator is consumed after the view function returns, so the current
+    user is captured here and set again while iterating.
+    """
+    user = get_current_user()
+
+    def generate():
+        with CurrentUser(user):
+            yield from chunks
+
+    return flask.Response(flask.stream_with_context(generate()), mimetype=mime_type)
+
+
+def _get_mime_type():
+    """Get response mime type from Accept header
+
+    Aborts if Arrow format is requested but not available.
+    """
+    mime_type = flask.request.headers.get("Accept", "application/json")
+    if mime_type == ARROW_STREAM_MIME_TYPE and not tsdarrowio.is_available():
+        abort(406, message="Arrow format not available.")
+    return mime_type
+
+
+def _export_data_df(args, data_df, mime_type, *, dropna):
+    """Export a timeseries dataframe in the requested format"""
+    json_export_func = (
+        functools.partial(
+            tsdfio.export_compact_json, epoch_timestamps=args["epoch_timestamps"]
+        )
+        if args["compact"]
+        else functools.partial(tsdfio.export_json, dropna=dropna)
+    )
+    export_func = {
+        "text/csv": tsdfio.export_csv,
+        ARROW_STREAM_MIME_TYPE: functools.partial(
+            tsdfio.export_arrow, timezone=args["timezone"]
+        ),
+    }.get(mime_type, json_export_func)
+    return export_func(data_df)
+
+
+def _get_resampled_data(args, timeseries, data_state, formulas, **kwargs):
+    """Get timeseries data resampled on a regular grid
+
+    Data is queried along with the last sample before and the first sample
+    after the interval, whatever their age, to fill edge points. Fill is only
+    limited by max gap, if any.
+
+    Virtual timeseries values only exist where their inputs are aligned, so
+    their data is queried with a margin (max gap or one step) around the
+    interval instead.
+    """
+    unit, value = args["resample_step_unit"], args["resample_step_value"]
+    max_gap = dt.timedelta(seconds=args["max_gap"]) if "max_gap" in args else None
+    col_label = kwargs["col_label"]
+    labels = [getattr(ts, col_label) for ts in timeseries]
+    data_dfs = [
+        tsdasofio.get_timeseries_data(
+            args["start_time"],
+            args["end_time"],
+            [ts for ts in timeseries if ts.id not in formulas],
+            data_state,
+            **kwargs,
+        )
+    ]
+    if formulas:
+        margin = max_gap or dt.timedelta(**{f"{unit}s": value})
+        data_dfs.append(
+            tsdformulaio.get_timeseries_data(
+                args["start_time"] - margin,
+                args["end_time"] + margin,
+                [ts for ts in timeseries if ts.id in formulas],
+                data_state,
+                formulas,
+                **kwargs,
+            )
+        )
+    data_df = pd.concat(data_dfs, axis=1).reindex(columns=labels).sort_index()
+    fill = args["fill"] * len(timeseries) if len(args["fill"]) == 1 else args["fill"]
+    grid = make_grid(
+        args["start_time"],
+        args["end_time"],
+        make_pandas_freq(unit, value),
+        args["timezone"],
+    )
+    return resample(data_df, grid, dict(zip(labels, fill)), max_gap)
+
+
+def _get_rolling_data(args, timeseries, data_state, formulas, **kwargs):
+    """Get rolling window function of timeseries data
+
+    Data is queried from one window before the interval, for the first windows.
+    """
+    unit, value = args["rolling_window_unit"], args["rolling_window_value"]
+    window = dt.timedelta(**{f"{unit}s": value})
+    data_df = _get_timeseries_data(
+        args["start_time"] - window,
+        args["end_time"],
+        timeseries,
+        data_state,
+        formulas,
+        **kwargs,
+    )
+    grid = (
+        make_grid(
+            args["start_time"],
+            args["end_time"],
+            make_pandas_freq(args["rolling_step_unit"], args["rolling_step_value"]),
+            args["timezone"],
+        )
+        if "rolling_step_unit" in args
+        else None
+    )
+    return rolling(data_df, window, args["rolling_function"], args["start_time"], grid)
+
+
+def _export_data(args, timeseries, data_state, mime_type, *, col_label):
+    """Export timeseries data in the requested format, without streaming
+
+    Doesn't depend on request context so that it can be run in a worker thread.
+    """
+    kwargs = {
+        "convert_to": args.get("convert_to"),
+        "timezone": args["timezone"],
+        "col_label": col_label,
+    }
+    formulas = _get_formulas(timeseries)
+
+    try:
+        if "resample_step_unit" in args:
+            data_df = _get_resampled_data(
+                args, timeseries, data_state, formulas, **kwargs
+            )
+            return _export_data_df(args, data_df, mime_type, dropna=False)
+        if "rolling_window_unit" in args:
+            data_df = _get_rolling_data(
+                args, timeseries, data_state, formulas, **kwargs
+            )
+            if "max_points" in args:
+                data_df = downsample(data_df, args["max_points"], args["downsampling"])
+            return _export_data_df(
+                args, data_df, mime_type, dropna="rolling_step_unit" not in args
+            )
+        value_range = "min_value" in args or "max_value" in args
+        if "max_points" in args or formulas or value_range:
+            data_df = _get_timeseries_data(
+                args["start_time"],
+                args["end_time"],
+                timeseries,
+                data_state,
+                formulas,
+                min_value=args.get("min_value"),
+                max_value=args.get("max_value"),
+                **kwargs,
+            )
+            if "max_points" in args:
+                data_df = downsample(data_df, args["max_points"], args["downsampling"])
+            return _export_data_df(args, data_df, mime_type, dropna=True)
+        json_export_func = (
+            functools.partial(
+                tsdcompactjsonio.export_json,
+                epoch_timestamps=args["epoch_timestamps"],
+            )
+            if args["compact"]
+            else tsdjsonio.export_json
+        )
+        export_func = {
+            "text/csv": tsdcsvio.export_csv,
+            ARROW_STREAM_MIME_TYPE: tsdarrowio.export_arrow,
+        }.get(mime_type, json_export_func)
+        return export_func(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            **kwargs,
+        )
+    except (BEMServerCoreDimensionalityError, FormulaError) as exc:
+        abort(422, message=str(exc))
+
+
+def _export_aggregate_data(args, timeseries, data_state, mime_type, *, col_label):
+    """Export aggregated timeseries data in the requested format, using cache
+
+    Doesn't depend on request context so that it can be run in a worker thread.
+    """
+    export = functools.partial(
+        _compute_aggregate_data,
+        args,
+        timeseries,
+        data_state,
+        mime_type,
+        col_label=col_label,
+    )
+    if not aggregate_cache.enabled:
+        return export()
+
+    aggregations = args["aggregation"]
+    bucket_width_value = args["bucket_width_value"]
+    bucket_width_unit = args["bucket_width_unit"]
+    tz_info = ZoneInfo(args["timezone"])
+
+    # Sample aggregations depend on last value before the interval, and on
+    # current time if the interval is not over
+    sample_aggregations = any(agg in SAMPLE_AGGREGATIONS for agg in aggregations)
+    if sample_aggregations and args["end_time"] > dt.datetime.now(tz=dt.timezone.utc):
+        return export()
+
+    # Permissions are checked when computing the result, not when reading cache
+    formulas = _get_formulas(timeseries)
+    sources = _get_sources(timeseries, formulas)
+    for ts in (*timeseries, *sources):
+        auth.authorize(get_current_user(), "read_data", ts)
+
+    start = (
+        -math.inf
+        if sample_aggregations
+        else floor(
+            args["start_time"].astimezone(tz_info),
+            bucket_width_unit,
+            bucket_width_value,
+        ).timestamp()
+    )
+    end = ceil(
+        args["end_time"].astimezone(tz_info), bucket_width_unit, bucket_width_value
+    ).timestamp()
+    key_parts = (
+        [(ts.id, ts.name, ts.unit_symbol) for ts in timeseries],
+        {ts_id: formula.source for ts_id, formula in formulas.items()},
+        data_state.id,
+        bucket_width_value,
+        bucket_width_unit,
+        tuple(aggregations),
+        args["timezone"],
+        args["start_time"].isoformat(),
+        args["end_time"].isoformat(),
+        args.get("convert_to"),
+        args.get("reduce"),
+        args.get("reduce_unit"),
+        args.get("max_points"),
+        args.get("downsampling"),
+        args["compact"],
+        args["epoch_timestamps"],
+        mime_type,
+        col_label,
+    )
+    # Entries are invalidated by writes on timeseries used in formulas
+    return aggregate_cache.get_or_compute(
+        key_parts, sources, data_state, start, end, export
+    )
+
+
+def _compute_aggregate_data(args, timeseries, data_state, mime_type, *, col_label):
+    """Export aggregated timeseries data in the requested format"""
+    kwargs = {
+        "convert_to": args.get("convert_to"),
+        "timezone": args["timezone"],
+        "col_label": col_label,
+    }
+    aggregations = args["aggregation"]
+    formulas = _get_formulas(timeseries)
+
+    if "reduce" in args:
+        if "reduce_unit" in args:
+            kwargs["convert_to"] = {
+                getattr(ts, col_label): args["reduce_unit"] for ts in timeseries
+            }
+        convert_to = kwargs["convert_to"] or {}
+        units = {
+            convert_to.get(getattr(ts, col_label), ts.unit_symbol) for ts in timeseries
+        }
+        if len(units) > 1 and aggregations != ["count"]:
+            abort(
+                422,
+                message="Timeseries units differ. Use reduce_unit to convert them.",
+            )
+
+    # Aggregations not supported by core export functions, reductions, virtual
+    # timeseries, or aggregations computed from rollups if possible
+    api_aggregations = (
+        len(aggregations) > 1
+        or any(agg not in CORE_AGGREGATION_FUNCTIONS for agg in aggregations)
+        or "reduce" in args
+        or formulas
+        or rollups.enabled
+    )
+
+    try:
+        if api_aggregations or "max_points" in args:
+            if formulas:
+                data_df = tsdformulaio.get_timeseries_buckets_data(
+                    args["start_time"],
+                    args["end_time"],
+                    timeseries,
+                    data_state,
+                    args["bucket_width_value"],
+                    args["bucket_width_unit"],
+                    aggregations,
+                    formulas,
+                    reduce=args.get("reduce"),
+                    **kwargs,
+                )
+            elif api_aggregations:
+                data_df = tsdbucketsio.get_timeseries_buckets_data(
+                    args["start_time"],
+                    args["end_time"],
+                    timeseries,
+                    data_state,
+                    args["bucket_width_value"],
+                    args["bucket_width_unit"],
+                    aggregations,
+                    reduce=args.get("reduce"),
+                    **kwargs,
+                )
+            else:
+                data_df = tsdio.get_timeseries_buckets_data(
+                    args["start_time"],
+                    args["end_time"],
+                    timeseries,
+                    data_state,
+                    args["bucket_width_value"],
+                    args["bucket_width_unit"],
+                    aggregations[0],
+                    **kwargs,
+                )
+            if "max_points" in args:
+                data_df = downsample(data_df, args["max_points"], args["downsampling"])
+            return _export_data_df(args, data_df, mime_type, dropna=False)
+
+        json_export_func = (
+            functools.partial(
+                tsdcompactjsonio.export_json_bucket,
+                epoch_timestamps=args["epoch_timestamps"],
+            )
+            if args["compact"]
+            else tsdjsonio.export_json_bucket
+        )
+        export_func = {
+            "text/csv": tsdcsvio.export_csv_bucket,
+            ARROW_STREAM_MIME_TYPE: tsdarrowio.export_arrow_bucket,
+        }.get(mime_type, json_export_func)
+        return export_func(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            args["bucket_width_value"],
+            args["bucket_width_unit"],
+            aggregations[0],
+            **kwargs,
+        )
+    except (BEMServerCoreDimensionalityError, FormulaError) as exc:
+        abort(422, message=str(exc))
+
+
+def _get_data(args, timeseries, data_state, *, col_label):
+    """Export timeseries data in the format requested in Accept header"""
+    mime_type = _get_mime_type()
+
+    kwargs = {
+        "convert_to": args.get("convert_to"),
+        "timezone": args["timezone"],
+        "col_label": col_label,
+    }
+
+    if (args["format"] == "long" or args["stream"]) and _get_formulas(timeseries):
+        abort(422, message="Virtual timeseries can't be streamed or in long format.")
+
+    try:
+        if args["format"] == "long":
+            stream_func = {
+                "text/csv": tsdstreamio.stream_long_csv,
+                ARROW_STREAM_MIME_TYPE: tsdarrowio.stream_long_arrow,
+            }.get(mime_type, tsdstreamio.stream_long_json)
+            chunks = stream_func(
+                args["start_time"],
+                args["end_time"],
+                timeseries,
+                data_state,
+                flask.current_app.config["TIMESERIES_DATA_STREAM_BATCH_SIZE"],
+                **kwargs,
+            )
+            return _stream_response(chunks, mime_type)
+        if args["stream"]:
+            window = dt.timedelta(
+                hours=flask.current_app.config["TIMESERIES_DATA_STREAM_WINDOW_HOURS"]
+            )
+            stream_func = {
+                "text/csv": functools.partial(tsdstreamio.stream_csv, window=window),
+                ARROW_STREAM_MIME_TYPE: functools.partial(
+                    tsdarrowio.stream_arrow, window=window
+                ),
+            }.get(
+                mime_type,
+                functools.partial(
+                    tsdstreamio.stream_json,
+                    batch_size=flask.current_app.config[
+                        "TIMESERIES_DATA_STREAM_BATCH_SIZE"
+                    ],
+                ),
+            )
+            chunks = stream_func(
+                args["start_time"],
+                args["end_time"],
+                timeseries,
+                data_state,
+                **kwargs,
+            )
+            return _stream_response(chunks, mime_type)
+    except BEMServerCoreDimensionalityError as exc:
+        abort(422, message=str(exc))
+
+    resp = _export_data(args, timeseries, data_state, mime_type, col_label=col_label)
+    return flask.Response(resp, mimetype=mime_type)
+
+
+def _get_aggregate_data(args, timeseries, data_state, *, col_label):
+    """Export aggregated timeseries data in the format requested in Accept header"""
+    mime_type = _get_mime_type()
+
+    resp = _export_aggregate_data(
+        args, timeseries, data_state, mime_type, col_label=col_label
+    )
+    return flask.Response(resp, mimetype=mime_type)
+
+
+def _make_conditional(
+    args, timeseries, data_state, get_response, *, depends_on_now=False
+):
+    """Answer a data request, or 304 if client cache is up to date
+
+    The validators are computed from the request and the write watermarks of
+    the timeseries, so that a 304 is returned without querying data.
+
+    Last-Modified has a one second resolution. The watermark is rounded up and
+    Last-Modified is only sent once that second is over, so that a later write
+    is always after it.
+
+    :param bool depends_on_now: Whether the response depends on current time
+        when the time interval is not over, in which case no validator is sent
+    """
+    now = dt.datetime.now(tz=dt.timezone.utc)
+    if not watermarks.conditional_requests or (
+        depends_on_now and args["end_time"] > now
+    ):
+        return get_response()
+
+    # Virtual timeseries are modified when their inputs or formulas are
+    formulas = _get_formulas(timeseries)
+    request = flask.request
+    watermark = watermarks.get_last_modified(
+        _get_sources(timeseries, formulas), data_state
+    )
+    etag = hashlib.sha1(
+        "\n".join(
+            (
+                request.path,
+                request.query_string.decode(),
+                request.headers.get("Accept", ""),
+                repr(watermark),
+                *(formula.source for formula in formulas.values()),
+            )
+        ).encode()
+    ).hexdigest()
+    last_modified = dt.datetime.fromtimestamp(math.ceil(watermark), tz=dt.timezone.utc)
+    if last_modified > now:
+        last_modified = None
+
+    # If-None-Match has precedence over If-Modified-Since
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains_weak(etag)
+    else:
+        not_modified = (
+            last_modified is not None
+            and request.if_modified_since is not None
+            and last_modified <= request.if_modified_since
+        )
+    resp = flask.Response(status=304) if not_modified else get_response()
+
+    # Data may be compressed, hence the weak ETag
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.vary.add("Accept")
+    resp.cache_control.private = True
+    if args["end_time"] <= now:
+        resp.cache_control.max_age = flask.current_app.config[
+            "TIMESERIES_DATA_CACHE_MAX_AGE"
+        ]
+    else:
+        resp.cache_control.no_cache = True
+    return resp
+
+
+def _run_query(user_id, query):
+    """Run a query of a batch, in a worker thread
+
+    The worker uses its own DB session, hence its own DB connection. The user
+    is loaded again in this session.
+    """
+    try:
+        with OpenBar():
+            user = User.get_by_id(user_id)
+        with CurrentUser(user):
+            args = query["args"]
+            if (campaign_id := query.get("campaign_id")) is not None:
+                campaign = Campaign.get_by_id(campaign_id) or abort(
+                    422, message=f"Unknown campaign ID: {campaign_id}"
+                )
+                timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
+                col_label = "name"
+            else:
+                timeseries = _select_timeseries(args)
+                col_label = "id"
+            data_state = _get_data_state(args["data_state"])
+            export_func = _export_aggregate_data if query["aggregate"] else _export_data
+            return export_func(
+                args, timeseries, data_state, "application/json", col_label=col_label
+            )
+    finally:
+        db.session.remove()
+
+
 blp = Blueprint(
     "TimeseriesData",
     __name__,
@@ -191,7 +973,8 @@ def get_stats(args):
     timeseries = _get_many_timeseries_by_id(args["timeseries"])
     data_state = _get_data_state(args["data_state"])
 
-    data_df = tsdio.get_timeseries_stats(
+    stats_io = tsdstatsio if stats_summaries.enabled else tsdio
+    data_df = stats_io.get_timeseries_stats(
         timeseries,
         data_state,
         timezone=args["timezone"],
@@ -205,52 +988,148 @@ def get_stats(args):
     }
 
 
+@blp.route("/latest", methods=("GET",))
+@blp.login_required
+@blp.arguments(TimeseriesDataGetLatestByIDQueryArgsSchema, location="query")
+@blp.response(200, content_type="application/json", example=LATEST_BY_ID_EXAMPLE)
+def get_latest(args):
+    """Get latest timeseries data
+
+    Returns the last count values of each timeseries, whatever their age.
+    Timeseries with no data are mapped to an empty object.
+
+    Timeseries are either passed by ID or selected by structural element,
+    unit and property values.
+    """
+    timeseries = _select_timeseries(args)
+    data_state = _get_data_state(args["data_state"])
+
+    resp = tsdlatestio.export_json(
+        timeseries,
+        data_state,
+        args["count"],
+        timezone=args["timezone"],
+        col_label="id",
+    )
+    return flask.Response(resp, mimetype="application/json")
+
+
+@blp.route("/histogram", methods=("GET",))
+@blp.login_required
+@blp.arguments(TimeseriesDataGetHistogramByIDQueryArgsSchema, location="query")
+@blp.response(200, TimeseriesDataHistogramsByIDSchema, example=HISTOGRAMS_BY_ID_EXAMPLE)
+def get_histogram(args):
+    """Get timeseries data histograms
+
+    Bins are either passed as edges, common to all timeseries, or as a number
+    of equal-width bins between minimum and maximum values of each timeseries.
+    Bins include their lower edge, the last one also includes its upper edge.
+
+    Timeseries are either passed by ID or selected by structural element,
+    unit and property values.
+    """
+    timeseries = _select_timeseries(args)
+    data_state = _get_data_state(args["data_state"])
+
+    return {
+        "histograms": tsdhistogramio.get_timeseries_histograms(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            bins=args.get("bins", 10),
+            bin_edges=args.get("bin_edges"),
+            col_label="id",
+        )
+    }
+
+
+@blp.route("/profile", methods=("GET",))
+@blp.login_required
+@blp.arguments(TimeseriesDataGetProfileByIDQueryArgsSchema, location="query")
+@blp.response(200, TimeseriesDataProfilesByIDSchema, example=PROFILES_BY_ID_EXAMPLE)
+def get_profile(args):
+    """Get timeseries load profiles
+
+    Values are aggregated by hour of day and by day of week or month of their
+    local time in the requested timezone.
+
+    Each profile is a matrix whose rows are periods (Monday to Sunday or
+    January to December) and columns are hours of day (0 to 23).
+
+    Timeseries are either passed by ID or selected by structural element,
+    unit and property values.
+    """
+    timeseries = _select_timeseries(args)
+    data_state = _get_data_state(args["data_state"])
+
+    return {
+        "profiles": tsdprofileio.get_timeseries_profiles(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            args["period"],
+            args["aggregation"],
+            timezone=args["timezone"],
+            col_label="id",
+        )
+    }
+
+
 @blp.route("/", methods=("GET",))
 @blp.login_required
 @blp.arguments(TimeseriesDataGetByIDQueryArgsSchema, location="query")
 @blp.response(200, content_type="application/json", example=PAYLOAD_BY_ID_JSON_EXAMPLE)
 @blp.alt_response(200, content_type="text/csv", example=PAYLOAD_BY_ID_CSV_EXAMPLE)
+@blp.alt_response(200, content_type=ARROW_STREAM_MIME_TYPE)
 def get(args):
     """Get timeseries data
 
-    Returns data in either JSON or CSV format.
+    Returns data in either JSON, CSV or Arrow format.
+
+    Timeseries are either passed by ID or selected by structural element,
+    unit and property values. Selected timeseries are resolved in a single
+    query.
 
     JSON: each key is a timestamp ID as string. For each timeseries, values are
     passed a {timestamp: value} mappings.
 
+    Compact JSON: "timestamps" is the list of timestamps, "values" maps
+    timeseries IDs to value lists.
+
     CSV: the first column is the timestamp as timezone aware datetime and each
     other column is a timeseries data. Column headers are timeseries IDs.
-    """
-    mime_type = flask.request.headers.get("Accept", "application/json")
 
-    timeseries = _get_many_timeseries_by_id(args["timeseries"])
-    data_state = _get_data_state(args["data_state"])
+    Arrow: IPC stream with a "Datetime" timestamp column and a column for each
+    timeseries. Column names are timeseries IDs.
 
-    try:
-        if mime_type == "text/csv":
-            resp = tsdcsvio.export_csv(
-                args["start_time"],
-                args["end_time"],
-                timeseries,
-                data_state,
-                convert_to=args.get("convert_to"),
-                timezone=args["timezone"],
-                col_label="id",
-            )
-        else:
-            resp = tsdjsonio.export_json(
-                args["start_time"],
-                args["end_time"],
-                timeseries,
-                data_state,
-                convert_to=args.get("convert_to"),
-                timezone=args["timezone"],
-                col_label="id",
-            )
-    except BEMServerCoreDimensionalityError as exc:
-        abort(422, message=str(exc))
+    Long format: data is streamed as (timestamp, timeseries, value) rows, sorted
+    by timeseries then timestamp. In JSON, rows are passed as a list of
+    [timestamp, timeseries, value] lists. In CSV, the header is
+    "Datetime,Timeseries,Value".
 
-    return flask.Response(resp, mimetype=mime_type)
+    If stream is true, memory usage is kept bounded for large time intervals.
+    CSV and Arrow rows hold all timeseries values at a timestamp, so data is
+    queried and sent by time windows. JSON is keyed by timeseries, so data is
+    read in a single query from a DB cursor and sent by batches of rows.
+
+    If max_points is passed, each timeseries is downsampled to at most
+    max_points points, preserving peaks.
+
+    If resample_step_unit is passed, timeseries are resampled on a regular grid,
+    each with its fill method (previous value, linear interpolation or none).
+    Gaps longer than max_gap are not filled.
+    """
+    timeseries = _select_timeseries(args)
+    data_state = _get_data_state(args["data_state"])
+
+    return _make_conditional(
+        args,
+        timeseries,
+        data_state,
+        functools.partial(_get_data, args, timeseries, data_state, col_label="id"),
+    )
 
 
 @blp.route("/aggregate", methods=("GET",))
@@ -258,50 +1137,80 @@ def get(args):
 @blp.arguments(TimeseriesDataGetByIDAggregateQueryArgsSchema, location="query")
 @blp.response(200, content_type="application/json", example=PAYLOAD_BY_ID_JSON_EXAMPLE)
 @blp.alt_response(200, content_type="text/csv", example=PAYLOAD_BY_ID_CSV_EXAMPLE)
+@blp.alt_response(200, content_type=ARROW_STREAM_MIME_TYPE)
 def get_aggregate(args):
     """Get aggregated timeseries data
 
-    Returns data in either JSON or CSV format.
+    Returns data in either JSON, CSV or Arrow format.
+
+    Timeseries are either passed by ID or selected by structural element,
+    unit and property values. Selected timeseries are resolved in a single
+    query.
 
     JSON: each key is a timestamp ID as string. For each timeseries, values are
     passed a {timestamp: value} mappings.
 
+    Compact JSON: "timestamps" is the list of timestamps, "values" maps
+    timeseries IDs to value lists.
+
     CSV: the first column is the timestamp as timezone aware datetime and each
     other column is a timeseries data. Column headers are timeseries IDs.
-    """
-    mime_type = flask.request.headers.get("Accept", "application/json")
 
-    timeseries = _get_many_timeseries_by_id(args["timeseries"])
+    Arrow: IPC stream with a "Datetime" timestamp column and a column for each
+    timeseries. Column names are timeseries IDs.
+
+    If several aggregation functions are passed, all of them are computed in a
+    single query and columns are labelled "<timeseries>:<aggregation>".
+
+    If reduce is passed, timeseries are reduced into a single one by applying
+    the function to each bucket, after unit conversion.
+
+    If max_points is passed, each timeseries is downsampled to at most
+    max_points points, preserving peaks.
+    """
+    timeseries = _select_timeseries(args)
     data_state = _get_data_state(args["data_state"])
 
-    if mime_type == "text/csv":
-        resp = tsdcsvio.export_csv_bucket(
-            args["start_time"],
-            args["end_time"],
-            timeseries,
-            data_state,
-            args["bucket_width_value"],
-            args["bucket_width_unit"],
-            args["aggregation"],
-            convert_to=args.get("convert_to"),
-            timezone=args["timezone"],
-            col_label="id",
-        )
-    else:
-        resp = tsdjsonio.export_json_bucket(
-            args["start_time"],
-            args["end_time"],
-            timeseries,
-            data_state,
-            args["bucket_width_value"],
-            args["bucket_width_unit"],
-            args["aggregation"],
-            convert_to=args.get("convert_to"),
-            timezone=args["timezone"],
-            col_label="id",
-        )
+    return _make_conditional(
+        args,
+        timeseries,
+        data_state,
+        functools.partial(
+            _get_aggregate_data, args, timeseries, data_state, col_label="id"
+        ),
+        # Last value is valid until the end of the interval, but not in the future
+        depends_on_now=any(agg in SAMPLE_AGGREGATIONS for agg in args["aggregation"]),
+    )
 
-    return flask.Response(resp, mimetype=mime_type)
+
+@blp.route("/query", methods=("POST",))
+@blp.login_required
+@blp.arguments(TimeseriesDataQueriesSchema)
+@blp.response(200, content_type="application/json", example=QUERY_EXAMPLE)
+def post_query(args):
+    """Run a batch of timeseries data queries
+
+    Each query is either a raw or an aggregate query, with timeseries passed by
+    ID or, if campaign_id is passed, by name. Query arguments are passed in the
+    body, so there is no limit to the number of timeseries.
+
+    Queries are run concurrently on a bounded thread pool, each with its own
+    database connection.
+
+    Returns a list with the JSON result of each query, in the format of the
+    corresponding GET endpoint.
+    """
+    queries = args["queries"]
+    config = flask.current_app.config
+    if len(queries) > (max_queries := config["TIMESERIES_DATA_QUERY_MAX_QUERIES"]):
+        abort(422, message=f"Too many queries (max: {max_queries})")
+
+    run_query = functools.partial(_run_query, get_current_user().id)
+    max_workers = min(config["TIMESERIES_DATA_QUERY_MAX_WORKERS"], len(queries))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(run_query, queries))
+
+    return flask.Response(f"[{','.join(results)}]", mimetype="application/json")
 
 
 @blp.route("/", methods=("POST",))
@@ -371,6 +1280,7 @@ def delete(args):
         timeseries,
         data_state,
     )
+    watermarks.touch(timeseries, data_state, args["start_time"], args["end_time"])
 
     db.session.commit()
 
@@ -385,7 +1295,8 @@ def get_stats_for_campaign(args, campaign_id):
     timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
     data_state = _get_data_state(args["data_state"])
 
-    data_df = tsdio.get_timeseries_stats(
+    stats_io = tsdstatsio if stats_summaries.enabled else tsdio
+    data_df = stats_io.get_timeseries_stats(
         timeseries,
         data_state,
         timezone=args["timezone"],
@@ -399,6 +1310,93 @@ def get_stats_for_campaign(args, campaign_id):
     }
 
 
+@blp4c.route("/latest", methods=("GET",))
+@blp4c.login_required
+@blp4c.arguments(TimeseriesDataGetLatestByNameQueryArgsSchema, location="query")
+@blp4c.response(200, content_type="application/json", example=LATEST_BY_NAME_EXAMPLE)
+def get_latest_for_campaign(args, campaign_id):
+    """Get latest timeseries data
+
+    Returns the last count values of each timeseries, whatever their age.
+    Timeseries with no data are mapped to an empty object.
+    """
+    campaign = Campaign.get_by_id(campaign_id) or abort(404)
+    timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
+    data_state = _get_data_state(args["data_state"])
+
+    resp = tsdlatestio.export_json(
+        timeseries,
+        data_state,
+        args["count"],
+        timezone=args["timezone"],
+        col_label="name",
+    )
+    return flask.Response(resp, mimetype="application/json")
+
+
+@blp4c.route("/histogram", methods=("GET",))
+@blp4c.login_required
+@blp4c.arguments(TimeseriesDataGetHistogramByNameQueryArgsSchema, location="query")
+@blp4c.response(
+    200, TimeseriesDataHistogramsByNameSchema, example=HISTOGRAMS_BY_NAME_EXAMPLE
+)
+def get_histogram_for_campaign(args, campaign_id):
+    """Get timeseries data histograms
+
+    Bins are either passed as edges, common to all timeseries, or as a number
+    of equal-width bins between minimum and maximum values of each timeseries.
+    Bins include their lower edge, the last one also includes its upper edge.
+    """
+    campaign = Campaign.get_by_id(campaign_id) or abort(404)
+    timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
+    data_state = _get_data_state(args["data_state"])
+
+    return {
+        "histograms": tsdhistogramio.get_timeseries_histograms(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            bins=args.get("bins", 10),
+            bin_edges=args.get("bin_edges"),
+            col_label="name",
+        )
+    }
+
+
+@blp4c.route("/profile", methods=("GET",))
+@blp4c.login_required
+@blp4c.arguments(TimeseriesDataGetProfileByNameQueryArgsSchema, location="query")
+@blp4c.response(
+    200, TimeseriesDataProfilesByNameSchema, example=PROFILES_BY_NAME_EXAMPLE
+)
+def get_profile_for_campaign(args, campaign_id):
+    """Get timeseries load profiles
+
+    Values are aggregated by hour of day and by day of week or month of their
+    local time in the requested timezone.
+
+    Each profile is a matrix whose rows are periods (Monday to Sunday or
+    January to December) and columns are hours of day (0 to 23).
+    """
+    campaign = Campaign.get_by_id(campaign_id) or abort(404)
+    timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
+    data_state = _get_data_state(args["data_state"])
+
+    return {
+        "profiles": tsdprofileio.get_timeseries_profiles(
+            args["start_time"],
+            args["end_time"],
+            timeseries,
+            data_state,
+            args["period"],
+            args["aggregation"],
+            timezone=args["timezone"],
+            col_label="name",
+        )
+    }
+
+
 @blp4c.route("/", methods=("GET",))
 @blp4c.login_required
 @blp4c.arguments(TimeseriesDataGetByNameQueryArgsSchema, location="query")
@@ -406,48 +1404,51 @@ def get_stats_for_campaign(args, campaign_id):
     200, content_type="application/json", example=PAYLOAD_BY_NAME_JSON_EXAMPLE
 )
 @blp4c.alt_response(200, content_type="text/csv", example=PAYLOAD_BY_NAME_CSV_EXAMPLE)
+@blp4c.alt_response(200, content_type=ARROW_STREAM_MIME_TYPE)
 def get_for_campaign(args, campaign_id):
     """Get timeseries data for a given campaign
 
-    Returns data in either JSON or CSV format.
+    Returns data in either JSON, CSV or Arrow format.
 
     JSON: each key is a timestamp name as string. For each timeseries, values
     are passed a {timestamp: value} mappings.
 
+    Compact JSON: "timestamps" is the list of timestamps, "values" maps
+    timeseries names to value lists.
+
     CSV: the first column is the timestamp as timezone aware datetime and each
     other column is a timeseries data. Column headers are timeseries names.
-    """
-    mime_type = flask.request.headers.get("Accept", "application/json")
 
+    Arrow: IPC stream with a "Datetime" timestamp column and a column for each
+    timeseries. Column names are timeseries names.
+
+    Long format: data is streamed as (timestamp, timeseries, value) rows, sorted
+    by timeseries then timestamp. In JSON, rows are passed as a list of
+    [timestamp, timeseries, value] lists. In CSV, the header is
+    "Datetime,Timeseries,Value".
+
+    If stream is true, memory usage is kept bounded for large time intervals.
+    CSV and Arrow rows hold all timeseries values at a timestamp, so data is
+    queried and sent by time windows. JSON is keyed by timeseries, so data is
+    read in a single query from a DB cursor and sent by batches of rows.
+
+    If max_points is passed, each timeseries is downsampled to at most
+    max_points points, preserving peaks.
+
+    If resample_step_unit is passed, timeseries are resampled on a regular grid,
+    each with its fill method (previous value, linear interpolation or none).
+    Gaps longer than max_gap are not filled.
+    """
     campaign = Campaign.get_by_id(campaign_id) or abort(404)
     timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
     data_state = _get_data_state(args["data_state"])
 
-    try:
-        if mime_type == "text/csv":
-            resp = tsdcsvio.export_csv(
-                args["start_time"],
-                args["end_time"],
-                timeseries,
-                data_state,
-                convert_to=args.get("convert_to"),
-                timezone=args["timezone"],
-                col_label="name",
-            )
-        else:
-            resp = tsdjsonio.export_json(
-                args["start_time"],
-                args["end_time"],
-                timeseries,
-                data_state,
-                convert_to=args.get("convert_to"),
-                timezone=args["timezone"],
-                col_label="name",
-            )
-    except BEMServerCoreDimensionalityError as exc:
-        abort(422, message=str(exc))
-
-    return flask.Response(resp, mimetype=mime_type)
+    return _make_conditional(
+        args,
+        timeseries,
+        data_state,
+        functools.partial(_get_data, args, timeseries, data_state, col_label="name"),
+    )
 
 
 @blp4c.route("/aggregate", methods=("GET",))
@@ -457,51 +1458,47 @@ def get_for_campaign(args, campaign_id):
     200, content_type="application/json", example=PAYLOAD_BY_NAME_JSON_EXAMPLE
 )
 @blp4c.alt_response(200, content_type="text/csv", example=PAYLOAD_BY_NAME_CSV_EXAMPLE)
+@blp4c.alt_response(200, content_type=ARROW_STREAM_MIME_TYPE)
 def get_aggregate_for_campaign(args, campaign_id):
     """Get aggregated timeseries data for a given campaign
 
-    Returns data in either JSON or CSV format.
+    Returns data in either JSON, CSV or Arrow format.
 
     JSON: each key is a timestamp name as string. For each timeseries, values
     are passed a {timestamp: value} mappings.
 
+    Compact JSON: "timestamps" is the list of timestamps, "values" maps
+    timeseries names to value lists.
+
     CSV: the first column is the timestamp as timezone aware datetime and each
     other column is a timeseries data. Column headers are timeseries names.
-    """
-    mime_type = flask.request.headers.get("Accept", "application/json")
 
+    Arrow: IPC stream with a "Datetime" timestamp column and a column for each
+    timeseries. Column names are timeseries names.
+
+    If several aggregation functions are passed, all of them are computed in a
+    single query and columns are labelled "<timeseries>:<aggregation>".
+
+    If reduce is passed, timeseries are reduced into a single one by applying
+    the function to each bucket, after unit conversion.
+
+    If max_points is passed, each timeseries is downsampled to at most
+    max_points points, preserving peaks.
+    """
     campaign = Campaign.get_by_id(campaign_id) or abort(404)
     timeseries = _get_many_timeseries_by_name(campaign, args["timeseries"])
     data_state = _get_data_state(args["data_state"])
 
-    if mime_type == "text/csv":
-        resp = tsdcsvio.export_csv_bucket(
-            args["start_time"],
-            args["end_time"],
-            timeseries,
-            data_state,
-            args["bucket_width_value"],
-            args["bucket_width_unit"],
-            args["aggregation"],
-            convert_to=args.get("convert_to"),
-            timezone=args["timezone"],
-            col_label="name",
-        )
-    else:
-        resp = tsdjsonio.export_json_bucket(
-            args["start_time"],
-            args["end_time"],
-            timeseries,
-            data_state,
-            args["bucket_width_value"],
-            args["bucket_width_unit"],
-            args["aggregation"],
-            convert_to=args.get("convert_to"),
-            timezone=args["timezone"],
-            col_label="name",
-        )
-
-    return flask.Response(resp, mimetype=mime_type)
+    return _make_conditional(
+        args,
+        timeseries,
+        data_state,
+        functools.partial(
+            _get_aggregate_data, args, timeseries, data_state, col_label="name"
+        ),
+        # Last value is valid until the end of the interval, but not in the future
+        depends_on_now=any(agg in SAMPLE_AGGREGATIONS for agg in args["aggregation"]),
+    )
 
 
 @blp4c.route("/", methods=("POST",))
@@ -573,5 +1570,6 @@ def delete_for_campaign(args, campaign_id):
         timeseries,
         data_state,
     )
+    watermarks.touch(timeseries, data_state, args["start_time"], args["end_time"])
 
     db.session.commit()
@@ -2,11 +2,33 @@
 
 import marshmallow as ma
 
-from bemserver_core.input_output.timeseries_data_io import AGGREGATION_FUNCTIONS
 from bemserver_core.time_utils import FIXED_SIZE_PERIODS, PERIODS
 
 from bemserver_api import Schema
 from bemserver_api.extensions import ma_fields
+from bemserver_api.input_output import (
+    AGGREGATION_FUNCTIONS,
+    PERCENTILE_AGGREGATION_RE,
+    PROFILE_AGGREGATIONS,
+    PROFILE_PERIODS,
+    REDUCE_FUNCTIONS,
+)
+from bemserver_api.process import (
+    DOWNSAMPLING_METHODS,
+    FILL_METHODS,
+    ROLLING_FUNCTIONS,
+)
+
+
+def validate_aggregation(aggregation):
+    """Validate aggregation function, including percentile aggregations"""
+    if aggregation not in AGGREGATION_FUNCTIONS and not (
+        PERCENTILE_AGGREGATION_RE.fullmatch(aggregation)
+    ):
+        raise ma.ValidationError(
+            f"Must be one of: {', '.join(AGGREGATION_FUNCTIONS)} "
+            "or p<percentile> (e.g. p95)."
+        )
 
 
 class TimeseriesIDListMixinSchema(Schema):
@@ -29,6 +51,81 @@ class TimeseriesNameListMixinSchema(Schema):
     )
 
 
+# Fields selecting timeseries by structural element and unit
+TIMESERIES_SELECTOR_FIELDS = (
+    "site_id",
+    "recurse_site_id",
+    "building_id",
+    "recurse_building_id",
+    "storey_id",
+    "recurse_storey_id",
+    "space_id",
+    "zone_id",
+    "unit_symbol",
+)
+
+
+class TimeseriesSelectorMixinSchema(Schema):
+    """Select timeseries by ID or by structural element, unit and properties"""
+
+    timeseries = ma.fields.List(
+        ma.fields.Int(),
+        metadata={
+            "description": (
+                "List of timeseries ID. "
+                "If not passed, timeseries are selected using selector parameters."
+            ),
+        },
+    )
+    site_id = ma.fields.Int()
+    recurse_site_id = ma.fields.Int()
+    building_id = ma.fields.Int()
+    recurse_building_id = ma.fields.Int()
+    storey_id = ma.fields.Int()
+    recurse_storey_id = ma.fields.Int()
+    space_id = ma.fields.Int()
+    zone_id = ma.fields.Int()
+    unit_symbol = ma_fields.UnitSymbol()
+    property_id = ma.fields.List(
+        ma.fields.Int(),
+        metadata={
+            "description": "List of timeseries property ID to filter on",
+        },
+    )
+    property_value = ma.fields.List(
+        ma.fields.String(),
+        metadata={
+            "description": (
+                "List of timeseries property values to filter on. "
+                "Must be of same length as property_id list."
+            ),
+        },
+    )
+
+    @ma.validates_schema
+    def validate_selector(self, data, **kwargs):
+        selector = [
+            field
+            for field in (*TIMESERIES_SELECTOR_FIELDS, "property_id", "property_value")
+            if field in data
+        ]
+        if ("timeseries" in data) == bool(selector):
+            raise ma.ValidationError(
+                "Either timeseries or selector parameters must be provided."
+            )
+        for level in ("site", "building", "storey"):
+            if f"{level}_id" in data and f"recurse_{level}_id" in data:
+                raise ma.ValidationError(
+                    f"{level}_id and recurse_{level}_id "
+                    "are mutually exclusive arguments"
+                )
+        if len(data.get("property_id", [])) != len(data.get("property_value", [])):
+            raise ma.ValidationError(
+                "property_value must be the same size as property_id.",
+                field_name="property_value",
+            )
+
+
 class TimeseriesDataGetStatsBaseQueryArgsSchema(Schema):
     data_state = ma.fields.Int(
         required=True,
@@ -56,6 +153,40 @@ class TimeseriesDataGetStatsByNameBaseQueryArgsSchema(
     """Timeseries stats by name query parameters"""
 
 
+class TimeseriesDataGetLatestBaseQueryArgsSchema(Schema):
+    data_state = ma.fields.Int(
+        required=True,
+        metadata={
+            "description": "Data state ID",
+        },
+    )
+    count = ma.fields.Int(
+        load_default=1,
+        validate=ma.validate.Range(min=1, max=1000),
+        metadata={
+            "description": "Number of values to return for each timeseries",
+        },
+    )
+    timezone = ma_fields.Timezone(
+        load_default="UTC",
+        metadata={
+            "description": "Timezone to use for response data",
+        },
+    )
+
+
+class TimeseriesDataGetLatestByIDQueryArgsSchema(
+    TimeseriesSelectorMixinSchema, TimeseriesDataGetLatestBaseQueryArgsSchema
+):
+    """Timeseries latest values by ID query parameters"""
+
+
+class TimeseriesDataGetLatestByNameQueryArgsSchema(
+    TimeseriesNameListMixinSchema, TimeseriesDataGetLatestBaseQueryArgsSchema
+):
+    """Timeseries latest values by name query parameters"""
+
+
 class TSStatsSchema(Schema):
     first_timestamp = ma_fields.AwareDateTime(
         metadata={
@@ -135,6 +266,146 @@ class TimeseriesDataBaseQueryArgsSchema(Schema):
     )
 
 
+class TimeseriesDataGetHistogramBaseQueryArgsSchema(TimeseriesDataBaseQueryArgsSchema):
+    """Timeseries histogram GET query parameters base schema"""
+
+    bins = ma.fields.Int(
+        validate=ma.validate.Range(min=1, max=1000),
+        metadata={
+            "description": (
+                "Number of equal-width bins between minimum and maximum values "
+                "of each timeseries in the interval. Default: 10."
+            ),
+        },
+    )
+    bin_edges = ma.fields.List(
+        ma.fields.Float(allow_nan=False),
+        validate=ma.validate.Length(min=2, max=1001),
+        metadata={
+            "description": (
+                "Sorted bin edges, common to all timeseries. "
+                "Values out of edges are not counted."
+            ),
+        },
+    )
+
+    @ma.validates_schema
+    def validate_bins(self, data, **kwargs):
+        if "bins" in data and "bin_edges" in data:
+            raise ma.ValidationError(
+                "bins and bin_edges are mutually exclusive arguments."
+            )
+        if "bin_edges" in data and any(
+            lower >= upper
+            for lower, upper in zip(data["bin_edges"], data["bin_edges"][1:])
+        ):
+            raise ma.ValidationError(
+                "bin_edges must be strictly increasing.", field_name="bin_edges"
+            )
+
+
+class TimeseriesDataGetHistogramByIDQueryArgsSchema(
+    TimeseriesDataGetHistogramBaseQueryArgsSchema, TimeseriesSelectorMixinSchema
+):
+    """Timeseries histogram GET by ID query parameters schema"""
+
+
+class TimeseriesDataGetHistogramByNameQueryArgsSchema(
+    TimeseriesDataGetHistogramBaseQueryArgsSchema, TimeseriesNameListMixinSchema
+):
+    """Timeseries histogram GET by name query parameters schema"""
+
+
+class TSHistogramSchema(Schema):
+    edges = ma.fields.List(
+        ma.fields.Float(),
+        metadata={
+            "description": "Bin edges",
+        },
+    )
+    counts = ma.fields.List(
+        ma.fields.Integer(),
+        metadata={
+            "description": "Values count in each bin",
+        },
+    )
+
+
+class TimeseriesDataHistogramsByIDSchema(Schema):
+    """Timeseries histograms response schema"""
+
+    histograms = ma.fields.Dict(
+        keys=ma.fields.Integer(),
+        values=ma.fields.Nested(TSHistogramSchema()),
+    )
+
+
+class TimeseriesDataHistogramsByNameSchema(Schema):
+    """Timeseries histograms response schema"""
+
+    histograms = ma.fields.Dict(
+        keys=ma.fields.String(),
+        values=ma.fields.Nested(TSHistogramSchema()),
+    )
+
+
+class TimeseriesDataGetProfileBaseQueryArgsSchema(TimeseriesDataBaseQueryArgsSchema):
+    """Timeseries load profile GET query parameters base schema"""
+
+    period = ma.fields.String(
+        load_default="weekday",
+        validate=ma.validate.OneOf(PROFILE_PERIODS),
+        metadata={
+            "description": (
+                "Profile rows. weekday: Monday to Sunday. month: January to December."
+            ),
+        },
+    )
+    aggregation = ma.fields.String(
+        load_default="avg",
+        validate=ma.validate.OneOf(PROFILE_AGGREGATIONS),
+        metadata={
+            "description": "Aggregation function applied to values of each cell",
+        },
+    )
+    timezone = ma_fields.Timezone(
+        load_default="UTC",
+        metadata={
+            "description": "Timezone of local time used to group values",
+        },
+    )
+
+
+class TimeseriesDataGetProfileByIDQueryArgsSchema(
+    TimeseriesDataGetProfileBaseQueryArgsSchema, TimeseriesSelectorMixinSchema
+):
+    """Timeseries load profile GET by ID query parameters schema"""
+
+
+class TimeseriesDataGetProfileByNameQueryArgsSchema(
+    TimeseriesDataGetProfileBaseQueryArgsSchema, TimeseriesNameListMixinSchema
+):
+    """Timeseries load profile GET by name query parameters schema"""
+
+
+class TimeseriesDataProfilesByIDSchema(Schema):
+    """Timeseries load profiles response schema"""
+
+    profiles = ma.fields.Dict(
+        keys=ma.fields.Integer(),
+        values=ma.fields.List(ma.fields.List(ma.fields.Float(allow_none=True))),
+    )
+
+
+class TimeseriesDataProfilesByNameSchema(Schema):
+    """Timeseries load profiles response schema"""
+
+    profiles = ma.fields.Dict(
+        keys=ma.fields.String(),
+        values=ma.fields.List(ma.fields.List(ma.fields.Float(allow_none=True))),
+    )
+
+
 class TimeseriesDataDeleteByIDQueryArgsSchema(
     TimeseriesDataBaseQueryArgsSchema, TimeseriesIDListMixinSchema
 ):
@@ -168,10 +439,46 @@ class TimeseriesDataGetBaseQueryArgsSchema(TimeseriesDataBaseQueryArgsSchema):
         },
     )
 
+    compact = ma.fields.Boolean(
+        load_default=False,
+        metadata={
+            "description": (
+                "JSON only. Return a single timestamp list and a value list "
+                "for each timeseries."
+            ),
+        },
+    )
+    epoch_timestamps = ma.fields.Boolean(
+        load_default=False,
+        metadata={
+            "description": "Compact JSON only. Return timestamps as epoch ms.",
+        },
+    )
+    max_points = ma.fields.Int(
+        validate=ma.validate.Range(min=3),
+        metadata={
+            "description": (
+                "Maximum number of points per timeseries. "
+                "If passed, timeseries are downsampled to fit."
+            ),
+        },
+    )
+    downsampling = ma.fields.String(
+        load_default="lttb",
+        validate=ma.validate.OneOf(DOWNSAMPLING_METHODS),
+        metadata={
+            "description": (
+                "Downsampling method. "
+                "lttb: Largest-Triangle-Three-Buckets. "
+                "minmax: minimum and maximum of each bucket."
+            ),
+        },
+    )
+
     @ma.validates_schema
     def validate_convert_to(self, data, **kwargs):
         if "convert_to" in data and (
-            len(data["convert_to"]) != len(data["timeseries"])
+            len(data["convert_to"]) != len(data.get("timeseries", []))
         ):
             raise ma.ValidationError(
                 "If provided, convert_to must be the same size as timeseries."
@@ -182,20 +489,220 @@ class TimeseriesDataGetBaseQueryArgsSchema(TimeseriesDataBaseQueryArgsSchema):
         if "convert_to" in data:
             data["convert_to"] = {
                 ts_label: unit
-                for ts_label, unit in zip(data["timeseries"], data["convert_to"])
+                for ts_label, unit in zip(
+                    data.get("timeseries", []), data["convert_to"]
+                )
                 if unit
             }
         return data
 
 
+class TimeseriesDataGetRawBaseQueryArgsSchema(TimeseriesDataGetBaseQueryArgsSchema):
+    """Timeseries values raw GET query parameters base schema"""
+
+    stream = ma.fields.Boolean(
+        load_default=False,
+        metadata={
+            "description": (
+                "Stream response to limit memory usage. CSV and Arrow rows "
+                "hold all timeseries values at a timestamp, so data is queried "
+                "and sent by time windows. JSON is keyed by timeseries, so data "
+                "is read in a single query and sent by batches of rows."
+            ),
+        },
+    )
+    format = ma.fields.String(
+        load_default="wide",
+        validate=ma.validate.OneOf(("wide", "long")),
+        metadata={
+            "description": (
+                "Data layout. Wide: one column per timeseries. "
+                "Long: one (timestamp, timeseries, value) row per value, "
+                "always streamed."
+            ),
+        },
+    )
+
+    resample_step_value = ma.fields.Int(
+        load_default=1,
+        validate=ma.validate.Range(min=1),
+        metadata={
+            "description": "Resampling grid step value",
+        },
+    )
+    resample_step_unit = ma.fields.String(
+        validate=ma.validate.OneOf(FIXED_SIZE_PERIODS),
+        metadata={
+            "description": (
+                "Resampling grid step unit. "
+                "If passed, timeseries are resampled on a regular grid."
+            ),
+        },
+    )
+    fill = ma.fields.List(
+        ma.fields.String(validate=ma.validate.OneOf(FILL_METHODS)),
+        load_default=["ffill"],
+        validate=ma.validate.Length(min=1),
+        metadata={
+            "description": (
+                "Resampling only. List of fill methods, either a single method "
+                "or one method per timeseries. "
+                "ffill: previous value. "
+                "linear: linear interpolation between surrounding values. "
+                "none: only values on grid points."
+            ),
+        },
+    )
+    max_gap = ma.fields.Int(
+        validate=ma.validate.Range(min=1),
+        metadata={
+            "description": (
+                "Resampling only. Maximum gap, in seconds, from the previous "
+                "value (ffill) or between surrounding values (linear). "
+                "Values are looked up at most max_gap (default: grid step) "
+                "around the interval."
+            ),
+        },
+    )
+
+    min_value = ma.fields.Float(
+        allow_nan=False,
+        metadata={
+            "description": (
+                "Only return values greater than or equal to min_value, "
+                "after unit conversion."
+            ),
+        },
+    )
+    max_value = ma.fields.Float(
+        allow_nan=False,
+        metadata={
+            "description": (
+                "Only return values lower than or equal to max_value, "
+                "after unit conversion."
+            ),
+        },
+    )
+
+    rolling_window_value = ma.fields.Int(
+        load_default=1,
+        validate=ma.validate.Range(min=1),
+        metadata={
+            "description": "Rolling window length value",
+        },
+    )
+    rolling_window_unit = ma.fields.String(
+        validate=ma.validate.OneOf(FIXED_SIZE_PERIODS),
+        metadata={
+            "description": (
+                "Rolling window length unit. If passed, rolling_function is "
+                "computed over the window ending at each output time, "
+                "end included. Data from one window before start_time is used."
+            ),
+        },
+    )
+    rolling_function = ma.fields.String(
+        load_default="avg",
+        validate=ma.validate.OneOf(ROLLING_FUNCTIONS),
+        metadata={
+            "description": "Rolling window only. Function computed on the window.",
+        },
+    )
+    rolling_step_value = ma.fields.Int(
+        load_default=1,
+        validate=ma.validate.Range(min=1),
+        metadata={
+            "description": "Rolling window only. Output step value",
+        },
+    )
+    rolling_step_unit = ma.fields.String(
+        validate=ma.validate.OneOf(FIXED_SIZE_PERIODS),
+        metadata={
+            "description": (
+                "Rolling window only. Output step unit. If passed, output times "
+                "are points of a regular grid. Otherwise, data timestamps."
+            ),
+        },
+    )
+
+    @ma.validates_schema
+    def validate_compact(self, data, **kwargs):
+        if data["compact"] and (data["stream"] or data["format"] == "long"):
+            raise ma.ValidationError(
+                "compact is not compatible with stream or long format.",
+                field_name="compact",
+            )
+
+    @ma.validates_schema
+    def validate_max_points(self, data, **kwargs):
+        if "max_points" in data and (data["stream"] or data["format"] == "long"):
+            raise ma.ValidationError(
+                "max_points is not compatible with stream or long format.",
+                field_name="max_points",
+            )
+
+    @ma.validates_schema
+    def validate_resample(self, data, **kwargs):
+        if "resample_step_unit" not in data:
+            return
+        if data["stream"] or data["format"] == "long" or "max_points" in data:
+            raise ma.ValidationError(
+                "Resampling is not compatible with stream, long format "
+                "or max_points.",
+                field_name="resample_step_unit",
+            )
+        if len(data["fill"]) not in (1, len(data.get("timeseries", []))):
+            raise ma.ValidationError(
+                "fill must be a single method or the same size as timeseries.",
+                field_name="fill",
+            )
+
+    @ma.validates_schema
+    def validate_value_range(self, data, **kwargs):
+        if "min_value" not in data and "max_value" not in data:
+            return
+        if (
+            data["stream"]
+            or data["format"] == "long"
+            or "resample_step_unit" in data
+            or "rolling_window_unit" in data
+        ):
+            raise ma.ValidationError(
+                "min_value and max_value are not compatible with stream, "
+                "long format, resampling or rolling window.",
+                field_name="min_value",
+            )
+        if data.get("min_value", -float("inf")) > data.get("max_value", float("inf")):
+            raise ma.ValidationError(
+                "min_value must be lower than or equal to max_value.",
+                field_name="min_value",
+            )
+
+    @ma.validates_schema
+    def validate_rolling(self, data, **kwargs):
+        if "rolling_window_unit" not in data:
+            if "rolling_step_unit" in data:
+                raise ma.ValidationError(
+                    "rolling_step_unit requires rolling_window_unit.",
+                    field_name="rolling_step_unit",
+                )
+            return
+        if data["stream"] or data["format"] == "long" or "resample_step_unit" in data:
+            raise ma.ValidationError(
+                "Rolling window is not compatible with stream, long format "
+                "or resampling.",
+                field_name="rolling_window_unit",
+            )
+
+
 class TimeseriesDataGetByIDQueryArgsSchema(
-    TimeseriesDataGetBaseQueryArgsSchema, TimeseriesIDListMixinSchema
+    TimeseriesDataGetRawBaseQueryArgsSchema, TimeseriesSelectorMixinSchema
 ):
     """Timeseries values GET by ID query parameters schema"""
 
 
 class TimeseriesDataGetByNameQueryArgsSchema(
-    TimeseriesDataGetBaseQueryArgsSchema, TimeseriesNameListMixinSchema
+    TimeseriesDataGetRawBaseQueryArgsSchema, TimeseriesNameListMixinSchema
 ):
     """Timeseries values GET by name query parameters schema"""
 
@@ -240,14 +747,57 @@ class TimeseriesDataGetAggregateBaseQueryArgsSchema(
 ):
     """Timeseries values aggregate GET query parameters base schema"""
 
-    aggregation = ma.fields.String(
-        load_default="avg",
-        validate=ma.validate.OneOf(AGGREGATION_FUNCTIONS),
+    aggregation = ma.fields.List(
+        ma.fields.String(validate=validate_aggregation),
+        load_default=["avg"],
+        validate=ma.validate.Length(min=1),
+        metadata={
+            "description": (
+                "List of aggregation functions. If several functions are passed, "
+                'columns are labelled "<timeseries>:<aggregation>". '
+                "time_weighted_avg weights each value by the time it remains "
+                "valid in the bucket, including the last value before the bucket. "
+                "delta is the increase of a cumulative counter in the bucket, "
+                "a decrease being considered a counter reset. "
+                "p<percentile> is a percentile, with continuous interpolation, "
+                "percentile being in [0, 100] (e.g. p5, p50, p99.9)."
+            ),
+        },
     )
 
+    reduce = ma.fields.String(
+        validate=ma.validate.OneOf(REDUCE_FUNCTIONS),
+        metadata={
+            "description": (
+                "Reduce timeseries into a single one, labelled with the function "
+                "name, by applying this function to each bucket. "
+                "Timeseries must have the same unit, after conversion."
+            ),
+        },
+    )
+    reduce_unit = ma_fields.UnitSymbol(
+        metadata={
+            "description": (
+                "Reduce only. Unit to convert all timeseries to before reducing."
+            ),
+        },
+    )
+
+    @ma.validates_schema
+    def validate_reduce_unit(self, data, **kwargs):
+        if "reduce_unit" in data and "reduce" not in data:
+            raise ma.ValidationError(
+                "reduce_unit requires reduce.", field_name="reduce_unit"
+            )
+
+    @ma.post_load
+    def make_aggregation_unique(self, data, **kwargs):
+        data["aggregation"] = list(dict.fromkeys(data["aggregation"]))
+        return data
+
 
 class TimeseriesDataGetByIDAggregateQueryArgsSchema(
-    TimeseriesDataGetAggregateBaseQueryArgsSchema, TimeseriesIDListMixinSchema
+    TimeseriesDataGetAggregateBaseQueryArgsSchema, TimeseriesSelectorMixinSchema
 ):
     """Timeseries values aggregate GET by ID query parameters schema"""
 
@@ -258,6 +808,64 @@ class TimeseriesDataGetByNameAggregateQueryArgsSchema(
     """Timeseries values aggregate GET by name query parameters schema"""
 
 
+class TimeseriesDataQuerySchema(Schema):
+    """Timeseries values batch query schema"""
+
+    _ARGS_SCHEMAS = {
+        (False, False): TimeseriesDataGetByIDQueryArgsSchema,
+        (False, True): TimeseriesDataGetByNameQueryArgsSchema,
+        (True, False): TimeseriesDataGetByIDAggregateQueryArgsSchema,
+        (True, True): TimeseriesDataGetByNameAggregateQueryArgsSchema,
+    }
+
+    campaign_id = ma.fields.Int(
+        metadata={
+            "description": "Campaign ID. If passed, timeseries are passed by name.",
+        },
+    )
+    aggregate = ma.fields.Boolean(
+        load_default=False,
+        metadata={
+            "description": "Aggregate data",
+        },
+    )
+    args = ma.fields.Dict(
+        required=True,
+        metadata={
+            "description": (
+                "Query arguments. Same as the query parameters of the "
+                "corresponding GET endpoint, except stream and format."
+            ),
+        },
+    )
+
+    @ma.post_load
+    def load_args(self, data, **kwargs):
+        schema = self._ARGS_SCHEMAS[(data["aggregate"], "campaign_id" in data)]
+        try:
+            data["args"] = schema().load(data["args"])
+        except ma.ValidationError as exc:
+            raise ma.ValidationError(exc.messages, field_name="args") from exc
+        if not data["aggregate"] and (
+            data["args"]["stream"] or data["args"]["format"] == "long"
+        ):
+            raise ma.ValidationError(
+                "stream and long format are not available in batch queries.",
+                field_name="args",
+            )
+        return data
+
+
+class TimeseriesDataQueriesSchema(Schema):
+    """Timeseries values batch queries schema"""
+
+    queries = ma.fields.List(
+        ma.fields.Nested(TimeseriesDataQuerySchema),
+        required=True,
+        validate=ma.validate.Length(min=1),
+    )
+
+
 class TimeseriesDataPostQueryArgsSchema(Schema):
     """Timeseries values POST query parameters schema"""
 
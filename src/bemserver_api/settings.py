@@ -24,5 +24,65 @@ class Config:
         "show-components": "true",
     }
 
+    # Timeseries data
+    # Duration of the time windows used to query data in streamed CSV and Arrow
+    # exports, whose rows hold all timeseries values at a timestamp
+    TIMESERIES_DATA_STREAM_WINDOW_HOURS = 24
+    # Number of rows fetched at once from database in long format and streamed
+    # JSON exports, which are grouped by timeseries and read by a single query
+    TIMESERIES_DATA_STREAM_BATCH_SIZE = 10000
+    # Maximum number of queries in a batch query
+    TIMESERIES_DATA_QUERY_MAX_QUERIES = 100
+    # Number of threads (hence DB connections) used to run a batch query
+    TIMESERIES_DATA_QUERY_MAX_WORKERS = 4
+    # Write watermarks backend used for conditional requests and aggregate cache:
+    # "memory", a redis URL, or "" to disable watermarks. "memory" only knows the
+    # writes made through the current process: use redis with several API
+    # processes (requires redis, available as "redis" extra).
+    TIMESERIES_DATA_WATERMARKS_BACKEND = ""
+    # Answer conditional requests on timeseries data from write watermarks.
+    # Watermarks only know the writes made through the API and by the cleanup:
+    # only enable if timeseries data is not written by other means.
+    TIMESERIES_DATA_CONDITIONAL_REQUESTS = False
+    # Cache-Control max-age (seconds) of data requests on a past time interval
+    TIMESERIES_DATA_CACHE_MAX_AGE = 3600
+    # Aggregate result cache backend: "memory", a redis URL, or "" to disable
+    # the cache. Requires write watermarks. "memory" is only invalidated by the
+    # writes of the current process: use redis with several API processes
+    # (requires redis, available as "redis" extra). "memory" cache and
+    # watermarks together are only allowed with TESTING or DEBUG.
+    TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND = ""
+    # Maximum size (bytes) of the "memory" aggregate cache
+    TIMESERIES_DATA_AGGREGATE_CACHE_MAX_SIZE = 64 * 1024 * 1024
+    # Expiration time (seconds) of aggregate cache entries
+    TIMESERIES_DATA_AGGREGATE_CACHE_TTL = 24 * 3600
+    # Maintain hourly and daily rollups to compute aggregates from. Rollup tables
+    # and triggers logging data changes are created by bemserver_api_setup_db
+    # command.
+    TIMESERIES_DATA_ROLLUPS = False
+    # Maintain per timeseries stats summaries to read stats from. Stats table and
+    # triggers updating it on data changes are created by bemserver_api_setup_db
+    # command.
+    TIMESERIES_DATA_STATS_SUMMARIES = False
+    # Name of the timeseries property holding virtual timeseries formulas, or ""
+    # to disable virtual timeseries
+    TIMESERIES_DATA_FORMULA_PROPERTY = ""
+
+    # Response compression
+    # Algorithms by order of preference ("zstd" requires zstandard)
+    COMPRESS_ALGORITHMS = ["zstd", "gzip"]
+    COMPRESS_MIMETYPES = [
+        "application/json",
+        "text/csv",
+        "application/vnd.apache.arrow.stream",
+    ]
+    # Non-streamed responses smaller than this size (bytes) are not compressed
+    COMPRESS_MIN_SIZE = 500
+    # Streamed responses are flushed every time this size (bytes) of data is
+    # compressed
+    COMPRESS_STREAM_FLUSH_SIZE = 64 * 1024
+    COMPRESS_GZIP_LEVEL = 6
+    COMPRESS_ZSTD_LEVEL = 3
+
     # Profiling
     PROFILE_DIR = ""
@@ -12,6 +12,12 @@ class TestConfig(Config):
         "Bearer",
         "Basic",
     ]
+    TIMESERIES_DATA_WATERMARKS_BACKEND = "memory"
+    TIMESERIES_DATA_CONDITIONAL_REQUESTS = True
+    TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND = "memory"
+    TIMESERIES_DATA_ROLLUPS = True
+    TIMESERIES_DATA_STATS_SUMMARIES = True
+    TIMESERIES_DATA_FORMULA_PROPERTY = "Formula"
 
 
 AUTH_HEADER = ContextVar("auth_header", default=None)
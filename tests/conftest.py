@@ -15,6 +15,7 @@ from bemserver_core.commands import setup_db
 from bemserver_core.database import db
 
 import bemserver_api
+from bemserver_api.commands import setup_db as api_setup_db
 from tests.common import AUTH_HEADER, TestConfig, make_token
 
 
@@ -71,6 +72,7 @@ def app(request, bsc_config, monkeypatch):
         application = bemserver_api.create_app()
     application.test_client_class = TestClient
     setup_db()
+    api_setup_db()
     yield application
     db.session.remove()
 
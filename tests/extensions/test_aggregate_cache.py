@@ -0,0 +1,107 @@
+"""Test aggregate cache extension"""
+
+import math
+from unittest import mock
+
+import pytest
+
+import flask
+
+from bemserver_api.extensions.aggregate_cache import (
+    AggregateCache,
+    MemoryAggregateCacheStore,
+    RedisAggregateCacheStore,
+)
+from bemserver_api.extensions.watermarks import watermarks
+from bemserver_api.settings import Config
+
+
+class TestAggregateCache:
+    def test_memory_aggregate_cache_store_lru(self):
+        store = MemoryAggregateCacheStore(max_size=10, ttl=3600)
+        store.set("a", b"1234", [(1, 1)], 0.0, 10.0)
+        store.set("b", b"1234", [(2, 1)], 0.0, 10.0)
+        assert store.size == 8
+        # Access "a" so that "b" is the least recently used
+        assert store.get("a") == b"1234"
+        store.set("c", b"1234", [(3, 1)], 0.0, 10.0)
+        assert store.get("b") is None
+        assert store.get("a") == b"1234"
+        assert store.get("c") == b"1234"
+        assert store.size == 8
+        # Entries bigger than max size are not stored
+        store.set("d", b"12345678901", [(4, 1)], 0.0, 10.0)
+        assert store.get("d") is None
+        store.delete("a")
+        assert store.get("a") is None
+        assert store.size == 4
+
+    def test_memory_aggregate_cache_store_invalidate(self):
+        store = MemoryAggregateCacheStore(max_size=100, ttl=3600)
+        store.set("a", b"1", [(1, 1), (2, 1)], 0.0, 10.0)
+        store.set("b", b"1", [(1, 1)], 10.0, 20.0)
+        store.set("c", b"1", [(1, 1)], -math.inf, 20.0)
+        # Other data state
+        store.invalidate({(1, 2): (0.0, 20.0)})
+        assert all(store.get(key) for key in "abc")
+        # Interval after entries
+        store.invalidate({(1, 1): (20.0, 30.0)})
+        assert all(store.get(key) for key in "abc")
+        store.invalidate({(1, 1): (10.0, 12.0)})
+        assert store.get("a")
+        assert store.get("b") is None
+        assert store.get("c") is None
+        store.invalidate({(2, 1): (-math.inf, math.inf)})
+        assert store.get("a") is None
+        assert store.size == 0
+
+    def test_memory_aggregate_cache_store_ttl(self):
+        store = MemoryAggregateCacheStore(max_size=100, ttl=10)
+        with mock.patch("time.monotonic", return_value=1000.0):
+            store.set("a", b"1234", [(1, 1)], 0.0, 10.0)
+        with mock.patch("time.monotonic", return_value=1009.0):
+            assert store.get("a") == b"1234"
+        with mock.patch("time.monotonic", return_value=1010.0):
+            assert store.get("a") is None
+        assert store.size == 0
+
+    def test_aggregate_cache_init_app(self):
+        app = flask.Flask(__name__)
+        app.config.from_object(Config)
+        old_store = watermarks.store
+        try:
+            watermarks.init_app(app)
+            assert not AggregateCache(app).enabled
+            app.config["TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND"] = "memory"
+            with pytest.raises(RuntimeError):
+                AggregateCache(app)
+            app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = "memory"
+            watermarks.init_app(app)
+            # Memory cache and watermarks only in a single process setup
+            with pytest.raises(RuntimeError, match="current process"):
+                AggregateCache(app)
+            app.config["TESTING"] = True
+            aggregate_cache = AggregateCache(app)
+            assert isinstance(aggregate_cache.store, MemoryAggregateCacheStore)
+            assert (
+                aggregate_cache.store.ttl == Config.TIMESERIES_DATA_AGGREGATE_CACHE_TTL
+            )
+            assert aggregate_cache.invalidate in watermarks.write_callbacks
+            watermarks.write_callbacks.remove(aggregate_cache.invalidate)
+            app.config["TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND"] = "redis://localhost"
+            aggregate_cache = AggregateCache(app)
+            assert isinstance(aggregate_cache.store, RedisAggregateCacheStore)
+            watermarks.write_callbacks.remove(aggregate_cache.invalidate)
+
+            # Wrong backend
+            app.config["TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND"] = "dummy"
+            with pytest.raises(RuntimeError, match="redis URL"):
+                AggregateCache(app)
+
+            # Redis not available
+            app.config["TIMESERIES_DATA_AGGREGATE_CACHE_BACKEND"] = "redis://localhost"
+            with mock.patch("bemserver_api.extensions.watermarks.redis", None):
+                with pytest.raises(RuntimeError, match='"redis" extra'):
+                    AggregateCache(app)
+        finally:
+            watermarks.store = old_store
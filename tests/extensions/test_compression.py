@@ -0,0 +1,145 @@
+"""Test compression extension"""
+
+import gzip
+import json
+import zlib
+from unittest import mock
+
+import pytest
+
+import flask
+
+import zstandard
+
+from bemserver_api.extensions.compression import Compress, GzipCompressor
+from bemserver_api.settings import Config
+
+DATA = {str(i): float(i) for i in range(1000)}
+
+
+@pytest.fixture
+def compress_app():
+    app = flask.Flask(__name__)
+    app.config.from_object(Config)
+
+    @app.route("/json")
+    def get_json():
+        return flask.jsonify(DATA)
+
+    @app.route("/small")
+    def get_small():
+        return flask.jsonify({"a": 1})
+
+    @app.route("/text")
+    def get_text():
+        return json.dumps(DATA)
+
+    @app.route("/stream")
+    def get_stream():
+        def generate():
+            yield "Datetime,1\n"
+            for i in range(1000):
+                yield f"2020-01-01T00:00:{i:02}+0000,{i}\n"
+
+        return flask.Response(generate(), mimetype="text/csv")
+
+    Compress(app)
+    return app
+
+
+def read_stream(ret, decompress):
+    return decompress(b"".join(ret.response))
+
+
+class TestCompression:
+    @pytest.mark.parametrize(
+        "encoding, decompress",
+        (
+            ("gzip", gzip.decompress),
+            (
+                "zstd",
+                lambda data: zstandard.ZstdDecompressor()
+                .decompressobj()
+                .decompress(data),
+            ),
+        ),
+    )
+    def test_compression(self, compress_app, encoding, decompress):
+        client = compress_app.test_client()
+
+        ret = client.get("/json", headers={"Accept-Encoding": encoding})
+        assert ret.status_code == 200
+        assert ret.headers["Content-Encoding"] == encoding
+        assert "Accept-Encoding" in ret.headers["Vary"]
+        assert int(ret.headers["Content-Length"]) == len(ret.data)
+        assert json.loads(decompress(ret.data)) == DATA
+
+        # Streamed response
+        ret = client.get("/stream", headers={"Accept-Encoding": encoding})
+        assert ret.status_code == 200
+        assert ret.is_streamed
+        assert ret.headers["Content-Encoding"] == encoding
+        assert "Content-Length" not in ret.headers
+        lines = decompress(ret.data).decode().splitlines()
+        assert len(lines) == 1001
+        assert lines[1] == "2020-01-01T00:00:00+0000,0"
+
+        # Response too small
+        ret = client.get("/small", headers={"Accept-Encoding": encoding})
+        assert ret.status_code == 200
+        assert "Content-Encoding" not in ret.headers
+        assert ret.json == {"a": 1}
+
+        # Mime type not compressed
+        ret = client.get("/text", headers={"Accept-Encoding": encoding})
+        assert ret.status_code == 200
+        assert "Content-Encoding" not in ret.headers
+
+        # Error
+        ret = client.get("/dummy", headers={"Accept-Encoding": encoding})
+        assert ret.status_code == 404
+        assert "Content-Encoding" not in ret.headers
+
+    def test_compression_negotiation(self, compress_app):
+        client = compress_app.test_client()
+
+        # No Accept-Encoding header
+        ret = client.get("/json")
+        assert "Content-Encoding" not in ret.headers
+        assert ret.json == DATA
+
+        # Unknown encoding
+        ret = client.get("/json", headers={"Accept-Encoding": "br"})
+        assert "Content-Encoding" not in ret.headers
+
+        # Server preference
+        ret = client.get("/json", headers={"Accept-Encoding": "gzip, zstd"})
+        assert ret.headers["Content-Encoding"] == "zstd"
+
+        # Client preference
+        ret = client.get("/json", headers={"Accept-Encoding": "gzip, zstd;q=0.5"})
+        assert ret.headers["Content-Encoding"] == "gzip"
+
+    def test_compression_zstd_not_available(self):
+        app = flask.Flask(__name__)
+        app.config.from_object(Config)
+
+        @app.route("/json")
+        def get_json():
+            return flask.jsonify(DATA)
+
+        with mock.patch("bemserver_api.extensions.compression.zstandard", None):
+            Compress(app)
+        client = app.test_client()
+        ret = client.get("/json", headers={"Accept-Encoding": "zstd, gzip"})
+        assert ret.headers["Content-Encoding"] == "gzip"
+
+    def test_compression_stream_flush(self):
+        chunks = [f"{i:09}\n".encode() for i in range(1000)]
+
+        ret = list(Compress._compress_stream(GzipCompressor(6), chunks, 4096))
+        assert gzip.decompress(b"".join(ret)) == b"".join(chunks)
+        # Header, then a flush every 4096 bytes of input, then end of stream
+        assert len(ret) == 4
+        decompressor = zlib.decompressobj(31)
+        assert decompressor.decompress(b"".join(ret[:2])) == b"".join(chunks[:410])
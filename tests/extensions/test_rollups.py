@@ -0,0 +1,50 @@
+"""Test rollups extension"""
+
+import datetime as dt
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from bemserver_api.extensions.rollups import Rollups
+
+
+class TestRollups:
+    @pytest.mark.parametrize(
+        "timezone, bucket_width_unit, expected",
+        (
+            ("UTC", "second", None),
+            ("UTC", "minute", None),
+            ("UTC", "hour", "hour"),
+            ("UTC", "day", "day"),
+            ("UTC", "week", "day"),
+            ("UTC", "month", "day"),
+            ("UTC", "year", "day"),
+            ("Europe/Paris", "hour", "hour"),
+            ("Europe/Paris", "day", "hour"),
+            ("Europe/Paris", "month", "hour"),
+            ("Asia/Kolkata", "hour", None),
+            ("Asia/Kolkata", "day", None),
+        ),
+    )
+    def test_rollups_get_period(self, timezone, bucket_width_unit, expected):
+        tz_info = ZoneInfo(timezone)
+        start_dt = dt.datetime(2020, 1, 1, tzinfo=tz_info)
+        end_dt = dt.datetime(2021, 1, 1, tzinfo=tz_info)
+        assert Rollups.get_period(start_dt, end_dt, bucket_width_unit) == expected
+
+    def test_rollups_merge_changes(self):
+        def utc(*args):
+            return dt.datetime(*args, tzinfo=dt.timezone.utc)
+
+        assert Rollups._merge_changes([]) == []
+        assert Rollups._merge_changes(
+            [
+                (utc(2020, 1, 5, 12), utc(2020, 1, 5, 12)),
+                (utc(2020, 1, 1, 12), utc(2020, 1, 2)),
+                (utc(2020, 1, 3, 6), utc(2020, 1, 3, 18)),
+                (utc(2020, 1, 1), utc(2020, 1, 1, 1)),
+            ]
+        ) == [
+            (utc(2020, 1, 1), utc(2020, 1, 4)),
+            (utc(2020, 1, 5), utc(2020, 1, 6)),
+        ]
@@ -0,0 +1,54 @@
+"""Test watermarks extension"""
+
+from unittest import mock
+
+import pytest
+
+import flask
+
+from bemserver_api.extensions.watermarks import (
+    MemoryWatermarkStore,
+    RedisWatermarkStore,
+    Watermarks,
+)
+from bemserver_api.settings import Config
+
+
+class TestWatermarks:
+    def test_memory_watermark_store(self):
+        store = MemoryWatermarkStore()
+        assert store.get_many(["1:1", "2:1"]) == [None, None]
+        assert store.setdefault_many(["1:1"], 12.0) == [12.0]
+        assert store.setdefault_many(["1:1", "2:1"], 42.0) == [12.0, 42.0]
+        store.set_many(["1:1"], 69.0)
+        assert store.get_many(["1:1", "2:1"]) == [69.0, 42.0]
+
+    def test_watermarks_init_app(self):
+        app = flask.Flask(__name__)
+        app.config.from_object(Config)
+        assert not Watermarks(app).enabled
+        app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = "memory"
+        watermarks = Watermarks(app)
+        assert watermarks.enabled
+        assert isinstance(watermarks.store, MemoryWatermarkStore)
+        assert not watermarks.conditional_requests
+        app.config["TIMESERIES_DATA_CONDITIONAL_REQUESTS"] = True
+        assert Watermarks(app).conditional_requests
+        app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = "redis://localhost"
+        assert isinstance(Watermarks(app).store, RedisWatermarkStore)
+
+        # Wrong backend
+        app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = "dummy"
+        with pytest.raises(RuntimeError, match="redis URL"):
+            Watermarks(app)
+
+        # Conditional requests without watermarks
+        app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = ""
+        with pytest.raises(RuntimeError, match="require write watermarks"):
+            Watermarks(app)
+
+        # Redis not available
+        app.config["TIMESERIES_DATA_WATERMARKS_BACKEND"] = "redis://localhost"
+        with mock.patch("bemserver_api.extensions.watermarks.redis", None):
+            with pytest.raises(RuntimeError, match='"redis" extra'):
+                Watermarks(app)
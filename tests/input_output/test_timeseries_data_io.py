@@ -0,0 +1,81 @@
+"""Timeseries data I/O tests"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from bemserver_api.input_output.timeseries_data_buckets_io import (
+    TimeseriesDataBucketsIO,
+)
+from bemserver_api.input_output.timeseries_data_stream_io import (
+    isoformat,
+    iter_time_windows,
+)
+
+
+class TestTimeseriesDataIO:
+    def test_iter_time_windows(self):
+        start_dt = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+        end_dt = dt.datetime(2020, 1, 3, 12, tzinfo=dt.timezone.utc)
+        day = dt.timedelta(days=1)
+
+        assert list(iter_time_windows(start_dt, end_dt, day)) == [
+            (start_dt, start_dt + day),
+            (start_dt + day, start_dt + 2 * day),
+            (start_dt + 2 * day, end_dt),
+        ]
+        assert list(iter_time_windows(start_dt, start_dt + day, day)) == [
+            (start_dt, start_dt + day),
+        ]
+        assert not list(iter_time_windows(start_dt, start_dt, day))
+        assert not list(iter_time_windows(end_dt, start_dt, day))
+
+    def test_isoformat(self):
+        index = pd.DatetimeIndex(
+            [
+                "2020-01-01T00:00:00+00:00",
+                "2020-07-01T00:00:00.250000+00:00",
+                "2020-07-01T00:00:00.000001+00:00",
+            ]
+        ).tz_convert("Europe/Paris")
+        assert isoformat(index) == [x.isoformat() for x in index]
+        assert isoformat(index) == [
+            "2020-01-01T01:00:00+01:00",
+            "2020-07-01T02:00:00.250000+02:00",
+            "2020-07-01T02:00:00.000001+02:00",
+        ]
+        assert isoformat(index[:0]) == []
+
+
+class TestTimeseriesDataBucketsIO:
+    def test_time_weighted_avg(self):
+        times = np.array([0.0, 30.0, 45.0, 120.0])
+        values = np.array([0.0, 10.0, 20.0, 40.0])
+        edges = np.array([-60.0, 0.0, 60.0, 120.0, 180.0, 240.0])
+
+        ret = TimeseriesDataBucketsIO._time_weighted_avg(times, values, edges, 240.0)
+        assert np.array_equal(ret, [np.nan, 7.5, 20.0, 40.0, 40.0], equal_nan=True)
+
+        # Last value not valid after stop
+        ret = TimeseriesDataBucketsIO._time_weighted_avg(times, values, edges, 150.0)
+        assert np.array_equal(ret, [np.nan, 7.5, 20.0, 40.0, np.nan], equal_nan=True)
+
+        # First sample in the middle of a bucket
+        ret = TimeseriesDataBucketsIO._time_weighted_avg(
+            times[1:], values[1:], edges, 240.0
+        )
+        assert np.array_equal(ret, [np.nan, 15.0, 20.0, 40.0, 40.0], equal_nan=True)
+
+    def test_delta(self):
+        times = np.array([-30.0, 0.0, 30.0, 90.0, 100.0, 150.0])
+        values = np.array([10.0, 12.0, 15.0, 3.0, 5.0, 5.0])
+        edges = np.array([0.0, 60.0, 120.0, 180.0, 240.0])
+
+        ret = TimeseriesDataBucketsIO._delta(times, values, edges, 240.0)
+        # Reset between 30 and 90: increase is the new value
+        assert np.array_equal(ret, [5.0, 5.0, 0.0, np.nan], equal_nan=True)
+
+        # Single sample
+        ret = TimeseriesDataBucketsIO._delta(times[:1], values[:1], edges, 240.0)
+        assert np.all(np.isnan(ret))
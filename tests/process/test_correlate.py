@@ -0,0 +1,44 @@
+"""Correlation tests"""
+
+import numpy as np
+import pandas as pd
+
+from bemserver_api.process.correlation import correlate, correlate_df
+
+
+class TestCorrelation:
+    def test_correlate(self):
+        rng = np.random.default_rng(42)
+        values = rng.normal(size=(100, 4)) * 10 + 1e6
+        values[:, 1] = 2 * values[:, 0] + rng.normal(size=100)
+        values[rng.random((100, 4)) < 0.2] = np.nan
+        # Constant timeseries
+        values[:, 3] = 1.0
+
+        data_df = pd.DataFrame(values)
+        ret = correlate(values)
+        expected = data_df.corr().to_numpy()
+        assert np.allclose(ret, expected, equal_nan=True)
+        assert ret[0, 1] > 0.99
+        assert np.isnan(ret[3]).all()
+
+        ret = correlate(values, "covariance")
+        assert np.allclose(ret, data_df.cov().to_numpy(), equal_nan=True)
+
+        # Min periods
+        values[2:, 2] = np.nan
+        ret = correlate(values, min_periods=3)
+        assert np.isnan(ret[2]).all()
+        assert np.isnan(ret[:, 2]).all()
+
+        # No data
+        ret = correlate(np.empty((0, 2)))
+        assert ret.shape == (2, 2)
+        assert np.isnan(ret).all()
+
+    def test_correlate_df(self):
+        data_df = pd.DataFrame({1: [0.0, 1.0, 2.0], 2: [2.0, np.nan, 0.0]})
+        ret = correlate_df(data_df)
+        assert list(ret.index) == [1, 2]
+        assert list(ret.columns) == [1, 2]
+        assert np.array_equal(ret.to_numpy(), [[1.0, -1.0], [-1.0, 1.0]])
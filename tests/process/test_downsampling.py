@@ -0,0 +1,83 @@
+"""Downsampling tests"""
+
+import pytest
+
+import numpy as np
+import pandas as pd
+
+from bemserver_api.process.downsampling import downsample, lttb, minmax
+
+
+class TestDownsampling:
+    def test_lttb(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[42] = 12
+        y[69] = -12
+
+        indices = lttb(x, y, 10)
+        assert len(indices) == 10
+        assert indices[0] == 0
+        assert indices[-1] == 99
+        assert np.all(np.diff(indices) > 0)
+        assert 42 in indices
+        assert 69 in indices
+
+        # Less points than max_points
+        assert np.array_equal(lttb(x[:5], y[:5], 10), np.arange(5))
+        assert np.array_equal(lttb(x[:10], y[:10], 10), np.arange(10))
+
+    def test_minmax(self):
+        x = np.arange(100, dtype=float)
+        y = np.zeros(100)
+        y[42] = 12
+        y[69] = -12
+
+        indices = minmax(x, y, 10)
+        assert len(indices) <= 10
+        assert np.all(np.diff(indices) > 0)
+        assert 42 in indices
+        assert 69 in indices
+
+        # Increasing values: first and last point of each bucket
+        y = np.arange(100, dtype=float)
+        assert list(minmax(x, y, 10)) == [0, 19, 20, 39, 40, 59, 60, 79, 80, 99]
+
+        # Less points than max_points
+        assert np.array_equal(minmax(x[:5], y[:5], 10), np.arange(5))
+
+    @pytest.mark.parametrize("method", ("lttb", "minmax"))
+    def test_downsample(self, method):
+        index = pd.date_range(
+            "2020-01-01", periods=100, freq="h", tz="UTC", name="Datetime"
+        ).tz_convert("Europe/Paris")
+        data_df = pd.DataFrame(
+            {
+                1: np.sin(np.arange(100) / 10),
+                2: np.arange(100, dtype=float),
+                3: np.nan,
+            },
+            index=index,
+        )
+        data_df.iloc[42, 0] = 12
+        data_df.iloc[5:50, 1] = np.nan
+
+        ret = downsample(data_df, 10, method)
+        assert list(ret.columns) == [1, 2, 3]
+        assert ret.index.dtype == index.dtype
+        assert ret.index.name == "Datetime"
+        assert ret.index.is_monotonic_increasing
+        assert list(ret.count()) == [10, 10, 0]
+        assert ret[1].max() == 12
+        assert ret.loc[index[0], 2] == 0
+        assert ret.loc[index[-1], 2] == 99
+
+        # Less points than max_points
+        ret = downsample(data_df, 100, method)
+        assert ret.equals(data_df.loc[data_df.notna().any(axis=1)])
+
+        # Empty dataframe
+        ret = downsample(data_df.iloc[:0], 10, method)
+        assert ret.empty
+        assert list(ret.columns) == [1, 2, 3]
+        assert ret.index.dtype == index.dtype
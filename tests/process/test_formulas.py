@@ -0,0 +1,57 @@
+"""Formulas tests"""
+
+from unittest import mock
+
+import pytest
+
+import numpy as np
+
+from bemserver_api.process.formulas import Formula, FormulaError
+
+
+class TestFormulas:
+    def test_formula(self):
+        formula = Formula("sqrt(ts_2 ** 2 + ts_1 ** 2) / -ts_2 + max(ts_1, 3)")
+        assert formula.timeseries_ids == [2, 1]
+        ret = formula.evaluate(
+            {1: np.array([4.0, 1.0, 1.0]), 2: np.array([3.0, 0.0, np.nan])}, 3
+        )
+        assert np.array_equal(ret, [4.0 - 5.0 / 3.0, np.nan, np.nan], equal_nan=True)
+
+        # Constant
+        formula = Formula("-1.5 + abs(-2)")
+        assert formula.timeseries_ids == []
+        assert np.array_equal(formula.evaluate({}, 2), [0.5, 0.5])
+
+    @pytest.mark.parametrize(
+        "source",
+        (
+            "1 +",
+            "ts_1 // 2",
+            "ts_a",
+            "ts_1.real",
+            "foo(ts_1)",
+            "min(ts_1)",
+            "sqrt(x=ts_1)",
+            "__import__('os')",
+            "'a'",
+            "True",
+            "[ts_1]",
+            # Too long or too deeply nested
+            " + ".join(["ts_1"] * 500),
+            "-" * 200 + "ts_1",
+            "(" * 300 + "ts_1" + ")" * 300,
+            "sqrt(" * 150 + "ts_1" + ")" * 150,
+            "+".join(["1"] * 5000),
+            "-" * 100000 + "1",
+        ),
+    )
+    def test_formula_errors(self, source):
+        with pytest.raises(FormulaError):
+            Formula(source)
+
+    @pytest.mark.parametrize("error", (RecursionError, MemoryError))
+    def test_formula_parser_errors(self, error):
+        with mock.patch("ast.parse", side_effect=error):
+            with pytest.raises(FormulaError, match="too complex"):
+                Formula("ts_1")
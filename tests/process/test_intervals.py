@@ -0,0 +1,25 @@
+"""Time intervals tests"""
+
+import numpy as np
+
+from bemserver_api.process.intervals import bucket_durations
+
+
+class TestIntervals:
+    def test_bucket_durations(self):
+        edges = np.array([0.0, 2.0, 4.0, 10.0, 20.0])
+
+        starts = np.array([1.0, 5.0])
+        ends = np.array([3.0, 12.0])
+        ret = bucket_durations(starts, ends, edges)
+        assert np.array_equal(ret, [1.0, 1.0, 5.0, 2.0])
+
+        # Intervals overflowing edges
+        starts = np.array([-5.0, 15.0])
+        ends = np.array([1.0, 30.0])
+        ret = bucket_durations(starts, ends, edges)
+        assert np.array_equal(ret, [1.0, 0.0, 0.0, 5.0])
+
+        # No interval
+        ret = bucket_durations(np.array([]), np.array([]), edges)
+        assert np.array_equal(ret, [0.0, 0.0, 0.0, 0.0])
@@ -0,0 +1,83 @@
+"""Resampling tests"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from bemserver_api.process.resampling import make_grid, resample, resample_values
+
+
+class TestResampling:
+    def test_resample_values(self):
+        x = np.array([0, 10, 20, 50])
+        y = np.array([0.0, 1.0, 2.0, 5.0])
+        grid = np.array([-5, 0, 5, 10, 35, 50, 55])
+
+        ret = resample_values(x, y, grid, "none")
+        assert np.array_equal(
+            ret, [np.nan, 0.0, np.nan, 1.0, np.nan, 5.0, np.nan], equal_nan=True
+        )
+        ret = resample_values(x, y, grid, "ffill")
+        assert np.array_equal(
+            ret, [np.nan, 0.0, 0.0, 1.0, 2.0, 5.0, 5.0], equal_nan=True
+        )
+        ret = resample_values(x, y, grid, "linear")
+        assert np.array_equal(
+            ret, [np.nan, 0.0, 0.5, 1.0, 3.5, 5.0, np.nan], equal_nan=True
+        )
+
+        # Max gap
+        ret = resample_values(x, y, grid, "ffill", max_gap=10)
+        assert np.array_equal(
+            ret, [np.nan, 0.0, 0.0, 1.0, np.nan, 5.0, 5.0], equal_nan=True
+        )
+        ret = resample_values(x, y, grid, "linear", max_gap=10)
+        assert np.array_equal(
+            ret, [np.nan, 0.0, 0.5, 1.0, np.nan, 5.0, np.nan], equal_nan=True
+        )
+
+        # No data
+        ret = resample_values(x[:0], y[:0], grid, "linear")
+        assert np.isnan(ret).all()
+
+    def test_make_grid(self):
+        start_dt = dt.datetime(2020, 1, 1, 0, 10, tzinfo=dt.timezone.utc)
+        end_dt = dt.datetime(2020, 1, 1, 1, 0, tzinfo=dt.timezone.utc)
+
+        grid = make_grid(start_dt, end_dt, "15min", "Europe/Paris")
+        assert grid.name == "Datetime"
+        assert list(grid) == [
+            pd.Timestamp("2020-01-01T01:15:00+01:00"),
+            pd.Timestamp("2020-01-01T01:30:00+01:00"),
+            pd.Timestamp("2020-01-01T01:45:00+01:00"),
+        ]
+
+    def test_resample(self):
+        index = pd.DatetimeIndex(
+            ["2020-01-01T00:00:00", "2020-01-01T00:20:00", "2020-01-01T01:00:00"],
+            tz="UTC",
+            name="Datetime",
+        ).tz_convert("Europe/Paris")
+        data_df = pd.DataFrame(
+            {1: [0.0, 2.0, 6.0], 2: [0.0, np.nan, 6.0], 3: np.nan},
+            index=index,
+        )
+        grid = make_grid(index[0], index[-1], "30min", "Europe/Paris")
+
+        ret = resample(data_df, grid, {1: "ffill", 2: "linear", 3: "linear"})
+        assert list(ret.columns) == [1, 2, 3]
+        assert ret.index.equals(grid)
+        assert list(ret[1]) == [0.0, 2.0]
+        assert list(ret[2]) == [0.0, 3.0]
+        assert ret[3].isna().all()
+
+        ret = resample(
+            data_df,
+            grid,
+            {1: "linear", 2: "linear", 3: "none"},
+            max_gap=dt.timedelta(minutes=40),
+        )
+        assert list(ret[1]) == [0.0, 3.0]
+        assert ret[2].iloc[0] == 0.0
+        assert np.isnan(ret[2].iloc[1])
@@ -0,0 +1,64 @@
+"""Rolling window tests"""
+
+import datetime as dt
+
+import numpy as np
+import pandas as pd
+
+from bemserver_api.process.resampling import make_grid
+from bemserver_api.process.rolling import rolling, rolling_values
+
+
+class TestRolling:
+    def test_rolling_values(self):
+        index = pd.date_range("2020-01-01", periods=4, freq="h", tz="UTC")
+        ser = pd.Series([0.0, 1.0, 2.0, 3.0], index=index)
+        window = dt.timedelta(hours=2)
+
+        ret = rolling_values(ser, window, "sum")
+        assert np.array_equal(ret, [0.0, 1.0, 3.0, 5.0])
+        ret = rolling_values(ser, window, "avg")
+        assert np.array_equal(ret, [0.0, 0.5, 1.5, 2.5])
+        ret = rolling_values(ser, window, "max")
+        assert np.array_equal(ret, [0.0, 1.0, 2.0, 3.0])
+
+        # Grid, window end included
+        grid = pd.DatetimeIndex(
+            ["2020-01-01T01:00", "2020-01-01T01:30", "2020-01-01T06:00"], tz="UTC"
+        )
+        ret = rolling_values(ser, window, "min", grid)
+        assert np.array_equal(ret, [0.0, 0.0, np.nan], equal_nan=True)
+        ret = rolling_values(ser, window, "count", grid)
+        assert np.array_equal(ret, [2.0, 2.0, 0.0])
+
+        # No data
+        ret = rolling_values(ser[:0], window, "avg", grid)
+        assert np.isnan(ret).all()
+
+    def test_rolling(self):
+        index = pd.date_range(
+            "2020-01-01", periods=6, freq="h", tz="UTC", name="Datetime"
+        ).tz_convert("Europe/Paris")
+        data_df = pd.DataFrame(
+            {
+                1: [0.0, 1.0, 2.0, 3.0, 4.0, 5.0],
+                2: [0.0, np.nan, 2.0, np.nan, 4.0, np.nan],
+            },
+            index=index,
+        )
+        window = dt.timedelta(hours=2)
+
+        # Data timestamps from start time
+        ret = rolling(data_df, window, "sum", index[2])
+        assert list(ret.columns) == [1, 2]
+        assert ret.index.equals(index[2:])
+        assert list(ret[1]) == [3.0, 5.0, 7.0, 9.0]
+        assert np.array_equal(ret[2], [2.0, np.nan, 4.0, np.nan], equal_nan=True)
+
+        # Grid
+        grid = make_grid(index[2], index[-1], "90min", "Europe/Paris")
+        ret = rolling(data_df, window, "count", index[2], grid)
+        assert ret.index.equals(grid)
+        assert ret.index.name == "Datetime"
+        assert list(ret[1]) == [2.0, 2.0]
+        assert list(ret[2]) == [1.0, 1.0]
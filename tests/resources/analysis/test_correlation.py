@@ -0,0 +1,128 @@
+"""Correlation tests"""
+
+import contextlib
+
+import pytest
+
+from tests.common import AuthHeader
+
+CORRELATION_URL = "/analysis/correlation"
+TIMESERIES_DATA_URL = "/timeseries_data/"
+
+
+class TestAnalysisApiCorrelation:
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    def test_analysis_correlation(
+        self,
+        app,
+        user,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": (ts_1_id,),
+            "data_state": ds_id,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "hour",
+        }
+
+        with auth_context:
+            ret = client.get(CORRELATION_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                assert ret.json == {"timeseries": [ts_1_id], "matrix": [[1.0]]}
+
+            # User not in Timeseries group
+            query_string["timeseries"] = (ts_1_id, ts_2_id)
+            ret = client.get(CORRELATION_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            elif user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                assert ret.json == {
+                    "timeseries": [ts_1_id, ts_2_id],
+                    "matrix": [[1.0, 1.0], [1.0, 1.0]],
+                }
+
+                # Anticorrelated timeseries
+                ret = client.post(
+                    TIMESERIES_DATA_URL,
+                    query_string={"data_state": ds_id},
+                    json={
+                        str(ts_1_id): {
+                            "2020-01-02T00:00:00+00:00": 0.0,
+                            "2020-01-02T01:00:00+00:00": 1.0,
+                            "2020-01-02T02:00:00+00:00": 2.0,
+                            "2020-01-02T03:00:00+00:00": 3.0,
+                        },
+                        str(ts_2_id): {
+                            "2020-01-02T00:00:00+00:00": 3.0,
+                            "2020-01-02T01:00:00+00:00": 2.0,
+                            "2020-01-02T02:00:00+00:00": 1.0,
+                            "2020-01-02T03:00:00+00:00": 0.0,
+                        },
+                    },
+                )
+                assert ret.status_code == 201
+                query_string["start_time"] = "2020-01-02T00:00:00+00:00"
+                query_string["end_time"] = "2020-01-02T04:00:00+00:00"
+                ret = client.get(CORRELATION_URL, query_string=query_string)
+                assert ret.status_code == 200
+                assert ret.json["matrix"] == [[1.0, -1.0], [-1.0, 1.0]]
+
+                # Covariance
+                ret = client.get(
+                    CORRELATION_URL,
+                    query_string={**query_string, "method": "covariance"},
+                )
+                assert ret.status_code == 200
+                assert ret.json["matrix"] == [
+                    [pytest.approx(5 / 3), pytest.approx(-5 / 3)],
+                    [pytest.approx(-5 / 3), pytest.approx(5 / 3)],
+                ]
+
+                # Not enough common buckets
+                ret = client.get(
+                    CORRELATION_URL,
+                    query_string={**query_string, "min_periods": 5},
+                )
+                assert ret.status_code == 200
+                assert ret.json["matrix"] == [[None, None], [None, None]]
+
+                # Wrong parameters
+                for arg in (
+                    {"method": "dummy"},
+                    {"aggregation": "dummy"},
+                    {"min_periods": 1},
+                    {"timeseries": []},
+                ):
+                    ret = client.get(
+                        CORRELATION_URL, query_string={**query_string, **arg}
+                    )
+                    assert ret.status_code == 422
@@ -0,0 +1,227 @@
+"""Gaps tests"""
+
+import contextlib
+import datetime as dt
+
+import pytest
+
+from tests.common import AuthHeader
+from tests.utils import create_timeseries_data
+
+from bemserver_core.authorization import OpenBar
+from bemserver_core.database import db
+from bemserver_core.model import (
+    Timeseries,
+    TimeseriesDataState,
+    TimeseriesProperty,
+    TimeseriesPropertyData,
+)
+
+GAPS_URL = "/analysis/gaps"
+
+
+class TestAnalysisApiGaps:
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    def test_analysis_gaps(
+        self,
+        app,
+        user,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": (ts_1_id,),
+            "data_state": ds_id,
+        }
+
+        with auth_context:
+            ret = client.get(GAPS_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                assert ret.json == {
+                    "timeseries": {
+                        str(ts_1_id): {
+                            "name": "Timeseries 0",
+                            "interval": 3600.0,
+                            "undefined_interval": True,
+                            "gaps": [],
+                            "total_duration": 0.0,
+                        },
+                    },
+                }
+
+                # Missing data at interval bounds, other timezone
+                ret = client.get(
+                    GAPS_URL,
+                    query_string={
+                        **query_string,
+                        "start_time": (start_time - dt.timedelta(hours=2)).isoformat(),
+                        "end_time": (end_time + dt.timedelta(hours=2)).isoformat(),
+                        "timezone": "Europe/Paris",
+                    },
+                )
+                assert ret.status_code == 200
+                assert ret.json["timeseries"][str(ts_1_id)] == {
+                    "name": "Timeseries 0",
+                    "interval": 3600.0,
+                    "undefined_interval": True,
+                    "gaps": [
+                        {
+                            "start_time": "2019-12-31T23:00:00+01:00",
+                            "end_time": "2020-01-01T01:00:00+01:00",
+                            "duration": 7200.0,
+                        },
+                        {
+                            "start_time": "2020-01-01T04:00:00+01:00",
+                            "end_time": "2020-01-01T07:00:00+01:00",
+                            "duration": 10800.0,
+                        },
+                    ],
+                    "total_duration": 18000.0,
+                }
+
+                # Interval defined in timeseries properties
+                with OpenBar():
+                    ts_1 = Timeseries.get_by_id(ts_1_id)
+                    interval_prop = TimeseriesProperty.get(name="Interval").first()
+                    TimeseriesPropertyData.new(
+                        timeseries_id=ts_1_id,
+                        property_id=interval_prop.id,
+                        value=600,
+                    )
+                    db.session.commit()
+                    create_timeseries_data(
+                        ts_1,
+                        TimeseriesDataState.get_by_id(ds_id),
+                        [
+                            "2020-01-02T00:00:00+00:00",
+                            "2020-01-02T00:10:00+00:00",
+                            "2020-01-02T00:20:00+00:00",
+                            "2020-01-02T01:00:00+00:00",
+                        ],
+                        [0.0, 1.0, 2.0, 3.0],
+                    )
+                query_string["start_time"] = "2020-01-02T00:00:00+00:00"
+                query_string["end_time"] = "2020-01-02T01:10:00+00:00"
+                ret = client.get(GAPS_URL, query_string=query_string)
+                assert ret.status_code == 200
+                assert ret.json["timeseries"][str(ts_1_id)] == {
+                    "name": "Timeseries 0",
+                    "interval": 600.0,
+                    "undefined_interval": False,
+                    "gaps": [
+                        {
+                            "start_time": "2020-01-02T00:20:00+00:00",
+                            "end_time": "2020-01-02T01:00:00+00:00",
+                            "duration": 2400.0,
+                        },
+                    ],
+                    "total_duration": 2400.0,
+                }
+
+                # Minimum gap duration
+                ret = client.get(
+                    GAPS_URL, query_string={**query_string, "min_duration": 3000}
+                )
+                assert ret.status_code == 200
+                assert ret.json["timeseries"][str(ts_1_id)]["gaps"] == []
+
+                # Wrong parameters
+                for arg in (
+                    {"min_duration": -1},
+                    {"timeseries": []},
+                    {"timeseries": 1342},
+                    {"data_state": 1342},
+                ):
+                    ret = client.get(GAPS_URL, query_string={**query_string, **arg})
+                    assert ret.status_code == 422
+
+            # User not in Timeseries group
+            query_string["timeseries"] = (ts_1_id, ts_2_id)
+            ret = client.get(GAPS_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            elif user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                # No data: the whole interval is a gap
+                assert ret.json["timeseries"][str(ts_2_id)] == {
+                    "name": "Timeseries 1",
+                    "interval": None,
+                    "undefined_interval": True,
+                    "gaps": [
+                        {
+                            "start_time": "2020-01-02T00:00:00+00:00",
+                            "end_time": "2020-01-02T01:10:00+00:00",
+                            "duration": 4200.0,
+                        },
+                    ],
+                    "total_duration": 4200.0,
+                }
+
+                # Interval undefined and not inferable: any interval is a gap
+                with OpenBar():
+                    create_timeseries_data(
+                        Timeseries.get_by_id(ts_2_id),
+                        TimeseriesDataState.get_by_id(ds_id),
+                        ["2020-01-02T00:30:00+00:00"],
+                        [0.0],
+                    )
+                ret = client.get(GAPS_URL, query_string=query_string)
+                assert ret.status_code == 200
+                assert ret.json["timeseries"][str(ts_2_id)] == {
+                    "name": "Timeseries 1",
+                    "interval": None,
+                    "undefined_interval": True,
+                    "gaps": [
+                        {
+                            "start_time": "2020-01-02T00:00:00+00:00",
+                            "end_time": "2020-01-02T00:30:00+00:00",
+                            "duration": 1800.0,
+                        },
+                        {
+                            "start_time": "2020-01-02T00:30:00+00:00",
+                            "end_time": "2020-01-02T01:10:00+00:00",
+                            "duration": 2400.0,
+                        },
+                    ],
+                    "total_duration": 4200.0,
+                }
+
+                # Minimum gap duration
+                ret = client.get(
+                    GAPS_URL, query_string={**query_string, "min_duration": 2000}
+                )
+                assert ret.status_code == 200
+                assert ret.json["timeseries"][str(ts_2_id)]["gaps"] == [
+                    {
+                        "start_time": "2020-01-02T00:30:00+00:00",
+                        "end_time": "2020-01-02T01:10:00+00:00",
+                        "duration": 2400.0,
+                    },
+                ]
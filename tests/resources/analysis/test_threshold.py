@@ -0,0 +1,137 @@
+"""Threshold tests"""
+
+import contextlib
+
+import pytest
+
+from tests.common import AuthHeader
+
+THRESHOLD_URL = "/analysis/threshold"
+
+
+class TestAnalysisApiThreshold:
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    def test_analysis_threshold(
+        self,
+        app,
+        user,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": (ts_1_id,),
+            "data_state": ds_id,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "hour",
+            "min_value": 2,
+        }
+
+        with auth_context:
+            ret = client.get(THRESHOLD_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                assert ret.json == {
+                    "timestamps": [
+                        "2020-01-01T00:00:00+00:00",
+                        "2020-01-01T01:00:00+00:00",
+                        "2020-01-01T02:00:00+00:00",
+                        "2020-01-01T03:00:00+00:00",
+                    ],
+                    "timeseries": {
+                        str(ts_1_id): {
+                            "intervals": [
+                                {
+                                    "start_time": "2020-01-01T02:00:00+00:00",
+                                    "end_time": "2020-01-01T04:00:00+00:00",
+                                }
+                            ],
+                            "durations": [0.0, 0.0, 3600.0, 3600.0],
+                            "total_duration": 7200.0,
+                        },
+                    },
+                }
+
+                # Range in the middle, 2-hour buckets, other timezone
+                ret = client.get(
+                    THRESHOLD_URL,
+                    query_string={
+                        **query_string,
+                        "min_value": 0.5,
+                        "max_value": 1.5,
+                        "bucket_width_value": 2,
+                        "timezone": "Europe/Paris",
+                    },
+                )
+                assert ret.status_code == 200
+                assert ret.json["timestamps"] == [
+                    "2020-01-01T00:00:00+01:00",
+                    "2020-01-01T02:00:00+01:00",
+                    "2020-01-01T04:00:00+01:00",
+                ]
+                ts_ret = ret.json["timeseries"][str(ts_1_id)]
+                assert ts_ret["intervals"] == [
+                    {
+                        "start_time": "2020-01-01T02:00:00+01:00",
+                        "end_time": "2020-01-01T03:00:00+01:00",
+                    }
+                ]
+                assert ts_ret["durations"] == [0.0, 3600.0, 0.0]
+
+                # Values never in range
+                ret = client.get(
+                    THRESHOLD_URL, query_string={**query_string, "min_value": 10}
+                )
+                assert ret.status_code == 200
+                ts_ret = ret.json["timeseries"][str(ts_1_id)]
+                assert ts_ret["intervals"] == []
+                assert ts_ret["durations"] == [0.0, 0.0, 0.0, 0.0]
+                assert ts_ret["total_duration"] == 0.0
+
+                # Wrong parameters
+                for arg in (
+                    {"min_value": None},
+                    {"max_value": 1},
+                    {"timeseries": []},
+                    {"timeseries": 1342},
+                    {"data_state": 1342},
+                ):
+                    qs = {**query_string, **arg}
+                    if arg == {"min_value": None}:
+                        del qs["min_value"]
+                    ret = client.get(THRESHOLD_URL, query_string=qs)
+                    assert ret.status_code == 422
+
+            # User not in Timeseries group
+            query_string["timeseries"] = (ts_1_id, ts_2_id)
+            ret = client.get(THRESHOLD_URL, query_string=query_string)
+            if user == "anonym":
+                assert ret.status_code == 401
+            elif user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                assert set(ret.json["timeseries"]) == {str(ts_1_id), str(ts_2_id)}
@@ -2,15 +2,40 @@
 
 import contextlib
 import datetime as dt
+import time
+from unittest import mock
 
 import pytest
 
+import sqlalchemy as sqla
+
+import pandas as pd
+import pyarrow as pa
+
 from tests.common import AuthHeader
 
 from bemserver_core.authorization import OpenBar
-from bemserver_core.model import Timeseries
+from bemserver_core.input_output import tsdio
+from bemserver_core.model import (
+    Timeseries,
+    TimeseriesByDataState,
+    TimeseriesData,
+    TimeseriesDataState,
+    TimeseriesProperty,
+    TimeseriesPropertyData,
+)
+from bemserver_core.scheduled_tasks.cleanup import ST_CleanupByTimeseries
 
 from bemserver_api.database import db
+from bemserver_api.extensions.aggregate_cache import aggregate_cache
+from bemserver_api.extensions.rollups import metadata as rollups_metadata
+from bemserver_api.extensions.rollups import rollups, ts_data_rollups
+from bemserver_api.extensions.stats_summaries import (
+    metadata as stats_summaries_metadata,
+)
+from bemserver_api.extensions.stats_summaries import stats_summaries, ts_data_stats
+from bemserver_api.input_output import ARROW_STREAM_MIME_TYPE
+from bemserver_api.resources.timeseries_data import routes
 
 TIMESERIES_DATA_URL = "/timeseries_data/"
 DUMMY_ID = "69"
@@ -158,8 +183,7 @@ class TestTimeseriesDataApi:
     @pytest.mark.usefixtures("user_groups_by_campaigns")
     @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
     @pytest.mark.parametrize("for_campaign", (True, False))
-    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
-    def test_timeseries_data_get(
+    def test_timeseries_data_latest(
         self,
         app,
         user,
@@ -168,18 +192,14 @@ class TestTimeseriesDataApi:
         timeseries,
         timeseries_data,
         for_campaign,
-        mime_type,
     ):
-        start_time, end_time = timeseries_data
+        start_dt, _ = timeseries_data
         ts_1_id = timeseries[0]
         ts_2_id = timeseries[1]
         campaign_1_id = campaigns[0]
         campaign_2_id = campaigns[1]
         ds_id = 1
-
-        with OpenBar():
-            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
-            db.session.commit()
+        ds_clean_id = 2
 
         if user == "admin":
             creds = users["Chuck"]["creds"]
@@ -194,190 +214,69 @@ class TestTimeseriesDataApi:
 
         with auth_context:
             if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
+                query_url = f"{TIMESERIES_DATA_URL}latest"
                 ts_l = (ts_1_id,)
-                ret_line_1 = "Datetime,1"
             else:
-                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                query_url = f"{TIMESERIES_DATA_URL}campaign/{campaign_1_id}/latest"
                 ts_l = (f"Timeseries {ts_1_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 0"
 
             ret = client.get(
                 query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                },
-                headers={"Accept": mime_type},
+                query_string={"timeseries": ts_l, "data_state": ds_id},
             )
             if user == "anonym":
                 assert ret.status_code == 401
             else:
                 assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,0.0"
-                else:
-                    assert list(ret.json.keys()) == [str(ts_l[0])]
-                    assert ret.json[str(ts_l[0])] == {
-                        "2020-01-01T00:00:00+00:00": 0.0,
-                        "2020-01-01T01:00:00+00:00": 1.0,
-                        "2020-01-01T02:00:00+00:00": 2.0,
-                        "2020-01-01T03:00:00+00:00": 3.0,
+                assert ret.json == {
+                    str(ts_l[0]): {
+                        (start_dt + dt.timedelta(hours=3)).isoformat(): 3.0,
                     }
+                }
 
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "timezone": "Europe/Paris",
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
+                # Last N values, in timezone
+                ret = client.get(
+                    query_url,
+                    query_string={
+                        "timeseries": ts_l,
+                        "data_state": ds_id,
+                        "count": 2,
+                        "timezone": "Europe/Paris",
+                    },
+                )
                 assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T01:00:00+0100,0.0"
-                else:
-                    assert list(ret.json.keys()) == [str(ts_l[0])]
-                    assert ret.json[str(ts_l[0])] == {
-                        "2020-01-01T01:00:00+01:00": 0.0,
-                        "2020-01-01T02:00:00+01:00": 1.0,
+                assert ret.json == {
+                    str(ts_l[0]): {
                         "2020-01-01T03:00:00+01:00": 2.0,
                         "2020-01-01T04:00:00+01:00": 3.0,
                     }
+                }
 
-            # Conversions
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "convert_to": ("mm",),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
+                # No data
+                ret = client.get(
+                    query_url,
+                    query_string={"timeseries": ts_l, "data_state": ds_clean_id},
+                )
                 assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,0.0"
-                else:
-                    assert list(ret.json.keys()) == [str(ts_l[0])]
-                    assert ret.json[str(ts_l[0])] == {
-                        "2020-01-01T00:00:00+00:00": 0.0,
-                        "2020-01-01T01:00:00+00:00": 1000.0,
-                        "2020-01-01T02:00:00+00:00": 2000.0,
-                        "2020-01-01T03:00:00+00:00": 3000.0,
-                    }
-
-            # Conversions: wrong convert_to list size
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "convert_to": ("mm", "m/s"),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 422
-
-            # Conversions: wrong convert_to unit
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "convert_to": ("dummy",),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 422
+                assert ret.json == {str(ts_l[0]): {}}
 
-            # Conversions: incompatible convert_to unit
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "convert_to": ("Wh",),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
+                # Count out of range
+                ret = client.get(
+                    query_url,
+                    query_string={"timeseries": ts_l, "data_state": ds_id, "count": 0},
+                )
                 assert ret.status_code == 422
 
-            # Accepted mime type not specified: default to application/json
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                },
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 200
-                assert list(ret.json.keys()) == [str(ts_l[0])]
-                assert ret.json[str(ts_l[0])] == {
-                    "2020-01-01T00:00:00+00:00": 0.0,
-                    "2020-01-01T01:00:00+00:00": 1.0,
-                    "2020-01-01T02:00:00+00:00": 2.0,
-                    "2020-01-01T03:00:00+00:00": 3.0,
-                }
-
-            # User not in Timeseries group
             if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
+                query_url = f"{TIMESERIES_DATA_URL}latest"
                 ts_l = (ts_2_id,)
-                ret_line_1 = "Datetime,2"
             else:
-                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
+                query_url = f"{TIMESERIES_DATA_URL}campaign/{campaign_2_id}/latest"
                 ts_l = (f"Timeseries {ts_2_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 1"
 
             ret = client.get(
                 query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                },
-                headers={"Accept": mime_type},
+                query_string={"timeseries": ts_l, "data_state": ds_id},
             )
             if user == "anonym":
                 assert ret.status_code == 401
@@ -385,92 +284,457 @@ class TestTimeseriesDataApi:
                 assert ret.status_code == 403
             else:
                 assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert len(ret_csv_lines) > 1
-                else:
-                    assert list(ret.json.keys()) == [str(ts_l[0])]
-
-            # Unknown timezone
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "timezone": "DTC",
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 422
-
-            # Datetime out of range
-            ret = client.get(
-                query_url,
-                query_string={
-                    "start_time": dt.datetime(
-                        2500, 1, 1, tzinfo=dt.timezone.utc
-                    ).isoformat(),
-                    "end_time": dt.datetime(
-                        2500, 1, 2, tzinfo=dt.timezone.utc
-                    ).isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 422
 
-    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
-    @pytest.mark.usefixtures("users_by_user_groups")
-    @pytest.mark.usefixtures("user_groups_by_campaigns")
-    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
     @pytest.mark.parametrize("for_campaign", (True, False))
-    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
-    def test_timeseries_data_get_aggregate(
+    def test_timeseries_data_histogram(
         self,
         app,
-        user,
         users,
         campaigns,
         timeseries,
         timeseries_data,
         for_campaign,
-        mime_type,
     ):
-        start_time, end_time = timeseries_data
+        start_dt, end_dt = timeseries_data
         ts_1_id = timeseries[0]
-        ts_2_id = timeseries[1]
         campaign_1_id = campaigns[0]
-        campaign_2_id = campaigns[1]
         ds_id = 1
+        ds_clean_id = 2
 
-        with OpenBar():
-            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
-            db.session.commit()
+        creds = users["Chuck"]["creds"]
 
-        if user == "admin":
-            creds = users["Chuck"]["creds"]
-            auth_context = AuthHeader(creds)
-        elif user == "user":
-            creds = users["Active"]["creds"]
-            auth_context = AuthHeader(creds)
+        client = app.test_client()
+
+        if not for_campaign:
+            query_url = f"{TIMESERIES_DATA_URL}histogram"
+            ts_l = (ts_1_id,)
         else:
-            auth_context = contextlib.nullcontext()
+            query_url = f"{TIMESERIES_DATA_URL}campaign/{campaign_1_id}/histogram"
+            ts_l = (f"Timeseries {ts_1_id-1}",)
 
-        client = app.test_client()
+        query_string = {
+            "start_time": start_dt.isoformat(),
+            "end_time": end_dt.isoformat(),
+            "timeseries": ts_l,
+            "data_state": ds_id,
+        }
 
-        with auth_context:
-            if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
+        ret = client.get(query_url, query_string=query_string)
+        assert ret.status_code == 401
+
+        with AuthHeader(creds):
+            # Bin count
+            ret = client.get(query_url, query_string={**query_string, "bins": 3})
+            assert ret.status_code == 200
+            assert ret.json == {
+                "histograms": {
+                    str(ts_l[0]): {
+                        "edges": [0.0, 1.0, 2.0, 3.0],
+                        "counts": [1, 1, 2],
+                    }
+                }
+            }
+
+            # Bin edges, last bin including upper edge
+            ret = client.get(
+                query_url, query_string={**query_string, "bin_edges": [0.5, 1.5, 3]}
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "histograms": {
+                    str(ts_l[0]): {
+                        "edges": [0.5, 1.5, 3.0],
+                        "counts": [1, 2],
+                    }
+                }
+            }
+
+            # Single value
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "start_time": (start_dt + dt.timedelta(hours=1)).isoformat(),
+                    "end_time": (start_dt + dt.timedelta(hours=2)).isoformat(),
+                    "bins": 2,
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "histograms": {
+                    str(ts_l[0]): {
+                        "edges": [0.5, 1.0, 1.5],
+                        "counts": [0, 1],
+                    }
+                }
+            }
+
+            # No data
+            ret = client.get(
+                query_url, query_string={**query_string, "data_state": ds_clean_id}
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "histograms": {str(ts_l[0]): {"edges": [], "counts": []}}
+            }
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "data_state": ds_clean_id,
+                    "bin_edges": [0, 1],
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "histograms": {str(ts_l[0]): {"edges": [0.0, 1.0], "counts": [0]}}
+            }
+
+            # Wrong parameters
+            for arg in (
+                {"bins": 0},
+                {"bin_edges": [1]},
+                {"bin_edges": [2, 1]},
+                {"bins": 2, "bin_edges": [0, 1]},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_profile(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_dt, _ = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        if not for_campaign:
+            query_url = f"{TIMESERIES_DATA_URL}profile"
+            ts_l = (ts_1_id,)
+        else:
+            query_url = f"{TIMESERIES_DATA_URL}campaign/{campaign_1_id}/profile"
+            ts_l = (f"Timeseries {ts_1_id-1}",)
+
+        query_string = {
+            "start_time": start_dt.isoformat(),
+            "end_time": dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc).isoformat(),
+            "timeseries": ts_l,
+            "data_state": ds_id,
+        }
+
+        ret = client.get(query_url, query_string=query_string)
+        assert ret.status_code == 401
+
+        with AuthHeader(creds):
+            # Across spring DST change (Sunday 2020-03-29 in Europe/Paris)
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={
+                    str(ts_1_id): {
+                        "2020-03-29T00:00:00+00:00": 10.0,
+                        "2020-03-29T01:00:00+00:00": 20.0,
+                        "2020-03-29T02:00:00+00:00": 30.0,
+                    }
+                },
+            )
+            assert ret.status_code == 201
+
+            # Weekday profile (2020-01-01 is a Wednesday)
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            profile = ret.json["profiles"][str(ts_l[0])]
+            assert len(profile) == 7
+            assert all(len(row) == 24 for row in profile)
+            assert profile[2][:5] == [0.0, 1.0, 2.0, 3.0, None]
+            assert profile[6][:5] == [10.0, 20.0, 30.0, None, None]
+            assert sum(v is not None for row in profile for v in row) == 7
+
+            # Local time
+            ret = client.get(
+                query_url,
+                query_string={**query_string, "timezone": "Europe/Paris"},
+            )
+            assert ret.status_code == 200
+            profile = ret.json["profiles"][str(ts_l[0])]
+            assert profile[2][:6] == [None, 0.0, 1.0, 2.0, 3.0, None]
+            assert profile[6][:6] == [None, 10.0, None, 20.0, 30.0, None]
+
+            # Month profile, count
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "period": "month",
+                    "aggregation": "count",
+                },
+            )
+            assert ret.status_code == 200
+            profile = ret.json["profiles"][str(ts_l[0])]
+            assert len(profile) == 12
+            assert profile[0][:5] == [1, 1, 1, 1, 0]
+            assert profile[2][:5] == [1, 1, 1, 0, 0]
+            assert sum(sum(row) for row in profile) == 7
+
+            # Wrong parameters
+            for arg in ({"period": "year"}, {"aggregation": "dummy"}):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+
+    def test_timeseries_data_stats_summaries(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_dt, _ = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+
+        with OpenBar():
+            tsbds_id = (
+                Timeseries.get_by_id(ts_1_id)
+                .get_timeseries_by_data_state(TimeseriesDataState.get_by_id(ds_id))
+                .id
+            )
+            db.session.commit()
+
+        client = app.test_client()
+
+        def get_summary():
+            return db.session.execute(
+                sqla.select(
+                    ts_data_stats.c.value_count,
+                    ts_data_stats.c.value_sum,
+                    ts_data_stats.c.stale,
+                )
+                .join(
+                    TimeseriesByDataState,
+                    TimeseriesByDataState.id == ts_data_stats.c.ts_by_data_state_id,
+                )
+                .where(
+                    TimeseriesByDataState.timeseries_id == ts_1_id,
+                    TimeseriesByDataState.data_state_id == ds_id,
+                )
+            ).one_or_none()
+
+        query_url = f"{TIMESERIES_DATA_URL}stats"
+        query_string = {"timeseries": [ts_1_id], "data_state": ds_id}
+
+        with AuthHeader(users["Chuck"]["creds"]):
+            # Summary is built on first use
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json["stats"][str(ts_1_id)]["count"] == 4
+            assert get_summary() == (4, 6.0, False)
+
+            # Summary is updated on write
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={
+                    str(ts_1_id): {
+                        "2020-01-01T03:30:00+00:00": 12.0,
+                        "2020-01-02T00:00:00+00:00": 42.0,
+                    }
+                },
+            )
+            assert ret.status_code == 201
+            assert get_summary() == (6, 60.0, False)
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            stats = ret.json["stats"][str(ts_1_id)]
+            assert stats.pop("stddev") == pytest.approx(16.2603813)
+            assert stats == {
+                "avg": 10.0,
+                "first_timestamp": start_dt.isoformat(),
+                "last_timestamp": "2020-01-02T00:00:00+00:00",
+                "count": 6,
+                "max": 42.0,
+                "min": 0.0,
+            }
+
+            # Summary is built again after delete
+            ret = client.delete(
+                TIMESERIES_DATA_URL,
+                query_string={
+                    "start_time": "2020-01-01T03:00:00+00:00",
+                    "end_time": "2020-01-03T00:00:00+00:00",
+                    "timeseries": [ts_1_id],
+                    "data_state": ds_id,
+                },
+            )
+            assert ret.status_code == 204
+            assert get_summary() == (6, 60.0, True)
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json["stats"][str(ts_1_id)] == {
+                "avg": 1.0,
+                "first_timestamp": start_dt.isoformat(),
+                "last_timestamp": (start_dt + dt.timedelta(hours=2)).isoformat(),
+                "count": 3,
+                "max": 2.0,
+                "min": 0.0,
+                "stddev": 1.0,
+            }
+            assert get_summary() == (3, 3.0, False)
+
+            # Data written out of the API (e.g. by the cleanup) is also merged
+            with OpenBar():
+                tsdio.set_timeseries_data(
+                    pd.DataFrame(
+                        {ts_1_id: [12.0]},
+                        index=pd.DatetimeIndex(
+                            ["2020-01-01T05:00:00+00:00"], name="timestamp"
+                        ),
+                    ),
+                    TimeseriesDataState.get_by_id(ds_id),
+                )
+            db.session.commit()
+            assert get_summary() == (4, 15.0, False)
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.json["stats"][str(ts_1_id)]["count"] == 4
+            assert ret.json["stats"][str(ts_1_id)]["max"] == 12.0
+            db.session.execute(
+                sqla.text(
+                    "UPDATE ts_data SET value = 24 "
+                    "WHERE ts_by_data_state_id = :tsbds_id AND value = 12;"
+                ),
+                {"tsbds_id": tsbds_id},
+            )
+            db.session.commit()
+            assert get_summary() == (4, 15.0, True)
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.json["stats"][str(ts_1_id)]["max"] == 24.0
+            assert get_summary() == (4, 27.0, False)
+            db.session.execute(
+                sqla.text(
+                    "DELETE FROM ts_data "
+                    "WHERE ts_by_data_state_id = :tsbds_id AND value = 24;"
+                ),
+                {"tsbds_id": tsbds_id},
+            )
+            db.session.commit()
+            assert get_summary() == (4, 27.0, True)
+
+            # Data is read while written by another transaction
+            with db.engine.connect() as connection:
+                connection.execute(
+                    sqla.text(
+                        "INSERT INTO ts_data (timestamp, ts_by_data_state_id, value) "
+                        "VALUES ('2020-01-01T05:00:00+00:00', :tsbds_id, 12);"
+                    ),
+                    {"tsbds_id": tsbds_id},
+                )
+                with OpenBar():
+                    assert not stats_summaries.prepare(
+                        [Timeseries.get_by_id(ts_1_id)],
+                        TimeseriesDataState.get_by_id(ds_id),
+                    )
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.json["stats"][str(ts_1_id)]["count"] == 3
+                connection.commit()
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.json["stats"][str(ts_1_id)]["count"] == 4
+            assert get_summary() == (4, 15.0, False)
+
+    def test_timeseries_data_stats_summaries_no_tables(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_dt, _ = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+
+        db.session.commit()
+        stats_summaries_metadata.drop_all(db.engine)
+        # Table existence was checked when writing fixture data
+        stats_summaries._engines.clear()
+
+        client = app.test_client()
+
+        query_url = f"{TIMESERIES_DATA_URL}stats"
+        query_string = {"timeseries": [ts_1_id], "data_state": ds_id}
+
+        with AuthHeader(users["Chuck"]["creds"]):
+            # Stats are computed from data
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={str(ts_1_id): {"2020-01-01T04:00:00+00:00": 4.0}},
+            )
+            assert ret.status_code == 201
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json["stats"][str(ts_1_id)] == {
+                "avg": 2.0,
+                "first_timestamp": start_dt.isoformat(),
+                "last_timestamp": (start_dt + dt.timedelta(hours=4)).isoformat(),
+                "count": 5,
+                "max": 4.0,
+                "min": 0.0,
+                "stddev": pytest.approx(1.5811388),
+            }
+
+        assert not sqla.inspect(db.engine).has_table(ts_data_stats.name)
+
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
+    def test_timeseries_data_get(
+        self,
+        app,
+        user,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+        mime_type,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        campaign_1_id = campaigns[0]
+        campaign_2_id = campaigns[1]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        with auth_context:
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
                 ts_l = (ts_1_id,)
                 ret_line_1 = "Datetime,1"
             else:
@@ -479,15 +743,12 @@ class TestTimeseriesDataApi:
                 ret_line_1 = "Datetime,Timeseries 0"
 
             ret = client.get(
-                f"{query_url}aggregate",
+                query_url,
                 query_string={
                     "start_time": start_time.isoformat(),
                     "end_time": end_time.isoformat(),
                     "timeseries": ts_l,
                     "data_state": ds_id,
-                    "bucket_width_value": 1,
-                    "bucket_width_unit": "day",
-                    "timezone": "UTC",
                 },
                 headers={"Accept": mime_type},
             )
@@ -498,33 +759,24 @@ class TestTimeseriesDataApi:
                 if mime_type == "text/csv":
                     ret_csv_lines = ret.data.decode("utf-8").splitlines()
                     assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1.5"
-                    assert len(ret_csv_lines) == 2
+                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,0.0"
                 else:
-                    assert ret.json == {
-                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1.5}
+                    assert list(ret.json.keys()) == [str(ts_l[0])]
+                    assert ret.json[str(ts_l[0])] == {
+                        "2020-01-01T00:00:00+00:00": 0.0,
+                        "2020-01-01T01:00:00+00:00": 1.0,
+                        "2020-01-01T02:00:00+00:00": 2.0,
+                        "2020-01-01T03:00:00+00:00": 3.0,
                     }
 
-            # Set a bucket width value != 1 for a fixed size period
-            if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
-                ts_l = (ts_1_id,)
-                ret_line_1 = "Datetime,1"
-            else:
-                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
-                ts_l = (f"Timeseries {ts_1_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 0"
-
             ret = client.get(
-                f"{query_url}aggregate",
+                query_url,
                 query_string={
                     "start_time": start_time.isoformat(),
                     "end_time": end_time.isoformat(),
                     "timeseries": ts_l,
                     "data_state": ds_id,
-                    "bucket_width_value": 4,
-                    "bucket_width_unit": "hour",
-                    "timezone": "UTC",
+                    "timezone": "Europe/Paris",
                 },
                 headers={"Accept": mime_type},
             )
@@ -535,140 +787,2429 @@ class TestTimeseriesDataApi:
                 if mime_type == "text/csv":
                     ret_csv_lines = ret.data.decode("utf-8").splitlines()
                     assert ret_csv_lines[0] == ret_line_1
-                    assert len(ret_csv_lines) > 1
+                    assert ret_csv_lines[1] == "2020-01-01T01:00:00+0100,0.0"
                 else:
                     assert list(ret.json.keys()) == [str(ts_l[0])]
+                    assert ret.json[str(ts_l[0])] == {
+                        "2020-01-01T01:00:00+01:00": 0.0,
+                        "2020-01-01T02:00:00+01:00": 1.0,
+                        "2020-01-01T03:00:00+01:00": 2.0,
+                        "2020-01-01T04:00:00+01:00": 3.0,
+                    }
 
-            # Conversions: m -> mm
-            if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
-                ts_l = (ts_1_id,)
-                ret_line_1 = "Datetime,1"
-            else:
-                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
-                ts_l = (f"Timeseries {ts_1_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 0"
+            # Conversions
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("mm",),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,0.0"
+                else:
+                    assert list(ret.json.keys()) == [str(ts_l[0])]
+                    assert ret.json[str(ts_l[0])] == {
+                        "2020-01-01T00:00:00+00:00": 0.0,
+                        "2020-01-01T01:00:00+00:00": 1000.0,
+                        "2020-01-01T02:00:00+00:00": 2000.0,
+                        "2020-01-01T03:00:00+00:00": 3000.0,
+                    }
+
+            # Conversions: wrong convert_to list size
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("mm", "m/s"),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+            # Conversions: wrong convert_to unit
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("dummy",),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+            # Conversions: incompatible convert_to unit
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("Wh",),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+            # Accepted mime type not specified: default to application/json
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                },
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                assert list(ret.json.keys()) == [str(ts_l[0])]
+                assert ret.json[str(ts_l[0])] == {
+                    "2020-01-01T00:00:00+00:00": 0.0,
+                    "2020-01-01T01:00:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                    "2020-01-01T03:00:00+00:00": 3.0,
+                }
+
+            # User not in Timeseries group
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_2_id,)
+                ret_line_1 = "Datetime,2"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
+                ts_l = (f"Timeseries {ts_2_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 1"
+
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            elif user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert len(ret_csv_lines) > 1
+                else:
+                    assert list(ret.json.keys()) == [str(ts_l[0])]
+
+            # Unknown timezone
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "timezone": "DTC",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+            # Datetime out of range
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": dt.datetime(
+                        2500, 1, 1, tzinfo=dt.timezone.utc
+                    ).isoformat(),
+                    "end_time": dt.datetime(
+                        2500, 1, 2, tzinfo=dt.timezone.utc
+                    ).isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+    @pytest.mark.parametrize("user", ("admin", "user"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
+    def test_timeseries_data_get_stream(
+        self,
+        app,
+        user,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+        mime_type,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        campaign_1_id = campaigns[0]
+        campaign_2_id = campaigns[1]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        # Use windows and batches smaller than data
+        app.config["TIMESERIES_DATA_STREAM_WINDOW_HOURS"] = 1
+        app.config["TIMESERIES_DATA_STREAM_BATCH_SIZE"] = 3
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+        else:
+            creds = users["Active"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            # Streamed response is identical to non-streamed response
+            for query_string in (
+                {},
+                {"timezone": "Europe/Paris"},
+                {"convert_to": ("mm",)},
+                # Empty windows and empty interval
+                {"end_time": (end_time + dt.timedelta(hours=3)).isoformat()},
+                {"end_time": start_time.isoformat()},
+            ):
+                query_string = {
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    **query_string,
+                }
+                ret = client.get(
+                    query_url,
+                    query_string=query_string,
+                    headers={"Accept": mime_type},
+                )
+                assert ret.status_code == 200
+                ret_stream = client.get(
+                    query_url,
+                    query_string={**query_string, "stream": True},
+                    headers={"Accept": mime_type},
+                )
+                assert ret_stream.status_code == 200
+                assert ret_stream.is_streamed
+                assert ret_stream.mimetype == mime_type
+                assert ret_stream.data == ret.data
+
+            # Several timeseries, batches spanning timeseries
+            if user == "admin" and not for_campaign:
+                query_string = {
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": (ts_1_id, ts_2_id),
+                    "data_state": ds_id,
+                }
+                ret = client.get(
+                    query_url,
+                    query_string=query_string,
+                    headers={"Accept": mime_type},
+                )
+                assert ret.status_code == 200
+                ret_stream = client.get(
+                    query_url,
+                    query_string={**query_string, "stream": True},
+                    headers={"Accept": mime_type},
+                )
+                assert ret_stream.status_code == 200
+                assert ret_stream.data == ret.data
+
+            # Conversions: incompatible convert_to unit
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("Wh",),
+                    "stream": True,
+                },
+                headers={"Accept": mime_type},
+            )
+            assert ret.status_code == 422
+
+            # User not in Timeseries group
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_2_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
+                ts_l = (f"Timeseries {ts_2_id-1}",)
+
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "stream": True,
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+
+    @pytest.mark.parametrize("user", ("admin", "user"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
+    def test_timeseries_data_get_long_format(
+        self,
+        app,
+        user,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+        mime_type,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        campaign_1_id = campaigns[0]
+        campaign_2_id = campaigns[1]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        # Use batches smaller than data
+        app.config["TIMESERIES_DATA_STREAM_BATCH_SIZE"] = 3
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+        else:
+            creds = users["Active"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "timezone": "Europe/Paris",
+                    "convert_to": ("mm",),
+                    "format": "long",
+                },
+                headers={"Accept": mime_type},
+            )
+            assert ret.status_code == 200
+            assert ret.is_streamed
+            if mime_type == "text/csv":
+                assert ret.data.decode("utf-8").splitlines() == [
+                    "Datetime,Timeseries,Value",
+                    f"2020-01-01T01:00:00+0100,{ts_l[0]},0.0",
+                    f"2020-01-01T02:00:00+0100,{ts_l[0]},1000.0",
+                    f"2020-01-01T03:00:00+0100,{ts_l[0]},2000.0",
+                    f"2020-01-01T04:00:00+0100,{ts_l[0]},3000.0",
+                ]
+            else:
+                assert ret.json == [
+                    ["2020-01-01T01:00:00+01:00", ts_l[0], 0.0],
+                    ["2020-01-01T02:00:00+01:00", ts_l[0], 1000.0],
+                    ["2020-01-01T03:00:00+01:00", ts_l[0], 2000.0],
+                    ["2020-01-01T04:00:00+01:00", ts_l[0], 3000.0],
+                ]
+
+            # No data
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": end_time.isoformat(),
+                    "end_time": (end_time + dt.timedelta(hours=1)).isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "format": "long",
+                },
+                headers={"Accept": mime_type},
+            )
+            assert ret.status_code == 200
+            if mime_type == "text/csv":
+                assert ret.data.decode("utf-8") == "Datetime,Timeseries,Value\n"
+            else:
+                assert ret.json == []
+
+            # Conversions: incompatible convert_to unit
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "convert_to": ("Wh",),
+                    "format": "long",
+                },
+                headers={"Accept": mime_type},
+            )
+            assert ret.status_code == 422
+
+            # Wrong format
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "format": "dummy",
+                },
+                headers={"Accept": mime_type},
+            )
+            assert ret.status_code == 422
+
+            # User not in Timeseries group
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_2_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
+                ts_l = (f"Timeseries {ts_2_id-1}",)
+
+            ret = client.get(
+                query_url,
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "format": "long",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    assert len(ret.data.decode("utf-8").splitlines()) == 5
+                else:
+                    assert len(ret.json) == 4
+
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    @pytest.mark.parametrize("mime_type", ("application/json", "text/csv"))
+    def test_timeseries_data_get_aggregate(
+        self,
+        app,
+        user,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+        mime_type,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        campaign_1_id = campaigns[0]
+        campaign_2_id = campaigns[1]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        with auth_context:
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+                ret_line_1 = "Datetime,1"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 0"
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "timezone": "UTC",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1.5"
+                    assert len(ret_csv_lines) == 2
+                else:
+                    assert ret.json == {
+                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1.5}
+                    }
+
+            # Set a bucket width value != 1 for a fixed size period
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+                ret_line_1 = "Datetime,1"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 0"
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 4,
+                    "bucket_width_unit": "hour",
+                    "timezone": "UTC",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert len(ret_csv_lines) > 1
+                else:
+                    assert list(ret.json.keys()) == [str(ts_l[0])]
+
+            # Conversions: m -> mm
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+                ret_line_1 = "Datetime,1"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 0"
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "convert_to": ("mm",),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1500.0"
+                    assert len(ret_csv_lines) == 2
+                else:
+                    assert ret.json == {
+                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1500.0}
+                    }
+
+            # Conversions: "" -> no conversion
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+                ret_line_1 = "Datetime,1"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 0"
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "convert_to": ("",),
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1.5"
+                    assert len(ret_csv_lines) == 2
+                else:
+                    assert ret.json == {
+                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1.5}
+                    }
+
+            # User not in Timeseries group
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_2_id,)
+                ret_line_1 = "Datetime,2"
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
+                ts_l = (f"Timeseries {ts_2_id-1}",)
+                ret_line_1 = "Datetime,Timeseries 1"
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": start_time.isoformat(),
+                    "end_time": end_time.isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            elif user == "user":
+                assert ret.status_code == 403
+            else:
+                assert ret.status_code == 200
+                if mime_type == "text/csv":
+                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
+                    assert ret_csv_lines[0] == ret_line_1
+                    assert len(ret_csv_lines) > 1
+                else:
+                    assert list(ret.json.keys()) == [str(ts_l[0])]
+
+            # Datetime out of range
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    "start_time": dt.datetime(
+                        2500, 1, 1, tzinfo=dt.timezone.utc
+                    ).isoformat(),
+                    "end_time": dt.datetime(
+                        2500, 1, 2, tzinfo=dt.timezone.utc
+                    ).isoformat(),
+                    "timeseries": ts_l,
+                    "data_state": ds_id,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "timezone": "UTC",
+                },
+                headers={"Accept": mime_type},
+            )
+            if user == "anonym":
+                assert ret.status_code == 401
+            else:
+                assert ret.status_code == 422
+
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_arrow(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        app.config["TIMESERIES_DATA_STREAM_WINDOW_HOURS"] = 1
+        app.config["TIMESERIES_DATA_STREAM_BATCH_SIZE"] = 3
+
+        creds = users["Active"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "timezone": "Europe/Paris",
+            }
+            expected_index = pd.date_range(
+                start_time, end_time, freq="h", inclusive="left"
+            ).tz_convert("Europe/Paris")
+
+            # Raw data, streamed or not
+            for stream in (False, True):
+                ret = client.get(
+                    query_url,
+                    query_string={**query_string, "stream": stream},
+                    headers={"Accept": ARROW_STREAM_MIME_TYPE},
+                )
+                assert ret.status_code == 200
+                assert ret.mimetype == ARROW_STREAM_MIME_TYPE
+                table = pa.ipc.open_stream(ret.data).read_all()
+                assert table.schema.names == ["Datetime", str(ts_l[0])]
+                assert table.schema.field(1).type == pa.float64()
+                data_df = table.to_pandas().set_index("Datetime")
+                assert data_df.index.equals(expected_index.rename("Datetime"))
+                assert data_df[str(ts_l[0])].to_list() == [0.0, 1.0, 2.0, 3.0]
+
+            # Long format
+            ret = client.get(
+                query_url,
+                query_string={**query_string, "format": "long"},
+                headers={"Accept": ARROW_STREAM_MIME_TYPE},
+            )
+            assert ret.status_code == 200
+            table = pa.ipc.open_stream(ret.data).read_all()
+            assert table.schema.names == ["Datetime", "Timeseries", "Value"]
+            assert table.column("Timeseries").to_pylist() == list(ts_l) * 4
+            assert table.column("Value").to_pylist() == [0.0, 1.0, 2.0, 3.0]
+            assert table.column("Datetime").to_pandas().to_list() == list(
+                expected_index
+            )
+
+            # Aggregate
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "timezone": "UTC",
+                    "bucket_width_value": 2,
+                    "bucket_width_unit": "hour",
+                    "aggregation": "count",
+                },
+                headers={"Accept": ARROW_STREAM_MIME_TYPE},
+            )
+            assert ret.status_code == 200
+            table = pa.ipc.open_stream(ret.data).read_all()
+            assert table.schema.names == ["Datetime", str(ts_l[0])]
+            assert table.schema.field(1).type == pa.int64()
+            assert table.column(1).to_pylist() == [2, 2]
+
+            # Arrow not available
+            with mock.patch(
+                "bemserver_api.input_output.timeseries_data_stream_io.pa", None
+            ):
+                ret = client.get(
+                    query_url,
+                    query_string=query_string,
+                    headers={"Accept": ARROW_STREAM_MIME_TYPE},
+                )
+                assert ret.status_code == 406
+                ret = client.get(
+                    f"{query_url}aggregate",
+                    query_string={
+                        **query_string,
+                        "bucket_width_value": 1,
+                        "bucket_width_unit": "day",
+                    },
+                    headers={"Accept": ARROW_STREAM_MIME_TYPE},
+                )
+                assert ret.status_code == 406
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_compact_json(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": (end_time + dt.timedelta(hours=1)).isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "compact": True,
+            }
+
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                "timestamps": [
+                    "2020-01-01T00:00:00+00:00",
+                    "2020-01-01T01:00:00+00:00",
+                    "2020-01-01T02:00:00+00:00",
+                    "2020-01-01T03:00:00+00:00",
+                ],
+                "values": {str(ts_l[0]): [0.0, 1.0, 2.0, 3.0]},
+            }
+
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "timezone": "Europe/Paris",
+                    "epoch_timestamps": True,
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "timestamps": [
+                    1577836800000,
+                    1577840400000,
+                    1577844000000,
+                    1577847600000,
+                ],
+                "values": {str(ts_l[0]): [0.0, 1.0, 2.0, 3.0]},
+            }
+
+            # Aggregate: empty buckets are null
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "bucket_width_value": 2,
+                    "bucket_width_unit": "hour",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "timestamps": [
+                    "2020-01-01T00:00:00+00:00",
+                    "2020-01-01T02:00:00+00:00",
+                    "2020-01-01T04:00:00+00:00",
+                ],
+                "values": {str(ts_l[0]): [0.5, 2.5, None]},
+            }
+
+            # Not compatible with stream and long format
+            for arg in ({"stream": True}, {"format": "long"}):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+
+    @pytest.mark.usefixtures("timeseries_by_buildings")
+    @pytest.mark.usefixtures("timeseries_property_data")
+    def test_timeseries_data_get_selector(
+        self,
+        app,
+        users,
+        sites,
+        buildings,
+        timeseries,
+        timeseries_properties,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "data_state": ds_id,
+        }
+
+        with AuthHeader(creds):
+            for selector, expected in (
+                ({"recurse_building_id": buildings[0]}, [ts_1_id]),
+                ({"recurse_site_id": sites[1]}, [ts_2_id]),
+                ({"building_id": buildings[1]}, [ts_2_id]),
+                ({"unit_symbol": "m"}, [ts_1_id]),
+                (
+                    {
+                        "property_id": timeseries_properties[:2],
+                        "property_value": ["12", "42"],
+                    },
+                    [ts_1_id, ts_2_id],
+                ),
+                (
+                    {
+                        "recurse_site_id": sites[0],
+                        "property_id": timeseries_properties[:1],
+                        "property_value": ["12"],
+                    },
+                    [ts_1_id],
+                ),
+                (
+                    {
+                        "property_id": timeseries_properties[:1],
+                        "property_value": ["69"],
+                    },
+                    [],
+                ),
+            ):
+                ret = client.get(
+                    TIMESERIES_DATA_URL,
+                    query_string={**query_string, **selector},
+                    headers={"Accept": "text/csv"},
+                )
+                assert ret.status_code == 200
+                assert ret.data.decode("utf-8").splitlines()[0] == ",".join(
+                    ["Datetime", *(str(ts_id) for ts_id in expected)]
+                )
+
+            # Aggregate
+            ret = client.get(
+                f"{TIMESERIES_DATA_URL}aggregate",
+                query_string={
+                    **query_string,
+                    "recurse_building_id": buildings[0],
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 1.5}}
+
+            # Wrong parameters
+            for selector in (
+                {},
+                {"timeseries": [ts_1_id], "site_id": sites[0]},
+                {"site_id": sites[0], "recurse_site_id": sites[0]},
+                {"property_id": timeseries_properties[:2], "property_value": ["12"]},
+                {"site_id": sites[0], "convert_to": ["mm"]},
+            ):
+                ret = client.get(
+                    TIMESERIES_DATA_URL, query_string={**query_string, **selector}
+                )
+                assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_aggregate_multiple(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+            db.session.commit()
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+            label = ts_l[0]
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": (end_time + dt.timedelta(hours=1)).isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "bucket_width_value": 2,
+                "bucket_width_unit": "hour",
+                "aggregation": ("avg", "min", "max", "count", "min"),
+            }
+
+            ret = client.get(f"{query_url}aggregate", query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                f"{label}:avg": {
+                    "2020-01-01T00:00:00+00:00": 0.5,
+                    "2020-01-01T02:00:00+00:00": 2.5,
+                    "2020-01-01T04:00:00+00:00": None,
+                },
+                f"{label}:min": {
+                    "2020-01-01T00:00:00+00:00": 0.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                    "2020-01-01T04:00:00+00:00": None,
+                },
+                f"{label}:max": {
+                    "2020-01-01T00:00:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 3.0,
+                    "2020-01-01T04:00:00+00:00": None,
+                },
+                f"{label}:count": {
+                    "2020-01-01T00:00:00+00:00": 2,
+                    "2020-01-01T02:00:00+00:00": 2,
+                    "2020-01-01T04:00:00+00:00": 0,
+                },
+            }
+
+            # CSV, 1 x unit buckets, conversion (not applied to count)
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "aggregation": ("sum", "count"),
+                    "convert_to": ("mm",),
+                },
+                headers={"Accept": "text/csv"},
+            )
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{label}:sum,{label}:count",
+                "2020-01-01T00:00:00+0000,6000.0,4",
+            ]
+
+            # Conversions: incompatible convert_to unit
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={**query_string, "convert_to": ("Wh",)},
+            )
+            assert ret.status_code == 422
+
+            # Unknown aggregation
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={**query_string, "aggregation": ("avg", "dummy")},
+            )
+            assert ret.status_code == 422
+
+    @pytest.mark.usefixtures("timeseries_property_data")
+    def test_timeseries_data_get_aggregate_reduce(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_properties,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        query_url = f"{TIMESERIES_DATA_URL}aggregate"
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id, ts_2_id],
+            "data_state": ds_id,
+            "bucket_width_value": 2,
+            "bucket_width_unit": "hour",
+            "aggregation": "sum",
+            "reduce": "sum",
+        }
+
+        with AuthHeader(creds):
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                "sum": {
+                    "2020-01-01T00:00:00+00:00": 2.0,
+                    "2020-01-01T02:00:00+00:00": 10.0,
+                }
+            }
+
+            # Several aggregations, timeseries selected by property
+            ret = client.get(
+                query_url,
+                query_string={
+                    **{k: v for k, v in query_string.items() if k != "timeseries"},
+                    "property_id": timeseries_properties[:1],
+                    "property_value": ["12"],
+                    "aggregation": ["max", "count"],
+                    "reduce": "avg",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "avg:max": {
+                    "2020-01-01T00:00:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 3.0,
+                },
+                "avg:count": {
+                    "2020-01-01T00:00:00+00:00": 2.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                },
+            }
+
+            # Units differ
+            with OpenBar():
+                Timeseries.get_by_id(ts_1_id).unit_symbol = "m"
+                Timeseries.get_by_id(ts_2_id).unit_symbol = "mm"
+                db.session.commit()
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 422
+            ret = client.get(
+                query_url, query_string={**query_string, "aggregation": "count"}
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "sum": {
+                    "2020-01-01T00:00:00+00:00": 4,
+                    "2020-01-01T02:00:00+00:00": 4,
+                }
+            }
+            ret = client.get(
+                query_url,
+                query_string={**query_string, "reduce": "max", "reduce_unit": "mm"},
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                "max": {
+                    "2020-01-01T00:00:00+00:00": 1000.0,
+                    "2020-01-01T02:00:00+00:00": 5000.0,
+                }
+            }
+
+            # Wrong parameters
+            for arg in (
+                {"reduce": "dummy"},
+                {"reduce": "sum", "reduce_unit": "s"},
+                {"reduce": "sum", "reduce_unit": "dummy"},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+            ret = client.get(
+                query_url,
+                query_string={
+                    **{k: v for k, v in query_string.items() if k != "reduce"},
+                    "reduce_unit": "mm",
+                },
+            )
+            assert ret.status_code == 422
+
+    def test_timeseries_data_get_aggregate_percentile(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        query_url = f"{TIMESERIES_DATA_URL}aggregate"
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id],
+            "data_state": ds_id,
+            "bucket_width_value": 2,
+            "bucket_width_unit": "hour",
+            "aggregation": "p50",
+        }
+
+        with AuthHeader(creds):
+            # N x unit buckets
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_1_id): {
+                    "2020-01-01T00:00:00+00:00": 0.5,
+                    "2020-01-01T02:00:00+00:00": 2.5,
+                }
+            }
+
+            # Several percentiles and aggregations, variable size buckets
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "aggregation": ["p0", "p25", "p100", "count"],
+                    "timezone": "Europe/Paris",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                f"{ts_1_id}:p0": {"2020-01-01T00:00:00+01:00": 0.0},
+                f"{ts_1_id}:p25": {"2020-01-01T00:00:00+01:00": 0.75},
+                f"{ts_1_id}:p100": {"2020-01-01T00:00:00+01:00": 3.0},
+                f"{ts_1_id}:count": {"2020-01-01T00:00:00+01:00": 4},
+            }
+
+            # Empty buckets
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "end_time": (end_time + dt.timedelta(hours=2)).isoformat(),
+                    "aggregation": "p99.5",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_1_id): {
+                    "2020-01-01T00:00:00+00:00": pytest.approx(0.995),
+                    "2020-01-01T02:00:00+00:00": pytest.approx(2.995),
+                    "2020-01-01T04:00:00+00:00": None,
+                }
+            }
+
+            # Wrong percentiles
+            for aggregation in ("p", "p101", "p5.", "q5"):
+                ret = client.get(
+                    query_url,
+                    query_string={**query_string, "aggregation": aggregation},
+                )
+                assert ret.status_code == 422
+
+    def test_timeseries_data_get_virtual(
+        self,
+        app,
+        users,
+        campaigns,
+        campaign_scopes,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        ds_id = 1
+
+        with OpenBar():
+            formula_prop = TimeseriesProperty.new(name="Formula")
+            ts_v = Timeseries.new(
+                name="Virtual",
+                campaign_id=campaigns[0],
+                campaign_scope_id=campaign_scopes[0],
+                unit_symbol="m",
+            )
+            db.session.flush()
+            ts_v_id = ts_v.id
+            ts_v_prop_data = TimeseriesPropertyData.new(
+                timeseries_id=ts_v_id,
+                property_id=formula_prop.id,
+                value=f"ts_{ts_1_id} * 2 + ts_{ts_2_id}",
+            )
+            db.session.commit()
+            ts_v_prop_data_id = ts_v_prop_data.id
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_v_id, ts_1_id],
+            "data_state": ds_id,
+        }
+        aggregate_query_string = {
+            **query_string,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "day",
+            "aggregation": "sum",
+        }
+
+        with AuthHeader(creds):
+            ret = client.get(TIMESERIES_DATA_URL, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_v_id): {
+                    "2020-01-01T00:00:00+00:00": 0.0,
+                    "2020-01-01T01:00:00+00:00": 3.0,
+                    "2020-01-01T02:00:00+00:00": 6.0,
+                    "2020-01-01T03:00:00+00:00": 9.0,
+                },
+                str(ts_1_id): {
+                    "2020-01-01T00:00:00+00:00": 0.0,
+                    "2020-01-01T01:00:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                    "2020-01-01T03:00:00+00:00": 3.0,
+                },
+            }
+            etag = ret.headers["ETag"]
+
+            # Aggregate, with unit conversion
+            ret = client.get(
+                f"{TIMESERIES_DATA_URL}aggregate", query_string=aggregate_query_string
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_v_id): {"2020-01-01T00:00:00+00:00": 18.0},
+                str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0},
+            }
+            ret = client.get(
+                f"{TIMESERIES_DATA_URL}aggregate",
+                query_string={
+                    **aggregate_query_string,
+                    "timeseries": [ts_v_id],
+                    "convert_to": ["mm"],
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_v_id): {"2020-01-01T00:00:00+00:00": 18000.0},
+            }
+
+            # Resample, virtual timeseries data queried with a margin
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string={
+                    **query_string,
+                    "start_time": (start_time + dt.timedelta(hours=6)).isoformat(),
+                    "end_time": (start_time + dt.timedelta(hours=8)).isoformat(),
+                    "resample_step_value": 1,
+                    "resample_step_unit": "hour",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_v_id): {
+                    "2020-01-01T06:00:00+00:00": None,
+                    "2020-01-01T07:00:00+00:00": None,
+                },
+                str(ts_1_id): {
+                    "2020-01-01T06:00:00+00:00": 3.0,
+                    "2020-01-01T07:00:00+00:00": 3.0,
+                },
+            }
+
+            # Writes on inputs invalidate caches
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={str(ts_1_id): {"2020-01-01T00:30:00+00:00": 10.0}},
+            )
+            assert ret.status_code == 201
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-None-Match": etag},
+            )
+            assert ret.status_code == 200
+            assert "2020-01-01T00:30:00+00:00" not in ret.json[str(ts_v_id)]
+            ret = client.get(
+                f"{TIMESERIES_DATA_URL}aggregate", query_string=aggregate_query_string
+            )
+            assert ret.status_code == 200
+            assert ret.json[str(ts_v_id)] == {"2020-01-01T00:00:00+00:00": 38.0}
+
+            # Virtual timeseries can't be streamed
+            for arg in ({"stream": True}, {"format": "long"}):
+                ret = client.get(
+                    TIMESERIES_DATA_URL, query_string={**query_string, **arg}
+                )
+                assert ret.status_code == 422
+
+            # Wrong formulas
+            for formula in (
+                "ts_1 +",
+                f"ts_{DUMMY_ID}",
+                f"ts_{ts_v_id}",
+            ):
+                with OpenBar():
+                    TimeseriesPropertyData.get_by_id(ts_v_prop_data_id).value = formula
+                    db.session.commit()
+                for url in (TIMESERIES_DATA_URL, f"{TIMESERIES_DATA_URL}aggregate"):
+                    ret = client.get(url, query_string=aggregate_query_string)
+                    assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_aggregate_time_weighted_avg(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_by_data_states,
+        for_campaign,
+    ):
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+        start_time = dt.datetime(2020, 1, 1, 1, tzinfo=dt.timezone.utc)
+        end_time = dt.datetime(2020, 1, 1, 4, tzinfo=dt.timezone.utc)
+
+        with OpenBar():
+            for timestamp, value in (
+                # Value carried in from before the interval
+                (dt.datetime(2020, 1, 1, 0, 30, tzinfo=dt.timezone.utc), 0),
+                (dt.datetime(2020, 1, 1, 1, 30, tzinfo=dt.timezone.utc), 10),
+                (dt.datetime(2020, 1, 1, 1, 45, tzinfo=dt.timezone.utc), 20),
+                (dt.datetime(2020, 1, 1, 3, tzinfo=dt.timezone.utc), 40),
+            ):
+                TimeseriesData.new(
+                    timestamp=timestamp,
+                    timeseries_by_data_state_id=timeseries_by_data_states[0],
+                    value=value,
+                )
+            db.session.commit()
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+            label = ts_l[0]
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "bucket_width_value": 1,
+                "bucket_width_unit": "hour",
+                "aggregation": "time_weighted_avg",
+            }
+
+            ret = client.get(f"{query_url}aggregate", query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(label): {
+                    "2020-01-01T01:00:00+00:00": 7.5,
+                    "2020-01-01T02:00:00+00:00": 20.0,
+                    "2020-01-01T03:00:00+00:00": 40.0,
+                },
+            }
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "aggregation": ("avg", "time_weighted_avg"),
+                },
+                headers={"Accept": "text/csv"},
+            )
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{label}:avg,{label}:time_weighted_avg",
+                "2020-01-01T01:00:00+0000,15.0,7.5",
+                "2020-01-01T02:00:00+0000,,20.0",
+                "2020-01-01T03:00:00+0000,40.0,40.0",
+            ]
+
+            # No data
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "start_time": "2019-01-01T00:00:00+00:00",
+                    "end_time": "2019-01-01T02:00:00+00:00",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(label): {
+                    "2019-01-01T00:00:00+00:00": None,
+                    "2019-01-01T01:00:00+00:00": None,
+                },
+            }
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_aggregate_delta(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_by_data_states,
+        for_campaign,
+    ):
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+        start_time = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+        end_time = dt.datetime(2020, 1, 4, tzinfo=dt.timezone.utc)
+
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).unit_symbol = "kWh"
+            for timestamp, value in (
+                # Index before the interval
+                (dt.datetime(2019, 12, 31, 23, tzinfo=dt.timezone.utc), 100),
+                (dt.datetime(2020, 1, 1, 6, tzinfo=dt.timezone.utc), 110),
+                (dt.datetime(2020, 1, 1, 18, tzinfo=dt.timezone.utc), 130),
+                # Meter reset
+                (dt.datetime(2020, 1, 2, 6, tzinfo=dt.timezone.utc), 5),
+                (dt.datetime(2020, 1, 2, 18, tzinfo=dt.timezone.utc), 15),
+            ):
+                TimeseriesData.new(
+                    timestamp=timestamp,
+                    timeseries_by_data_state_id=timeseries_by_data_states[0],
+                    value=value,
+                )
+            db.session.commit()
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+            label = ts_l[0]
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "bucket_width_value": 1,
+                "bucket_width_unit": "day",
+                "aggregation": "delta",
+            }
+
+            ret = client.get(f"{query_url}aggregate", query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(label): {
+                    "2020-01-01T00:00:00+00:00": 30.0,
+                    "2020-01-02T00:00:00+00:00": 15.0,
+                    "2020-01-03T00:00:00+00:00": None,
+                },
+            }
+
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={**query_string, "convert_to": ("Wh",)},
+                headers={"Accept": "text/csv"},
+            )
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{label}",
+                "2020-01-01T00:00:00+0000,30000.0",
+                "2020-01-02T00:00:00+0000,15000.0",
+                "2020-01-03T00:00:00+0000,",
+            ]
+
+    def test_timeseries_data_get_aggregate_cache(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id],
+            "data_state": ds_id,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "day",
+            "aggregation": "sum",
+        }
+        query_url = f"{TIMESERIES_DATA_URL}aggregate"
+
+        with mock.patch(
+            "bemserver_api.resources.timeseries_data.routes._compute_aggregate_data",
+            wraps=routes._compute_aggregate_data,
+        ) as compute_mock:
+            with AuthHeader(users["Chuck"]["creds"]):
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.status_code == 200
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0}}
+                assert compute_mock.call_count == 1
+
+                # Result from cache
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.status_code == 200
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0}}
+                assert compute_mock.call_count == 1
+
+                # Other parameters
+                ret = client.get(
+                    query_url, query_string={**query_string, "aggregation": "max"}
+                )
+                assert ret.status_code == 200
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 3.0}}
+                assert compute_mock.call_count == 2
+
+            # Permissions are checked before reading cache
+            with AuthHeader(users["Active"]["creds"]):
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.status_code == 403
+                assert compute_mock.call_count == 2
+
+            with AuthHeader(users["Chuck"]["creds"]):
+                # Write outside interval: result from cache
+                ret = client.post(
+                    TIMESERIES_DATA_URL,
+                    query_string={"data_state": ds_id},
+                    json={str(ts_1_id): {"2020-02-01T00:00:00+00:00": 12.0}},
+                )
+                assert ret.status_code == 201
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0}}
+                assert compute_mock.call_count == 2
+
+                # Write inside bucket: result computed again
+                ret = client.post(
+                    TIMESERIES_DATA_URL,
+                    query_string={"data_state": ds_id},
+                    json={str(ts_1_id): {"2020-01-01T12:00:00+00:00": 12.0}},
+                )
+                assert ret.status_code == 201
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 18.0}}
+                assert compute_mock.call_count == 3
+
+                # Delete inside interval: result computed again
+                ret = client.delete(
+                    TIMESERIES_DATA_URL,
+                    query_string={
+                        "start_time": start_time.isoformat(),
+                        "end_time": end_time.isoformat(),
+                        "timeseries": [ts_1_id],
+                        "data_state": ds_id,
+                    },
+                )
+                assert ret.status_code == 204
+                ret = client.get(query_url, query_string=query_string)
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 12.0}}
+                assert compute_mock.call_count == 4
+
+    # Aggregate cache is not invalidated by writes out of the API
+    @mock.patch.object(aggregate_cache, "store", None)
+    def test_timeseries_data_get_aggregate_rollups(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+        ds_clean_id = 2
+
+        with OpenBar():
+            tsbds_clean_id = (
+                Timeseries.get_by_id(ts_1_id)
+                .get_timeseries_by_data_state(
+                    TimeseriesDataState.get_by_id(ds_clean_id)
+                )
+                .id
+            )
+            db.session.commit()
+
+        client = app.test_client()
+
+        def get_rollups(period):
+            return db.session.execute(
+                sqla.select(
+                    ts_data_rollups.c.timestamp,
+                    ts_data_rollups.c.value_count,
+                    ts_data_rollups.c.value_sum,
+                )
+                .join(
+                    TimeseriesByDataState,
+                    TimeseriesByDataState.id == ts_data_rollups.c.ts_by_data_state_id,
+                )
+                .where(
+                    TimeseriesByDataState.timeseries_id == ts_1_id,
+                    TimeseriesByDataState.data_state_id == ds_id,
+                    ts_data_rollups.c.period == period,
+                )
+                .order_by(ts_data_rollups.c.timestamp)
+            ).all()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id],
+            "data_state": ds_id,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "day",
+            "aggregation": "sum",
+        }
+        query_url = f"{TIMESERIES_DATA_URL}aggregate"
+
+        with AuthHeader(users["Chuck"]["creds"]):
+            # Rollups are built on first use
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0}}
+            assert get_rollups("day") == [(start_time, 4, 6.0)]
+            assert [row[1:] for row in get_rollups("hour")] == [
+                (1, 0.0),
+                (1, 1.0),
+                (1, 2.0),
+                (1, 3.0),
+            ]
+
+            # Writes are logged and rollups are updated before being used
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={
+                    str(ts_1_id): {
+                        "2020-01-01T03:30:00+00:00": 12.0,
+                        "2020-01-02T00:00:00+00:00": 42.0,
+                    }
+                },
+            )
+            assert ret.status_code == 201
+            assert get_rollups("day") == [(start_time, 4, 6.0)]
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "end_time": (end_time + dt.timedelta(days=1)).isoformat(),
+                    "aggregation": ["sum", "count", "avg"],
+                },
+            )
+            assert get_rollups("day") == [
+                (start_time, 5, 18.0),
+                (start_time + dt.timedelta(days=1), 1, 42.0),
+            ]
+            assert get_rollups("hour")[3][1:] == (2, 15.0)
+            assert ret.json == {
+                f"{ts_1_id}:sum": {
+                    "2020-01-01T00:00:00+00:00": 18.0,
+                    "2020-01-02T00:00:00+00:00": 42.0,
+                },
+                f"{ts_1_id}:count": {
+                    "2020-01-01T00:00:00+00:00": 5,
+                    "2020-01-02T00:00:00+00:00": 1,
+                },
+                f"{ts_1_id}:avg": {
+                    "2020-01-01T00:00:00+00:00": 3.6,
+                    "2020-01-02T00:00:00+00:00": 42.0,
+                },
+            }
+
+            # Rollups are updated on delete
+            ret = client.delete(
+                TIMESERIES_DATA_URL,
+                query_string={
+                    "start_time": "2020-01-01T03:00:00+00:00",
+                    "end_time": "2020-01-03T00:00:00+00:00",
+                    "timeseries": [ts_1_id],
+                    "data_state": ds_id,
+                },
+            )
+            assert ret.status_code == 204
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 3.0}}
+            assert get_rollups("day") == [(start_time, 3, 3.0)]
+            assert len(get_rollups("hour")) == 3
+
+            # Data written out of the API (e.g. by the cleanup) is also logged
+            clean_query_string = {
+                **query_string,
+                "data_state": ds_clean_id,
+                "aggregation": "max",
+            }
+            ret = client.get(query_url, query_string=clean_query_string)
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": None}}
+            with OpenBar():
+                tsdio.set_timeseries_data(
+                    pd.DataFrame(
+                        {ts_1_id: [12.0]},
+                        index=pd.DatetimeIndex(
+                            ["2020-01-01T05:00:00+00:00"], name="timestamp"
+                        ),
+                    ),
+                    TimeseriesDataState.get_by_id(ds_clean_id),
+                )
+            db.session.commit()
+            ret = client.get(query_url, query_string=clean_query_string)
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 12.0}}
+            db.session.execute(
+                sqla.text(
+                    "UPDATE ts_data SET value = 24, timestamp = '2020-01-02T05:00Z' "
+                    "WHERE ts_by_data_state_id = :tsbds_id;"
+                ),
+                {"tsbds_id": tsbds_clean_id},
+            )
+            db.session.commit()
+            ret = client.get(
+                query_url,
+                query_string={
+                    **clean_query_string,
+                    "end_time": (end_time + dt.timedelta(days=1)).isoformat(),
+                },
+            )
+            assert ret.json == {
+                str(ts_1_id): {
+                    "2020-01-01T00:00:00+00:00": None,
+                    "2020-01-02T00:00:00+00:00": 24.0,
+                }
+            }
+            db.session.execute(
+                sqla.text("DELETE FROM ts_data WHERE ts_by_data_state_id = :tsbds_id;"),
+                {"tsbds_id": tsbds_clean_id},
+            )
+            db.session.commit()
+            ret = client.get(
+                query_url,
+                query_string={
+                    **clean_query_string,
+                    "start_time": (start_time + dt.timedelta(days=1)).isoformat(),
+                    "end_time": (end_time + dt.timedelta(days=1)).isoformat(),
+                },
+            )
+            assert ret.json == {str(ts_1_id): {"2020-01-02T00:00:00+00:00": None}}
+
+            # Data is read while written by another transaction
+            with db.engine.connect() as connection:
+                connection.execute(
+                    sqla.text(
+                        "INSERT INTO ts_data (timestamp, ts_by_data_state_id, value) "
+                        "VALUES ('2020-01-01T05:00:00+00:00', :tsbds_id, 12);"
+                    ),
+                    {"tsbds_id": tsbds_clean_id},
+                )
+                with OpenBar():
+                    assert not rollups.prepare(
+                        [Timeseries.get_by_id(ts_1_id)],
+                        TimeseriesDataState.get_by_id(ds_clean_id),
+                    )
+                ret = client.get(query_url, query_string=clean_query_string)
+                assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": None}}
+                connection.commit()
+            ret = client.get(query_url, query_string=clean_query_string)
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 12.0}}
+
+        # Data of built rollups can be deleted along with timeseries
+        with OpenBar():
+            Timeseries.get_by_id(ts_1_id).delete()
+            db.session.commit()
+
+    def test_timeseries_data_get_aggregate_rollups_no_tables(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+
+        db.session.commit()
+        rollups_metadata.drop_all(db.engine)
+        # Tables existence was checked when writing fixture data
+        rollups._engines.clear()
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id],
+            "data_state": ds_id,
+            "bucket_width_value": 1,
+            "bucket_width_unit": "day",
+            "aggregation": "sum",
+        }
+        query_url = f"{TIMESERIES_DATA_URL}aggregate"
+
+        with AuthHeader(users["Chuck"]["creds"]):
+            # Aggregates are computed from data
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 6.0}}
+            ret = client.post(
+                TIMESERIES_DATA_URL,
+                query_string={"data_state": ds_id},
+                json={str(ts_1_id): {"2020-01-01T03:30:00+00:00": 12.0}},
+            )
+            assert ret.status_code == 201
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.json == {str(ts_1_id): {"2020-01-01T00:00:00+00:00": 18.0}}
+
+        assert not sqla.inspect(db.engine).has_table(ts_data_rollups.name)
+
+    @pytest.mark.parametrize("timeseries_data", (100,), indirect=True)
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_max_points(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "max_points": 10,
+            }
+
+            # LTTB
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            data = ret.json[str(ts_l[0])]
+            assert len(data) == 10
+            assert data["2020-01-01T00:00:00+00:00"] == 0
+            assert data["2020-01-05T03:00:00+00:00"] == 99
+
+            # Min/max envelope
+            ret = client.get(
+                query_url, query_string={**query_string, "downsampling": "minmax"}
+            )
+            assert ret.status_code == 200
+            data = ret.json[str(ts_l[0])]
+            assert len(data) == 10
+            assert data["2020-01-01T00:00:00+00:00"] == 0
+            assert data["2020-01-05T03:00:00+00:00"] == 99
+
+            # CSV
+            ret = client.get(
+                query_url, query_string=query_string, headers={"Accept": "text/csv"}
+            )
+            assert ret.status_code == 200
+            lines = ret.data.decode("utf-8").splitlines()
+            assert lines[0] == f"Datetime,{ts_l[0]}"
+            assert lines[1] == "2020-01-01T00:00:00+0000,0.0"
+            assert len(lines) == 11
+
+            # Compact JSON
+            ret = client.get(query_url, query_string={**query_string, "compact": True})
+            assert ret.status_code == 200
+            assert len(ret.json["timestamps"]) == 10
+
+            # Arrow
+            ret = client.get(
+                query_url,
+                query_string=query_string,
+                headers={"Accept": ARROW_STREAM_MIME_TYPE},
+            )
+            assert ret.status_code == 200
+            table = pa.ipc.open_stream(ret.data).read_all()
+            assert table.num_rows == 10
+
+            # Aggregate
+            ret = client.get(
+                f"{query_url}aggregate",
+                query_string={
+                    **query_string,
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "hour",
+                    "aggregation": "count",
+                },
+            )
+            assert ret.status_code == 200
+            assert len(ret.json[str(ts_l[0])]) == 10
+
+            # Wrong parameters
+            for arg in (
+                {"max_points": 2},
+                {"downsampling": "dummy"},
+                {"stream": True},
+                {"format": "long"},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_resample(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            query_string = {
+                "start_time": (start_time + dt.timedelta(minutes=10)).isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "resample_step_value": 30,
+                "resample_step_unit": "minute",
+            }
+
+            # Previous value, including last value after end of data
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T00:30:00+00:00": 0.0,
+                    "2020-01-01T01:00:00+00:00": 1.0,
+                    "2020-01-01T01:30:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                    "2020-01-01T02:30:00+00:00": 2.0,
+                    "2020-01-01T03:00:00+00:00": 3.0,
+                    "2020-01-01T03:30:00+00:00": 3.0,
+                }
+            }
+
+            # Linear interpolation, in timezone
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "fill": "linear",
+                    "timezone": "Europe/Paris",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T01:30:00+01:00": 0.5,
+                    "2020-01-01T02:00:00+01:00": 1.0,
+                    "2020-01-01T02:30:00+01:00": 1.5,
+                    "2020-01-01T03:00:00+01:00": 2.0,
+                    "2020-01-01T03:30:00+01:00": 2.5,
+                    "2020-01-01T04:00:00+01:00": 3.0,
+                    "2020-01-01T04:30:00+01:00": None,
+                }
+            }
+
+            # Max gap, CSV
+            ret = client.get(
+                query_url,
+                query_string={**query_string, "max_gap": 1200},
+                headers={"Accept": "text/csv"},
+            )
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{ts_l[0]}",
+                "2020-01-01T00:30:00+0000,",
+                "2020-01-01T01:00:00+0000,1.0",
+                "2020-01-01T01:30:00+0000,",
+                "2020-01-01T02:00:00+0000,2.0",
+                "2020-01-01T02:30:00+0000,",
+                "2020-01-01T03:00:00+0000,3.0",
+                "2020-01-01T03:30:00+0000,",
+            ]
+
+            # Last value several steps before start time
+            query_string_after = {
+                **query_string,
+                "start_time": (end_time + dt.timedelta(hours=2)).isoformat(),
+                "end_time": (end_time + dt.timedelta(hours=3)).isoformat(),
+            }
+            ret = client.get(query_url, query_string=query_string_after)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T06:00:00+00:00": 3.0,
+                    "2020-01-01T06:30:00+00:00": 3.0,
+                }
+            }
+            ret = client.get(
+                query_url, query_string={**query_string_after, "max_gap": 3600}
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T06:00:00+00:00": None,
+                    "2020-01-01T06:30:00+00:00": None,
+                }
+            }
+
+            # Next value several steps after end time
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "end_time": (start_time + dt.timedelta(minutes=40)).isoformat(),
+                    "resample_step_value": 15,
+                    "fill": "linear",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T00:15:00+00:00": 0.25,
+                    "2020-01-01T00:30:00+00:00": 0.5,
+                }
+            }
+
+            # Wrong parameters
+            for arg in (
+                {"resample_step_unit": "day"},
+                {"resample_step_value": 0},
+                {"fill": "dummy"},
+                {"fill": ["ffill", "linear"]},
+                {"max_gap": 0},
+                {"max_points": 10},
+                {"stream": True},
+                {"format": "long"},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_rolling(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        with AuthHeader(creds):
+            if not for_campaign:
+                query_url = TIMESERIES_DATA_URL
+                ts_l = (ts_1_id,)
+            else:
+                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
+                ts_l = (f"Timeseries {ts_1_id-1}",)
+
+            query_string = {
+                "start_time": (start_time + dt.timedelta(hours=2)).isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "rolling_window_value": 2,
+                "rolling_window_unit": "hour",
+            }
+
+            # Data timestamps, including data before start time
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T02:00:00+00:00": 1.5,
+                    "2020-01-01T03:00:00+00:00": 2.5,
+                }
+            }
+
+            # Grid, in timezone
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "start_time": (start_time + dt.timedelta(minutes=90)).isoformat(),
+                    "rolling_window_value": 90,
+                    "rolling_window_unit": "minute",
+                    "rolling_function": "sum",
+                    "rolling_step_value": 30,
+                    "rolling_step_unit": "minute",
+                    "timezone": "Europe/Paris",
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T02:30:00+01:00": 1.0,
+                    "2020-01-01T03:00:00+01:00": 3.0,
+                    "2020-01-01T03:30:00+01:00": 2.0,
+                    "2020-01-01T04:00:00+01:00": 5.0,
+                    "2020-01-01T04:30:00+01:00": 3.0,
+                }
+            }
+
+            # Empty windows, CSV
+            ret = client.get(
+                query_url,
+                query_string={
+                    **query_string,
+                    "start_time": end_time.isoformat(),
+                    "end_time": (end_time + dt.timedelta(hours=4)).isoformat(),
+                    "rolling_function": "count",
+                    "rolling_step_value": 1,
+                    "rolling_step_unit": "hour",
+                },
+                headers={"Accept": "text/csv"},
+            )
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{ts_l[0]}",
+                "2020-01-01T04:00:00+0000,1.0",
+                "2020-01-01T05:00:00+0000,0.0",
+                "2020-01-01T06:00:00+0000,0.0",
+                "2020-01-01T07:00:00+0000,0.0",
+            ]
+
+            # Wrong parameters
+            for arg in (
+                {"rolling_window_unit": "day"},
+                {"rolling_window_value": 0},
+                {"rolling_function": "dummy"},
+                {"rolling_step_unit": "day"},
+                {"resample_step_unit": "hour"},
+                {"stream": True},
+                {"format": "long"},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
+                assert ret.status_code == 422
+            query_string.pop("rolling_window_unit")
+            ret = client.get(
+                query_url,
+                query_string={**query_string, "rolling_step_unit": "hour"},
+            )
+            assert ret.status_code == 422
+
+    @pytest.mark.parametrize("for_campaign", (True, False))
+    def test_timeseries_data_get_value_range(
+        self,
+        app,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+        for_campaign,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        creds = users["Chuck"]["creds"]
 
-            ret = client.get(
-                f"{query_url}aggregate",
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "bucket_width_value": 1,
-                    "bucket_width_unit": "day",
-                    "convert_to": ("mm",),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1500.0"
-                    assert len(ret_csv_lines) == 2
-                else:
-                    assert ret.json == {
-                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1500.0}
-                    }
+        client = app.test_client()
 
-            # Conversions: "" -> no conversion
+        with AuthHeader(creds):
             if not for_campaign:
                 query_url = TIMESERIES_DATA_URL
                 ts_l = (ts_1_id,)
-                ret_line_1 = "Datetime,1"
             else:
                 query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_1_id}/"
                 ts_l = (f"Timeseries {ts_1_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 0"
 
-            ret = client.get(
-                f"{query_url}aggregate",
-                query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "bucket_width_value": 1,
-                    "bucket_width_unit": "day",
-                    "convert_to": ("",),
-                },
-                headers={"Accept": mime_type},
-            )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
-                assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert ret_csv_lines[1] == "2020-01-01T00:00:00+0000,1.5"
-                    assert len(ret_csv_lines) == 2
-                else:
-                    assert ret.json == {
-                        str(ts_l[0]): {"2020-01-01T00:00:00+00:00": 1.5}
-                    }
+            query_string = {
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "timeseries": ts_l,
+                "data_state": ds_id,
+                "min_value": 1,
+                "max_value": 2,
+            }
 
-            # User not in Timeseries group
-            if not for_campaign:
-                query_url = TIMESERIES_DATA_URL
-                ts_l = (ts_2_id,)
-                ret_line_1 = "Datetime,2"
-            else:
-                query_url = TIMESERIES_DATA_URL + f"campaign/{campaign_2_id}/"
-                ts_l = (f"Timeseries {ts_2_id-1}",)
-                ret_line_1 = "Datetime,Timeseries 1"
+            # Bounds included
+            ret = client.get(query_url, query_string=query_string)
+            assert ret.status_code == 200
+            assert ret.json == {
+                str(ts_l[0]): {
+                    "2020-01-01T01:00:00+00:00": 1.0,
+                    "2020-01-01T02:00:00+00:00": 2.0,
+                },
+            }
 
+            # Single bound, CSV
             ret = client.get(
-                f"{query_url}aggregate",
+                query_url,
                 query_string={
-                    "start_time": start_time.isoformat(),
-                    "end_time": end_time.isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "bucket_width_value": 1,
-                    "bucket_width_unit": "day",
+                    **query_string,
+                    "min_value": 2.5,
+                    "max_value": None,
                 },
-                headers={"Accept": mime_type},
+                headers={"Accept": "text/csv"},
             )
-            if user == "anonym":
-                assert ret.status_code == 401
-            elif user == "user":
-                assert ret.status_code == 403
-            else:
-                assert ret.status_code == 200
-                if mime_type == "text/csv":
-                    ret_csv_lines = ret.data.decode("utf-8").splitlines()
-                    assert ret_csv_lines[0] == ret_line_1
-                    assert len(ret_csv_lines) > 1
-                else:
-                    assert list(ret.json.keys()) == [str(ts_l[0])]
+            assert ret.status_code == 200
+            assert ret.data.decode("utf-8").splitlines() == [
+                f"Datetime,{ts_l[0]}",
+                "2020-01-01T03:00:00+0000,3.0",
+            ]
 
-            # Datetime out of range
+            # No value in range
             ret = client.get(
-                f"{query_url}aggregate",
-                query_string={
-                    "start_time": dt.datetime(
-                        2500, 1, 1, tzinfo=dt.timezone.utc
-                    ).isoformat(),
-                    "end_time": dt.datetime(
-                        2500, 1, 2, tzinfo=dt.timezone.utc
-                    ).isoformat(),
-                    "timeseries": ts_l,
-                    "data_state": ds_id,
-                    "bucket_width_value": 1,
-                    "bucket_width_unit": "day",
-                    "timezone": "UTC",
-                },
-                headers={"Accept": mime_type},
+                query_url,
+                query_string={**query_string, "min_value": 10, "max_value": 20},
             )
-            if user == "anonym":
-                assert ret.status_code == 401
-            else:
+            assert ret.status_code == 200
+            assert ret.json == {}
+
+            # Wrong parameters
+            for arg in (
+                {"min_value": 3},
+                {"min_value": "nan"},
+                {"rolling_window_value": 2, "rolling_window_unit": "hour"},
+                {"resample_step_value": 1, "resample_step_unit": "hour"},
+                {"stream": True},
+                {"format": "long"},
+            ):
+                ret = client.get(query_url, query_string={**query_string, **arg})
                 assert ret.status_code == 422
 
     @pytest.mark.parametrize("for_campaign", (True, False))
@@ -857,6 +3398,322 @@ class TestTimeseriesDataApi:
             )
             assert ret.status_code == 422
 
+    @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
+    @pytest.mark.usefixtures("users_by_user_groups")
+    @pytest.mark.usefixtures("user_groups_by_campaigns")
+    @pytest.mark.usefixtures("user_groups_by_campaign_scopes")
+    def test_timeseries_data_post_query(
+        self,
+        app,
+        user,
+        users,
+        campaigns,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ts_2_id = timeseries[1]
+        campaign_1_id = campaigns[0]
+        ds_id = 1
+
+        if user == "admin":
+            creds = users["Chuck"]["creds"]
+            auth_context = AuthHeader(creds)
+        elif user == "user":
+            creds = users["Active"]["creds"]
+            auth_context = AuthHeader(creds)
+        else:
+            auth_context = contextlib.nullcontext()
+
+        client = app.test_client()
+
+        query_args = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "data_state": ds_id,
+        }
+        queries = [
+            {"args": {**query_args, "timeseries": [ts_1_id]}},
+            {
+                "campaign_id": campaign_1_id,
+                "aggregate": True,
+                "args": {
+                    **query_args,
+                    "timeseries": [f"Timeseries {ts_1_id-1}"],
+                    "bucket_width_value": 2,
+                    "bucket_width_unit": "hour",
+                    "aggregation": ["min", "max"],
+                },
+            },
+            {"args": {**query_args, "timeseries": [ts_1_id], "compact": True}},
+        ]
+
+        with auth_context:
+            ret = client.post(f"{TIMESERIES_DATA_URL}query", json={"queries": queries})
+            if user == "anonym":
+                assert ret.status_code == 401
+                return
+            assert ret.status_code == 200
+            assert ret.json == [
+                {
+                    str(ts_1_id): {
+                        "2020-01-01T00:00:00+00:00": 0.0,
+                        "2020-01-01T01:00:00+00:00": 1.0,
+                        "2020-01-01T02:00:00+00:00": 2.0,
+                        "2020-01-01T03:00:00+00:00": 3.0,
+                    },
+                },
+                {
+                    "Timeseries 0:min": {
+                        "2020-01-01T00:00:00+00:00": 0.0,
+                        "2020-01-01T02:00:00+00:00": 2.0,
+                    },
+                    "Timeseries 0:max": {
+                        "2020-01-01T00:00:00+00:00": 1.0,
+                        "2020-01-01T02:00:00+00:00": 3.0,
+                    },
+                },
+                {
+                    "timestamps": [
+                        "2020-01-01T00:00:00+00:00",
+                        "2020-01-01T01:00:00+00:00",
+                        "2020-01-01T02:00:00+00:00",
+                        "2020-01-01T03:00:00+00:00",
+                    ],
+                    "values": {str(ts_1_id): [0.0, 1.0, 2.0, 3.0]},
+                },
+            ]
+
+            # User not in Timeseries group
+            ret = client.post(
+                f"{TIMESERIES_DATA_URL}query",
+                json={
+                    "queries": [
+                        *queries,
+                        {"args": {**query_args, "timeseries": [ts_2_id]}},
+                    ]
+                },
+            )
+            assert ret.status_code == 403 if user == "user" else 200
+
+            # Unknown timeseries, campaign and data state
+            for query in (
+                {"args": {**query_args, "timeseries": [DUMMY_ID]}},
+                {
+                    "campaign_id": DUMMY_ID,
+                    "args": {**query_args, "timeseries": ["Timeseries 0"]},
+                },
+                {
+                    "args": {
+                        **query_args,
+                        "timeseries": [ts_1_id],
+                        "data_state": DUMMY_ID,
+                    }
+                },
+            ):
+                ret = client.post(
+                    f"{TIMESERIES_DATA_URL}query", json={"queries": [query]}
+                )
+                assert ret.status_code == 422
+
+            # Wrong arguments
+            for query in (
+                {"args": {**query_args}},
+                {"args": {**query_args, "timeseries": ["Timeseries 0"]}},
+                {"args": {**query_args, "timeseries": [ts_1_id], "stream": True}},
+                {"aggregate": True, "args": {**query_args, "timeseries": [ts_1_id]}},
+            ):
+                ret = client.post(
+                    f"{TIMESERIES_DATA_URL}query", json={"queries": [query]}
+                )
+                assert ret.status_code == 422
+            ret = client.post(f"{TIMESERIES_DATA_URL}query", json={"queries": []})
+            assert ret.status_code == 422
+
+            # Too many queries
+            app.config["TIMESERIES_DATA_QUERY_MAX_QUERIES"] = 2
+            ret = client.post(f"{TIMESERIES_DATA_URL}query", json={"queries": queries})
+            assert ret.status_code == 422
+
+    def test_timeseries_data_get_conditional(
+        self,
+        app,
+        users,
+        timeseries,
+        timeseries_data,
+    ):
+        start_time, end_time = timeseries_data
+        ts_1_id = timeseries[0]
+        ds_id = 1
+        ds_clean_id = 2
+
+        creds = users["Chuck"]["creds"]
+
+        client = app.test_client()
+
+        query_string = {
+            "start_time": start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "timeseries": [ts_1_id],
+            "data_state": ds_id,
+        }
+
+        with AuthHeader(creds):
+            for query_url, extra_args in (
+                (TIMESERIES_DATA_URL, {}),
+                (
+                    f"{TIMESERIES_DATA_URL}aggregate",
+                    {"bucket_width_value": 1, "bucket_width_unit": "day"},
+                ),
+            ):
+                # Unknown watermarks are set to current time. Set them in the
+                # past, as Last-Modified is only sent once its second is over.
+                with mock.patch(
+                    "bemserver_api.extensions.watermarks.time.time",
+                    return_value=time.time() - 10,
+                ):
+                    ret = client.get(
+                        query_url, query_string={**query_string, **extra_args}
+                    )
+                assert ret.status_code == 200
+                etag = ret.headers["ETag"]
+                assert etag.startswith('W/"')
+                assert ret.last_modified is not None
+                assert ret.cache_control.private
+                assert ret.cache_control.max_age == 3600
+
+                # Not modified
+                ret = client.get(
+                    query_url,
+                    query_string={**query_string, **extra_args},
+                    headers={"If-None-Match": etag},
+                )
+                assert ret.status_code == 304
+                assert ret.headers["ETag"] == etag
+                assert not ret.data
+
+                # Different request
+                ret = client.get(
+                    query_url,
+                    query_string={**query_string, **extra_args},
+                    headers={"If-None-Match": etag, "Accept": "text/csv"},
+                )
+                assert ret.status_code == 200
+                assert ret.headers["ETag"] != etag
+
+            ret = client.get(TIMESERIES_DATA_URL, query_string=query_string)
+            etag = ret.headers["ETag"]
+            last_modified = ret.headers["Last-Modified"]
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-Modified-Since": last_modified},
+            )
+            assert ret.status_code == 304
+
+            # Write data. Watermark is set ahead, so that next request is made
+            # within the second of the write.
+            with mock.patch(
+                "bemserver_api.extensions.watermarks.time.time",
+                return_value=time.time() + 1,
+            ):
+                ret = client.post(
+                    TIMESERIES_DATA_URL,
+                    query_string={"data_state": ds_id},
+                    json={str(ts_1_id): {end_time.isoformat(): 42.0}},
+                )
+            assert ret.status_code == 201
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-None-Match": etag},
+            )
+            assert ret.status_code == 200
+            etag = ret.headers["ETag"]
+            # A write in the same second would not be after Last-Modified, so
+            # it is not sent
+            assert ret.last_modified is None
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-Modified-Since": last_modified},
+            )
+            assert ret.status_code == 200
+
+            # Delete data
+            ret = client.delete(TIMESERIES_DATA_URL, query_string=query_string)
+            assert ret.status_code == 204
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-None-Match": etag},
+            )
+            assert ret.status_code == 200
+            assert not ret.json
+            etag = ret.headers["ETag"]
+
+            # Cleanup
+            clean_query_string = {**query_string, "data_state": ds_clean_id}
+            ret = client.get(TIMESERIES_DATA_URL, query_string=clean_query_string)
+            clean_etag = ret.headers["ETag"]
+            with OpenBar():
+                ST_CleanupByTimeseries.new(
+                    timeseries_id=ts_1_id, last_timestamp=end_time
+                )
+                db.session.commit()
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=clean_query_string,
+                headers={"If-None-Match": clean_etag},
+            )
+            assert ret.status_code == 200
+            clean_etag = ret.headers["ETag"]
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=clean_query_string,
+                headers={"If-None-Match": clean_etag},
+            )
+            assert ret.status_code == 304
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string=query_string,
+                headers={"If-None-Match": etag},
+            )
+            assert ret.status_code == 304
+
+            # Time interval not closed
+            ret = client.get(
+                TIMESERIES_DATA_URL,
+                query_string={
+                    **query_string,
+                    "end_time": (
+                        dt.datetime.now(tz=dt.timezone.utc) + dt.timedelta(days=1)
+                    ).isoformat(),
+                },
+            )
+            assert ret.status_code == 200
+            assert ret.cache_control.no_cache
+            assert ret.cache_control.max_age is None
+            assert "ETag" in ret.headers
+
+            # Time interval not closed, response depends on current time
+            ret = client.get(
+                f"{TIMESERIES_DATA_URL}aggregate",
+                query_string={
+                    **query_string,
+                    "end_time": (
+                        dt.datetime.now(tz=dt.timezone.utc) + dt.timedelta(days=1)
+                    ).isoformat(),
+                    "bucket_width_value": 1,
+                    "bucket_width_unit": "day",
+                    "aggregation": "time_weighted_avg",
+                },
+            )
+            assert ret.status_code == 200
+            assert "ETag" not in ret.headers
+            assert ret.last_modified is None
+
     @pytest.mark.parametrize("user", ("admin", "user", "anonym"))
     @pytest.mark.usefixtures("users_by_user_groups")
     @pytest.mark.usefixtures("user_groups_by_campaigns")
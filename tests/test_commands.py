@@ -0,0 +1,43 @@
+"""Test commands"""
+
+import sqlalchemy as sqla
+
+from click.testing import CliRunner
+
+from bemserver_core.database import db
+
+from bemserver_api.commands import setup_db_cmd
+from bemserver_api.extensions.rollups import LOG_CHANGES_TRIGGERS
+from bemserver_api.extensions.rollups import metadata as rollups_metadata
+from bemserver_api.extensions.stats_summaries import UPDATE_TRIGGERS
+from bemserver_api.extensions.stats_summaries import (
+    metadata as stats_summaries_metadata,
+)
+
+
+class TestCommands:
+    def test_setup_db_cmd(self, app):
+        db.session.commit()
+        rollups_metadata.drop_all(db.engine)
+        stats_summaries_metadata.drop_all(db.engine)
+        table_names = [*rollups_metadata.tables, *stats_summaries_metadata.tables]
+        inspector = sqla.inspect(db.engine)
+        assert not any(inspector.has_table(name) for name in table_names)
+
+        runner = CliRunner()
+        result = runner.invoke(setup_db_cmd)
+        assert result.exit_code == 0
+        inspector = sqla.inspect(db.engine)
+        assert all(inspector.has_table(name) for name in table_names)
+        with db.engine.connect() as connection:
+            triggers = connection.execute(
+                sqla.text(
+                    "SELECT tgname FROM pg_trigger "
+                    "WHERE tgrelid = 'ts_data'::regclass AND NOT tgisinternal;"
+                )
+            ).scalars()
+            assert {*LOG_CHANGES_TRIGGERS, *UPDATE_TRIGGERS} <= set(triggers)
+
+        # Tables are only created if they don't exist
+        result = runner.invoke(setup_db_cmd)
+        assert result.exit_code == 0